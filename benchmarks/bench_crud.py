@@ -0,0 +1,159 @@
+import argparse
+import asyncio
+import time
+from datetime import datetime
+from typing import List
+
+from benchmarks.harness import LatencyRecorder, add_database_arguments, local_database, use_stub_llm
+
+# Micro-benchmarks for the CRUD hot path and pydantic (de)serialization on conversations
+# of increasing size, for either storage backend.
+#
+#   python -m benchmarks.bench_crud --sizes 100 1000 10000 --iterations 20 [--storage collection]
+
+
+def conversation_document(size: int) -> dict:
+    from benchmarks.bench_tree import branchy_tree
+
+    messages = branchy_tree(size)
+    for i, message in enumerate(messages):
+        message.sender = "user" if i % 2 == 0 else "ai"
+    now = datetime.utcnow()
+    return {
+        "title": f"bench {size}",
+        "created_at": now,
+        "updated_at": now,
+        "messages": [m.dict(by_alias=True) for m in messages],
+    }
+
+
+async def seed(db, crud, size: int):
+    from chatbot_backend.crud.message_collection import MessageCollectionCRUD
+    from chatbot_backend.db.migrate_messages import message_documents
+
+    document = conversation_document(size)
+    result = await db.conversations.insert_one(document)
+    if crud is MessageCollectionCRUD:
+        await db.messages.insert_many(message_documents(document))
+        await db.conversations.update_one({"_id": result.inserted_id}, {"$unset": {"messages": ""}})
+    return result.inserted_id, document
+
+
+def timed(recorder: LatencyRecorder, name: str, fn, *args):
+    start = time.perf_counter()
+    try:
+        result = fn(*args)
+    except Exception:
+        recorder.record(name, time.perf_counter() - start, ok=False)
+        return None
+    recorder.record(name, time.perf_counter() - start)
+    return result
+
+
+async def timed_async(recorder: LatencyRecorder, name: str, coro_fn, *args):
+    start = time.perf_counter()
+    try:
+        result = await coro_fn(*args)
+    except Exception:
+        recorder.record(name, time.perf_counter() - start, ok=False)
+        return None
+    recorder.record(name, time.perf_counter() - start)
+    return result
+
+
+async def bench_size(db, crud, size: int, iterations: int, recorder: LatencyRecorder):
+    from chatbot_backend.models import Conversation
+    from chatbot_backend.schema import ConversationOut, MessageCreate, MessageUpdate
+
+    conv_id, document = await seed(db, crud, size)
+    document["_id"] = conv_id
+    for _ in range(iterations):
+        conversation = timed(
+            recorder, f"pydantic Conversation(**doc) [{size}]", lambda: Conversation(**document)
+        )
+        timed(
+            recorder,
+            f"pydantic ConversationOut.json [{size}]",
+            lambda: ConversationOut.from_orm(conversation).json(by_alias=True),
+        )
+
+        snapshot = await timed_async(
+            recorder, f"crud get_conversation [{size}]", crud.get_conversation, db, conv_id
+        )
+        await timed_async(
+            recorder, f"crud get_active_thread [{size}]", crud.get_active_thread, db, conv_id
+        )
+        await timed_async(
+            recorder, f"crud get_messages_page [{size}]", crud.get_messages_page, db, conv_id, 50
+        )
+        await timed_async(
+            recorder, f"crud list_conversations [{size}]", crud.list_conversations, db, 20
+        )
+        if snapshot is None:
+            continue
+        parent = snapshot.messages[-1]
+        added = await timed_async(
+            recorder,
+            f"crud add_message [{size}]",
+            crud.add_message,
+            db,
+            conv_id,
+            MessageCreate(
+                content="bench reply",
+                sender="ai",
+                parent_id=str(parent.id),
+                parent_version=parent.current_version,
+            ),
+            snapshot,
+        )
+        if added is not None:
+            await timed_async(
+                recorder,
+                f"crud update_message [{size}]",
+                crud.update_message,
+                db,
+                conv_id,
+                added.id,
+                MessageUpdate(content="bench edit"),
+                snapshot,
+            )
+            await timed_async(
+                recorder,
+                f"crud change_message_version [{size}]",
+                crud.change_message_version,
+                db,
+                conv_id,
+                added.id,
+                "v1",
+            )
+
+
+async def run(
+    sizes: List[int], iterations: int, storage: str, backend: str, mongo_url: str
+) -> LatencyRecorder:
+    from chatbot_backend.crud.conversation import ConversationCRUD
+    from chatbot_backend.crud.message_collection import MessageCollectionCRUD
+
+    crud = MessageCollectionCRUD if storage == "collection" else ConversationCRUD
+    recorder = LatencyRecorder()
+    async with local_database(backend, mongo_url) as db:
+        await crud.ensure_indexes(db)
+        for size in sizes:
+            await bench_size(db, crud, size, iterations, recorder)
+    recorder.stop()
+    return recorder
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Micro-benchmark CRUD operations and model construction"
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--storage", choices=["embedded", "collection"], default="embedded")
+    add_database_arguments(parser)
+    args = parser.parse_args()
+    use_stub_llm()
+    asyncio.run(
+        run(args.sizes, args.iterations, args.storage, args.db, args.mongo_url)
+    ).print_report()
@@ -0,0 +1,66 @@
+import argparse
+import json
+import time
+from typing import Callable, List
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+
+from benchmarks.bench_crud import conversation_document
+from chatbot_backend.api.responses import conversation_out
+from chatbot_backend.encoding import dumps, orjson
+from chatbot_backend.models import Conversation
+from chatbot_backend.schema import ConversationOut
+
+# CPU time per GET /conversations/{id} spent turning the stored document into the response
+# body: the validated path (Conversation(**doc), then response_model re-validation into
+# ConversationOut and jsonable_encoder + json.dumps) vs. trusted construction and direct encoding.
+#
+#   python -m benchmarks.bench_serialization --sizes 100 1000 10000
+
+
+def validated(document: dict) -> bytes:
+    conversation = Conversation(**document)
+    return json.dumps(
+        jsonable_encoder(ConversationOut.from_orm(conversation), by_alias=True)
+    ).encode("utf-8")
+
+
+def trusted(document: dict) -> bytes:
+    return dumps(conversation_out(Conversation.from_db(document)))
+
+
+def cpu_ms(fn: Callable, document: dict, iterations: int) -> float:
+    samples: List[float] = []
+    for _ in range(iterations):
+        start = time.process_time()
+        fn(document)
+        samples.append(time.process_time() - start)
+    return sorted(samples)[len(samples) // 2] * 1000
+
+
+def main(sizes: List[int], iterations: int):
+    print(f"encoder: {'orjson' if orjson else 'json (orjson not installed)'}")
+    print(f"{'messages':>9} {'validated ms':>13} {'trusted ms':>11} {'saved ms':>9} {'speedup':>8}")
+    for size in sizes:
+        document = conversation_document(size)
+        document["_id"] = ObjectId()
+        assert json.loads(validated(document)) == json.loads(trusted(document))
+        old = cpu_ms(validated, document, iterations)
+        new = cpu_ms(trusted, document, iterations)
+        print(
+            f"{size:>9} {old:>13.2f} {new:>11.2f} {old - new:>9.2f}"
+            f" {old / new if new else float('inf'):>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark response (de)serialization of conversations"
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument(
+        "--iterations", type=int, default=10, help="median of this many runs per size"
+    )
+    args = parser.parse_args()
+    main(args.sizes, args.iterations)
@@ -0,0 +1,101 @@
+import argparse
+import random
+import time
+from datetime import datetime
+from typing import List, Set
+
+from bson import ObjectId
+
+from chatbot_backend.crud.tree import build_children_index, collect_descendants
+from chatbot_backend.models import Message
+
+# Subtree collection on synthetic message trees: the previous recursive full-rescan
+# implementation vs. the parent->children index used by ConversationCRUD.
+#
+#   python -m benchmarks.bench_tree --sizes 1000 10000 50000
+
+
+def make_message(parent: Message = None) -> Message:
+    return Message(
+        _id=ObjectId(),
+        parent_id=parent.id if parent else None,
+        parent_version=parent.current_version if parent else None,
+        sender="user",
+        current_version="v1",
+        versions=[
+            {"id": "v1", "content": "x", "created_at": datetime.utcnow(), "child_messages": {}}
+        ],
+    )
+
+
+def linear_thread(size: int) -> List[Message]:
+    messages = [make_message()]
+    for _ in range(size - 1):
+        messages.append(make_message(messages[-1]))
+    return messages
+
+
+def branchy_tree(size: int, seed: int = 0) -> List[Message]:
+    # Mostly a thread with frequent edits branching off recent messages
+    rng = random.Random(seed)
+    messages = [make_message()]
+    for _ in range(size - 1):
+        parent = (
+            messages[-1]
+            if rng.random() < 0.7
+            else messages[max(0, len(messages) - rng.randint(1, 20))]
+        )
+        messages.append(make_message(parent))
+    return messages
+
+
+def recursive_collect(messages: List[Message], parent_id: ObjectId) -> Set[ObjectId]:
+    descendants = set()
+    for message in messages:
+        if message.parent_id == parent_id:
+            descendants.add(message.id)
+            descendants.update(recursive_collect(messages, message.id))
+    return descendants
+
+
+def indexed_collect(messages: List[Message], parent_id: ObjectId) -> Set[ObjectId]:
+    return collect_descendants(build_children_index(messages), parent_id)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    try:
+        result = fn(*args)
+    except RecursionError:
+        return None, "RecursionError"
+    return result, f"{(time.perf_counter() - start) * 1000:9.2f} ms"
+
+
+def main(sizes: List[int], recursive_limit: int):
+    print(f"{'shape':<8} {'messages':>9} {'recursive':>16} {'indexed':>12}")
+    for size in sizes:
+        for shape, build in (("linear", linear_thread), ("branchy", branchy_tree)):
+            messages = build(size)
+            root = messages[0].id
+            if size <= recursive_limit:
+                old, old_time = timed(recursive_collect, messages, root)
+            else:
+                old, old_time = None, "skipped"
+            new, new_time = timed(indexed_collect, messages, root)
+            if old is not None:
+                assert old == new
+            assert len(new) == size - 1
+            print(f"{shape:<8} {size:>9} {old_time:>16} {new_time:>12}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark subtree collection on synthetic trees")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument(
+        "--recursive-limit",
+        type=int,
+        default=10000,
+        help="largest size to run the quadratic implementation on",
+    )
+    args = parser.parse_args()
+    main(args.sizes, args.recursive_limit)
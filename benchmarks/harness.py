@@ -0,0 +1,121 @@
+import math
+import os
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+# Shared helpers for the benchmarks: latency recording/percentiles and a local MongoDB stand-in.
+# Settings are read at import time, so call `use_stub_llm()` before importing chatbot_backend.
+
+
+def use_stub_llm(latency_ms: int = 0, chunk_latency_ms: int = 0):
+    os.environ["LLM_PROVIDER"] = "stub"
+    os.environ["STUB_LLM_LATENCY_MS"] = str(latency_ms)
+    os.environ["STUB_LLM_CHUNK_LATENCY_MS"] = str(chunk_latency_ms)
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    # Nearest-rank percentile
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+class LatencyRecorder:
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+
+    def record(self, name: str, seconds: float, ok: bool = True):
+        self.samples[name].append(seconds)
+        if not ok:
+            self.errors[name] += 1
+
+    def stop(self):
+        self.finished = time.perf_counter()
+
+    def summary(self) -> dict:
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        total = sum(len(s) for s in self.samples.values())
+        endpoints = {}
+        for name, samples in sorted(self.samples.items()):
+            endpoints[name] = {
+                "count": len(samples),
+                "errors": self.errors[name],
+                "p50_ms": percentile(samples, 50) * 1000,
+                "p95_ms": percentile(samples, 95) * 1000,
+                "p99_ms": percentile(samples, 99) * 1000,
+                "mean_ms": sum(samples) / len(samples) * 1000,
+            }
+        return {
+            "elapsed_s": elapsed,
+            "requests": total,
+            "throughput_rps": total / elapsed if elapsed else 0.0,
+            "endpoints": endpoints,
+        }
+
+    def print_report(self):
+        summary = self.summary()
+        print(
+            f"{'endpoint':<58} {'count':>6} {'errors':>6}"
+            f" {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+        )
+        for name, row in summary["endpoints"].items():
+            print(
+                f"{name:<58} {row['count']:>6} {row['errors']:>6} {row['p50_ms']:>9.2f}"
+                f" {row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f}"
+            )
+        print(
+            f"\n{summary['requests']} requests in {summary['elapsed_s']:.2f} s"
+            f" ({summary['throughput_rps']:.1f} req/s)"
+        )
+
+
+@asynccontextmanager
+async def local_database(
+    backend: str = "embedded", mongo_url: Optional[str] = None, name: str = "chatbot_bench"
+):
+    # A MongoDB server at --mongo-url, an embedded mongod (pymongo_inmemory, downloads a mongod
+    # binary on first use) or mongomock-motor. mongomock does not implement arrayFilters or
+    # positional updates, so replies, edits and version switches fail against it; it is only
+    # useful for read paths.
+    if backend == "mongomock" and not mongo_url:
+        from mongomock_motor import AsyncMongoMockClient
+
+        yield AsyncMongoMockClient()[name]
+        return
+
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    mongod = None
+    if not mongo_url:
+        from pymongo_inmemory import Mongod
+
+        mongod = Mongod()
+        mongod.start()
+        mongo_url = mongod.connection_string
+    client = AsyncIOMotorClient(mongo_url)
+    try:
+        await client.drop_database(name)
+        yield client[name]
+        await client.drop_database(name)
+    finally:
+        client.close()
+        if mongod:
+            mongod.stop()
+
+
+def add_database_arguments(parser):
+    parser.add_argument(
+        "--db",
+        choices=["embedded", "mongomock"],
+        default="embedded",
+        help="local MongoDB stand-in (ignored with --mongo-url)",
+    )
+    parser.add_argument(
+        "--mongo-url", help="run against this MongoDB server instead (the database is dropped)"
+    )
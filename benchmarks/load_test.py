@@ -0,0 +1,211 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import List, Optional
+
+from benchmarks.harness import LatencyRecorder, add_database_arguments, local_database, use_stub_llm
+
+# Drives the chat API in-process (httpx over ASGI) against a local MongoDB stand-in and the
+# stub LLM, and reports p50/p95/p99 latency per endpoint plus overall throughput.
+#
+# Traffic is one JSON session per line, e.g.
+#   {"context": "Customer Support", "language": "English", "turns": ["Hi", "My order is late"],
+#    "edit": 1, "stream": false, "delta": false, "delete": true}
+# `edit` is the index of a user turn to edit afterwards (then switched back to v1); `delete`
+# removes the last AI reply. Without --traffic, synthetic sessions are generated.
+#
+#   python -m benchmarks.load_test --traffic benchmarks/traffic.sample.jsonl \
+#       --repeat 20 --concurrency 16
+#   python -m benchmarks.load_test --sessions 200 --turns 8 --json results.json
+
+CONTEXTS = ["Onboarding", "Customer Support", "Technical Support"]
+PHRASES = [
+    "Hi, I need some help",
+    "My order has not arrived yet",
+    "How do I reset my password?",
+    "The app crashes when I open settings",
+    "Can I change my billing address?",
+    "Thanks, that worked",
+    "I was charged twice this month",
+    "What are your opening hours?",
+    "Please cancel my subscription",
+]
+
+
+def synthetic_sessions(count: int, turns: int, seed: int = 0) -> List[dict]:
+    rng = random.Random(seed)
+    return [
+        {
+            "context": rng.choice(CONTEXTS),
+            "language": "English",
+            "turns": [rng.choice(PHRASES) for _ in range(turns)],
+            "edit": rng.randrange(turns) if rng.random() < 0.3 else None,
+            "stream": rng.random() < 0.3,
+            "delete": rng.random() < 0.2,
+        }
+        for _ in range(count)
+    ]
+
+
+def load_traffic(path: str) -> List[dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class Session:
+    def __init__(self, client, recorder: LatencyRecorder):
+        self.client = client
+        self.recorder = recorder
+
+    async def call(self, method: str, name: str, url: str, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except Exception:
+            self.recorder.record(f"{method} {name}", time.perf_counter() - start, ok=False)
+            return None
+        self.recorder.record(
+            f"{method} {name}", time.perf_counter() - start, ok=response.status_code < 400
+        )
+        return response if response.status_code < 400 else None
+
+    async def run(self, spec: dict):
+        base = "/api/v1/conversations"
+        created = await self.call(
+            "POST", "/conversations/", f"{base}/", json={"title": "load test"}
+        )
+        if not created:
+            return
+        cid = created.json()["_id"]
+        user_ids = []
+        last_ai_id: Optional[str] = None
+        for content in spec["turns"]:
+            body = {
+                "message": {"sender": "user", "content": content},
+                "language": spec.get("language", "English"),
+                "context": spec["context"],
+            }
+            if spec.get("stream"):
+                response = await self.call(
+                    "POST",
+                    "/conversations/{id}/messages/stream",
+                    f"{base}/{cid}/messages/stream",
+                    json=body,
+                )
+                if not response:
+                    return
+                events = [block for block in response.text.split("\n\n") if block]
+                user_ids.append(json.loads(events[0].split("data: ", 1)[1])["_id"])
+                if events[-1].startswith("event: done"):
+                    last_ai_id = json.loads(events[-1].split("data: ", 1)[1])["_id"]
+            else:
+                params = {"delta": "true"} if spec.get("delta") else None
+                response = await self.call(
+                    "POST",
+                    "/conversations/{id}/messages",
+                    f"{base}/{cid}/messages",
+                    json=body,
+                    params=params,
+                )
+                if not response:
+                    return
+                # Both response shapes end with the new user message and its reply
+                messages = response.json()
+                user_ids.append(messages[-2]["_id"])
+                last_ai_id = messages[-1]["_id"]
+
+        if spec.get("edit") is not None and spec["edit"] < len(user_ids):
+            mid = user_ids[spec["edit"]]
+            body = {
+                "message": {"content": "Actually, let me rephrase that"},
+                "language": spec.get("language", "English"),
+                "context": spec["context"],
+            }
+            if await self.call(
+                "PUT",
+                "/conversations/{id}/messages/{mid}",
+                f"{base}/{cid}/messages/{mid}",
+                json=body,
+            ):
+                await self.call(
+                    "PUT",
+                    "/conversations/{id}/messages/{mid}/versions/{vid}",
+                    f"{base}/{cid}/messages/{mid}/versions/v1",
+                )
+
+        await self.call("GET", "/conversations/{id}", f"{base}/{cid}")
+        await self.call("GET", "/conversations/{id}/messages", f"{base}/{cid}/messages")
+        await self.call("GET", "/conversations/{id}/active", f"{base}/{cid}/active")
+        await self.call("GET", "/conversations/", f"{base}/")
+        if spec.get("delete") and last_ai_id:
+            await self.call(
+                "DELETE",
+                "/conversations/{id}/messages/{mid}",
+                f"{base}/{cid}/messages/{last_ai_id}",
+            )
+
+
+async def run(
+    sessions: List[dict], concurrency: int, backend: str, mongo_url: Optional[str]
+) -> LatencyRecorder:
+    import httpx
+
+    from chatbot_backend.api.deps import get_db
+    from chatbot_backend.crud import crud_conversation
+    from chatbot_backend.main import app
+
+    async with local_database(backend, mongo_url) as db:
+
+        async def bench_db():
+            yield db
+
+        app.dependency_overrides[get_db] = bench_db
+        await crud_conversation.ensure_indexes(db)
+        recorder = LatencyRecorder()
+        semaphore = asyncio.Semaphore(concurrency)
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://bench"
+        ) as client:
+
+            async def worker(spec):
+                async with semaphore:
+                    await Session(client, recorder).run(spec)
+
+            await asyncio.gather(*(worker(spec) for spec in sessions))
+        recorder.stop()
+        app.dependency_overrides.pop(get_db, None)
+    return recorder
+
+
+def main(args):
+    use_stub_llm(args.llm_latency_ms, args.llm_chunk_latency_ms)
+    sessions = (
+        load_traffic(args.traffic)
+        if args.traffic
+        else synthetic_sessions(args.sessions, args.turns, args.seed)
+    )
+    sessions = sessions * args.repeat
+    recorder = asyncio.run(run(sessions, args.concurrency, args.db, args.mongo_url))
+    recorder.print_report()
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(recorder.summary(), f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test the chat API with a stub LLM")
+    parser.add_argument("--traffic", help="JSONL file of sessions to replay")
+    parser.add_argument(
+        "--sessions", type=int, default=50, help="synthetic sessions when --traffic is not given"
+    )
+    parser.add_argument("--turns", type=int, default=6)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1, help="replay the traffic this many times")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--llm-latency-ms", type=int, default=0)
+    parser.add_argument("--llm-chunk-latency-ms", type=int, default=0)
+    parser.add_argument("--json", help="also write the summary to this file")
+    add_database_arguments(parser)
+    main(parser.parse_args())
@@ -0,0 +1,182 @@
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from fastapi import Depends, HTTPException, status
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from chatbot_backend.api.deps import api_key_header, get_db
+from chatbot_backend.api.keys import ApiKey, anonymous_key, key_store
+from chatbot_backend.config import settings
+from chatbot_backend.jobs import generation_queue
+from chatbot_backend.llm import get_llm
+from chatbot_backend.llm.limiter import TokenBucket
+from chatbot_backend.metrics import registry
+from chatbot_backend.shared import shared_state
+
+# Admission control for the chat API, so one client can't use up the LLM capacity of everyone
+# else. Every request on the router goes through admit():
+#
+#   1. the X-API-Key is looked up (api/keys.py); 401 for an unknown key, or for a missing one when
+#      AUTH_ENABLED is on (otherwise such callers share the "anonymous" limits)
+#   2. the key's token bucket (rate_per_second, burst), kept per worker
+#   3. the key's requests_per_minute, counted across all workers through shared.py
+#
+# Endpoints that generate synchronously also take a generation slot: at most max_concurrency
+# generations per key and worker, with up to max_queued more waiting API_KEY_QUEUE_SECONDS for
+# one. With LLM_MAX_QUEUED set, new generations are turned away while that many calls already
+# wait for the LLM limiter. Async generations take no slot; instead a key may have at most
+# max_concurrency + max_queued unfinished jobs in the generation queue, across all workers.
+# Every rejection is a 429 with a Retry-After header, so clients back off instead of piling up
+# behind a queue until they time out.
+
+current_api_key: ContextVar[Optional[ApiKey]] = ContextVar("api_key", default=None)
+
+
+def too_many_requests(detail: str, retry_after: float) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=detail,
+        headers={"Retry-After": str(max(math.ceil(retry_after), 1))},
+    )
+
+
+class KeySlots:
+    # Generation slots of one key in this worker
+    def __init__(self, max_concurrency: int):
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.waiting = 0
+
+
+class Admission:
+    def __init__(self):
+        # key id -> bucket / slots, rebuilt when the key's limits change
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._slots: Dict[str, KeySlots] = {}
+        self.stats: Dict[str, int] = {
+            "admitted": 0,
+            "unauthorized": 0,
+            "rate_limited": 0,
+            "quota_exceeded": 0,
+            "queue_full": 0,
+            "queue_timeout": 0,
+            "overloaded": 0,
+            "jobs_exceeded": 0,
+        }
+
+    def _bucket(self, key: ApiKey) -> TokenBucket:
+        bucket = self._buckets.get(key.id)
+        if (
+            bucket is None
+            or bucket.rate != key.rate_per_second
+            or bucket.capacity != max(key.burst, 1)
+        ):
+            bucket = self._buckets[key.id] = TokenBucket(key.rate_per_second, max(key.burst, 1))
+        return bucket
+
+    def _key_slots(self, key: ApiKey) -> KeySlots:
+        slots = self._slots.get(key.id)
+        if slots is None or slots.max_concurrency != key.max_concurrency:
+            slots = self._slots[key.id] = KeySlots(key.max_concurrency)
+        return slots
+
+    async def authenticate(self, db: AsyncIOMotorDatabase, api_key: Optional[str]) -> ApiKey:
+        key = await key_store.lookup(db, api_key) if api_key else None
+        if key is None and (api_key or settings.AUTH_ENABLED):
+            self.stats["unauthorized"] += 1
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid API Key")
+        return key or anonymous_key()
+
+    async def admit(self, db: AsyncIOMotorDatabase, key: ApiKey):
+        if key.rate_per_second > 0:
+            wait = self._bucket(key).try_acquire()
+            if wait:
+                self.stats["rate_limited"] += 1
+                raise too_many_requests("Rate limit exceeded", wait)
+        if key.requests_per_minute > 0:
+            if await shared_state.incr(db, f"rpm|{key.id}", 60) > key.requests_per_minute:
+                self.stats["quota_exceeded"] += 1
+                raise too_many_requests("Request quota exceeded", 60 - time.time() % 60)
+        self.stats["admitted"] += 1
+
+    @asynccontextmanager
+    async def slot(self, key: ApiKey):
+        limiter = get_llm().limiter
+        if 0 < settings.LLM_MAX_QUEUED <= limiter.waiting:
+            self.stats["overloaded"] += 1
+            raise too_many_requests("Generation capacity exhausted", settings.API_KEY_QUEUE_SECONDS)
+        if key.max_concurrency <= 0:
+            yield
+            return
+        slots = self._key_slots(key)
+        if slots.semaphore.locked():
+            if slots.waiting >= key.max_queued:
+                self.stats["queue_full"] += 1
+                raise too_many_requests(
+                    "Too many concurrent generations for this API key",
+                    settings.API_KEY_QUEUE_SECONDS,
+                )
+            slots.waiting += 1
+            try:
+                await asyncio.wait_for(slots.semaphore.acquire(), settings.API_KEY_QUEUE_SECONDS)
+            except asyncio.TimeoutError:
+                self.stats["queue_timeout"] += 1
+                raise too_many_requests(
+                    "Too many concurrent generations for this API key",
+                    settings.API_KEY_QUEUE_SECONDS,
+                )
+            finally:
+                slots.waiting -= 1
+        else:
+            await slots.semaphore.acquire()
+        slots.in_flight += 1
+        try:
+            yield
+        finally:
+            slots.in_flight -= 1
+            slots.semaphore.release()
+
+    async def check_jobs(self, db: AsyncIOMotorDatabase, key: ApiKey):
+        # Counted before the job is written, so simultaneous requests can overshoot by a few
+        if key.max_concurrency <= 0:
+            return
+        if (
+            await generation_queue.unfinished_for_key(db, key.id)
+            >= key.max_concurrency + key.max_queued
+        ):
+            self.stats["jobs_exceeded"] += 1
+            raise too_many_requests(
+                "Too many pending generations for this API key", settings.API_KEY_QUEUE_SECONDS
+            )
+
+    def snapshot(self) -> Dict[str, int]:
+        return {
+            **self.stats,
+            "in_flight": sum(s.in_flight for s in self._slots.values()),
+            "waiting": sum(s.waiting for s in self._slots.values()),
+        }
+
+
+admission = Admission()
+registry.register_gauges("chatbot_admission", admission.snapshot)
+
+
+async def admit(
+    api_key: Optional[str] = Depends(api_key_header), db: AsyncIOMotorDatabase = Depends(get_db)
+) -> ApiKey:
+    # Router-wide dependency; the key is also kept for usage accounting further down the request
+    key = await admission.authenticate(db, api_key)
+    await admission.admit(db, key)
+    current_api_key.set(key)
+    return key
+
+
+async def generation_slot(key: ApiKey = Depends(admit)):
+    # Held until the response has been sent, streamed replies included
+    async with admission.slot(key):
+        yield
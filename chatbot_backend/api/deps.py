@@ -1,26 +1,14 @@
-from fastapi import Depends, HTTPException, status
 from fastapi.security import APIKeyHeader
 from chatbot_backend.config import settings
+from chatbot_backend.db.mongodb import get_client
 from motor.motor_asyncio import AsyncIOMotorClient
 
 api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
 
 def get_database_client() -> AsyncIOMotorClient:
-    client = AsyncIOMotorClient(settings.MONGODB_URL)
-    return client
+    return get_client()
 
-# Add this function to get the database
+# Hands out a handle on the shared, pooled client; the client is closed on app shutdown.
+# Authentication lives in api/admission.py, which also applies the key's limits
 async def get_db():
-    client = get_database_client()
-    try:
-        yield client[settings.DATABASE_NAME]
-    finally:
-        client.close()
-
-async def get_api_key(api_key: str = Depends(api_key_header)):
-    if api_key != settings.API_KEY:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid API Key"
-        )
-    return api_key
\ No newline at end of file
+    yield get_database_client()[settings.DATABASE_NAME]
@@ -1 +1,2 @@
-from .chat import router as chat_router
\ No newline at end of file
+from .chat import router as chat_router
+from .health import router as health_router
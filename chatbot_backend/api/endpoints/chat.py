@@ -1,21 +1,70 @@
-from fastapi import APIRouter, Depends, HTTPException, Path
+import asyncio
+import json
+import time
+from fastapi import APIRouter, Depends, Header, HTTPException, Path, Query
+from fastapi.responses import StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from bson import ObjectId
-from typing import List
+from datetime import datetime, timezone
+from typing import AsyncIterator, List, Optional, Tuple
 
+from chatbot_backend.api.admission import admission, admit, current_api_key, generation_slot
 from chatbot_backend.api.deps import get_db
-from chatbot_backend.schema import ConversationCreate, MessageCreate, MessageUpdate, ConversationOut, MessageOut
-from chatbot_backend.models import Message
-from chatbot_backend.crud import crud_conversation
-import google.generativeai as genai
+from chatbot_backend.api.timing import TimedRoute
+from chatbot_backend.api.idempotency import IDEMPOTENCY_HEADER, idempotent
+from chatbot_backend.api.responses import (
+    FastJSONResponse,
+    conversation_response,
+    conversation_summary_out,
+    dumps,
+    job_out,
+    message_out,
+    messages_response,
+    page_response,
+)
+from chatbot_backend.api.pagination import (
+    encode_conversation_cursor,
+    decode_conversation_cursor,
+    decode_message_cursor,
+)
+from chatbot_backend.schema import (
+    ConversationCreate,
+    MessageCreate,
+    MessageUpdate,
+    ConversationOut,
+    MessageOut,
+    ConversationPage,
+    MessagePage,
+    GenerationJobOut,
+    GenerationJobAccepted,
+    SearchResults,
+    MessageVersionOut,
+    BatchItem,
+    BatchRequest,
+    BatchResponse,
+)
+from chatbot_backend.models import Conversation, Message
+from chatbot_backend.crud import ConflictError, crud_conversation
+from chatbot_backend.crud.tree import ancestor_path, resolve_active_path
+from chatbot_backend.llm import LLMError, LLMTimeoutError, get_llm, get_response_cache
+from chatbot_backend.llm.cache import cache_key
 from chatbot_backend.config import settings
-from chatbot_backend.api.endpoints.constants import prompt_mappings
+from chatbot_backend.metrics import observe_stage, span
+from chatbot_backend.context import ContextWindow, build_context, count_tokens
+from chatbot_backend.db.transfer import export_stream
+from chatbot_backend.jobs import QueueUnavailableError, generation_queue
+from chatbot_backend.search import message_indexer
+from chatbot_backend.search.service import semantic_search, text_search
+from chatbot_backend.api.endpoints.constants import (
+    cacheable_contexts,
+    context_token_budgets,
+    generation_priorities,
+)
+from chatbot_backend.api.endpoints.prompts import UnknownContextError, prompt_registry
 from chatbot_backend.schema.conversation import CreateResponse, UpdateResponse
+from chatbot_backend.usage import usage_recorder
 
-genai.configure(api_key=settings.GEMINI_API_KEY)
-model = genai.GenerativeModel('gemini-1.5-flash')
-
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute, dependencies=[Depends(admit)])
 
 # Helper function to validate ObjectId
 def validate_object_id(id: str) -> ObjectId:
@@ -24,127 +73,707 @@ def validate_object_id(id: str) -> ObjectId:
     except:
         raise HTTPException(status_code=400, detail="Invalid ID format")
 
-# Endpoints
+
+def validate_context(context: str):
+    # Checked before anything is written, so an unknown context never leaves a half-saved turn
+    if context not in prompt_registry:
+        raise HTTPException(status_code=422, detail=f"Unknown context: {context}")
+
+
+def build_prompt(conversation_history: List[str], user_message: str) -> str:
+    history = "\n".join(conversation_history)
+    return f"Conversation history:\n{history}\nUser: {user_message}\nAI:"
+
+
 async def generate_ai_response(conversation_history: List[str], user_message: str) -> str:
-    prompt = f"Conversation history:\n{' '.join(conversation_history)}\nUser: {user_message}\nAI:"
-    response = model.generate_content(prompt)
-    return response.text
+    try:
+        with span("llm.total"):
+            return await get_llm().generate(build_prompt(conversation_history, user_message))
+    except LLMTimeoutError:
+        raise HTTPException(status_code=504, detail="AI provider timed out")
+    except LLMError:
+        raise HTTPException(status_code=502, detail="AI generation failed")
 
-@router.post("/conversations/", response_model=ConversationOut)
-async def create_conversation(conversation: ConversationCreate, db: AsyncIOMotorDatabase = Depends(get_db)):
-    created_conversation = await crud_conversation.create_conversation(db, conversation)
-    if created_conversation:
-        return created_conversation
-    raise HTTPException(status_code=500, detail="Failed to create conversation")
 
-@router.post("/conversations/{conversation_id}/messages", response_model=List[MessageOut])
-async def send_chat_message(
-    conversation_id: str = Path(..., description="The ID of the conversation"),
-    data: CreateResponse = ...,
-    db: AsyncIOMotorDatabase = Depends(get_db)
+def stream_ai_response(conversation_history: List[str], user_message: str) -> AsyncIterator[str]:
+    return get_llm().stream(build_prompt(conversation_history, user_message))
+
+
+def reply_cache_key(data, window: ContextWindow) -> Optional[str]:
+    # None when the response cache is off globally or for this context
+    if get_response_cache() is None or not cacheable_contexts.get(data.context):
+        return None
+    return cache_key(data.context, data.language, window.history, data.message.content)
+
+
+async def generate_reply(data, window: ContextWindow) -> str:
+    prompt = system_prompt_for(data) + " " + data.message.content
+    key = reply_cache_key(data, window)
+    if key:
+        cached = await get_response_cache().get(key)
+        if cached is not None:
+            return cached
+    reply = await generate_ai_response(window.history, prompt)
+    if key:
+        await get_response_cache().set(key, reply)
+    return reply
+
+
+def system_prompt_for(data) -> str:
+    try:
+        return prompt_registry.system_prompt(data.context, data.language)
+    except UnknownContextError as exc:
+        # The context was removed by a template reload since the request was validated
+        raise HTTPException(status_code=422, detail=str(exc))
+
+
+def context_window_for(
+    conversation: Conversation, active_path: List[Message], data
+) -> ContextWindow:
+    budget = context_token_budgets.get(data.context, settings.CONTEXT_TOKEN_BUDGET)
+    with span("prompt.build"):
+        return build_context(
+            active_path,
+            budget,
+            system_prompt_for(data),
+            data.message.content,
+            conversation.context_summary,
+        )
+
+
+def record_key_usage(api_key: Optional[dict], prompt_tokens: int, completion_tokens: int):
+    # Per-key totals, written to Mongo in batches (usage.py)
+    if api_key:
+        usage_recorder.record(api_key["id"], api_key["name"], prompt_tokens, completion_tokens)
+
+
+def request_api_key() -> Optional[dict]:
+    key = current_api_key.get()
+    return {"id": key.id, "name": key.name} if key else None
+
+
+async def record_usage(
+    db: AsyncIOMotorDatabase, conversation: Conversation, window: ContextWindow, reply: str, data
 ):
-    conv_id = validate_object_id(conversation_id)
-    
-    # Fetch the conversation to get history
+    completion_tokens = count_tokens(reply)
+    record_key_usage(request_api_key(), window.prompt_tokens, completion_tokens)
+    await crud_conversation.record_context_usage(
+        db,
+        conversation.id,
+        window.prompt_tokens,
+        completion_tokens,
+        window.summary,
+        conversation,
+        data.context,
+    )
+
+
+def sse_event(event: str, data: str) -> str:
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+def message_json(message: Message) -> str:
+    return dumps(message_out(message)).decode()
+
+
+async def gather_stages(*stages):
+    # Runs independent stages of a turn concurrently; the first failure cancels the rest
+    tasks = [asyncio.ensure_future(stage) for stage in stages]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+
+async def load_conversation(db: AsyncIOMotorDatabase, conv_id: ObjectId) -> Conversation:
+    # Fetched once per turn; every later step works from this snapshot, which the CRUD layer
+    # keeps in sync
     conversation = await crud_conversation.get_conversation(db, conv_id)
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
-    
-    # Prepare conversation history
-    history = [msg.versions[-1].content for msg in conversation.messages[-5:]]  # Last 5 messages
-    
-    # Find the last AI message to set as parent for the new user message
-    last_ai_message = next((msg for msg in reversed(conversation.messages) if msg.sender == "ai"), None)
-    
+    return conversation
+
+
+def prepare_user_turn(conversation: Conversation, data: CreateResponse) -> ContextWindow:
+    # Prepare conversation history from the active branch only, within the context's token budget
+    active_path = resolve_active_path(conversation.messages)
+    window = context_window_for(conversation, active_path, data)
+
+    # Find the last AI message on the active branch to set as parent for the new user message
+    last_ai_message = next((msg for msg in reversed(active_path) if msg.sender == "ai"), None)
+
     if last_ai_message:
         data.message.parent_id = last_ai_message.id
         data.message.parent_version = last_ai_message.current_version
-    
-    # Save user message
-    user_message = await crud_conversation.add_message(db, conv_id, data.message)
+    return window
+
+
+async def add_user_message(
+    db: AsyncIOMotorDatabase, conversation: Conversation, data: CreateResponse
+) -> Message:
+    user_message = await crud_conversation.add_message(
+        db, conversation.id, data.message, conversation
+    )
     if not user_message:
         raise HTTPException(status_code=500, detail="Failed to save user message")
-    
-    system_prompt = prompt_mappings[data.context] + " " + "Generate the response in " + data.language + " language."
-    
-    # Generate AI response
-    ai_response_content = await generate_ai_response(history, system_prompt + " " + data.message.content)
-    
-    # Save AI response
-    ai_message = await crud_conversation.add_message(
-        db, 
-        conv_id, 
-        MessageCreate(content=ai_response_content, sender="ai", parent_id=str(user_message.id), parent_version=user_message.current_version)
+    return user_message
+
+
+async def save_user_message(
+    db: AsyncIOMotorDatabase, conv_id: ObjectId, data: CreateResponse
+) -> Tuple[Conversation, ContextWindow, Message]:
+    conversation = await load_conversation(db, conv_id)
+    window = prepare_user_turn(conversation, data)
+    return conversation, window, await add_user_message(db, conversation, data)
+
+
+def prepare_edit_turn(
+    conversation: Conversation, msg_id: ObjectId, data: UpdateResponse
+) -> ContextWindow:
+    # The edited message becomes the user turn, so the history is the chain of its ancestors
+    return context_window_for(conversation, ancestor_path(conversation.messages, msg_id), data)
+
+
+async def apply_edit(
+    db: AsyncIOMotorDatabase, conversation: Conversation, msg_id: ObjectId, data: UpdateResponse
+) -> Message:
+    # A reply still being generated for the old content is no longer wanted
+    _, updated_message = await gather_stages(
+        generation_queue.cancel_for_messages(db, conversation.id, [msg_id]),
+        crud_conversation.update_message(db, conversation.id, msg_id, data.message, conversation),
+    )
+    if not updated_message:
+        raise HTTPException(status_code=404, detail="Message not found or couldn't be updated")
+    return updated_message
+
+
+async def update_message_or_409(
+    db: AsyncIOMotorDatabase, conversation: Conversation, msg_id: ObjectId, data: UpdateResponse
+) -> Message:
+    try:
+        return await apply_edit(db, conversation, msg_id, data)
+    except ConflictError as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+
+
+async def save_edited_message(
+    db: AsyncIOMotorDatabase, conv_id: ObjectId, msg_id: ObjectId, data: UpdateResponse
+) -> Tuple[Conversation, ContextWindow, Message]:
+    conversation = await load_conversation(db, conv_id)
+    window = prepare_edit_turn(conversation, msg_id, data)
+    return conversation, window, await update_message_or_409(db, conversation, msg_id, data)
+
+
+async def save_reply(
+    db: AsyncIOMotorDatabase,
+    conversation: Conversation,
+    parent: Message,
+    reply: str,
+    window: ContextWindow,
+    data,
+) -> Message:
+    # The AI message and the turn's token accounting are independent writes
+    ai_message, _ = await gather_stages(
+        crud_conversation.add_message(
+            db,
+            conversation.id,
+            MessageCreate(
+                content=reply,
+                sender="ai",
+                parent_id=str(parent.id),
+                parent_version=parent.current_version,
+            ),
+            conversation,
+        ),
+        record_usage(db, conversation, window, reply, data),
     )
     if not ai_message:
         raise HTTPException(status_code=500, detail="Failed to save AI response")
-    
-    # Fetch the updated conversation
-    updated_conversation = await crud_conversation.get_conversation(db, conv_id)
-    if not updated_conversation:
-        raise HTTPException(status_code=404, detail="Failed to retrieve updated conversation")
-    
-    return updated_conversation.messages
+    return ai_message
+
+
+async def chat_turn(
+    db: AsyncIOMotorDatabase, conversation: Conversation, data: CreateResponse
+) -> Tuple[Message, Message]:
+    # The reply depends only on the context window, so it is generated while the user message
+    # is written
+    window = prepare_user_turn(conversation, data)
+    user_message, reply = await gather_stages(
+        add_user_message(db, conversation, data), generate_reply(data, window)
+    )
+    return user_message, await save_reply(db, conversation, user_message, reply, window, data)
+
+
+async def edit_turn(
+    db: AsyncIOMotorDatabase, conversation: Conversation, msg_id: ObjectId, data: UpdateResponse
+) -> Tuple[Message, Message]:
+    window = prepare_edit_turn(conversation, msg_id, data)
+    updated_message, reply = await gather_stages(
+        update_message_or_409(db, conversation, msg_id, data), generate_reply(data, window)
+    )
+    return updated_message, await save_reply(db, conversation, updated_message, reply, window, data)
+
+
+async def stream_and_save_reply(
+    db: AsyncIOMotorDatabase,
+    conversation: Conversation,
+    parent: Message,
+    window: ContextWindow,
+    data,
+) -> AsyncIterator[str]:
+    # Server-Sent Events: the saved parent message, one "delta" per model chunk, then the
+    # persisted AI message
+    yield sse_event("message", message_json(parent))
+    key = reply_cache_key(data, window)
+    cached = await get_response_cache().get(key) if key else None
+    chunks = []
+    if cached is not None:
+        # A cache hit is sent as a single delta
+        chunks.append(cached)
+        yield sse_event("delta", json.dumps({"content": cached}))
+    else:
+        # Spans can't wrap a generator across yields, so the stream is timed by hand
+        started = time.perf_counter()
+        try:
+            async for chunk in stream_ai_response(
+                window.history, system_prompt_for(data) + " " + data.message.content
+            ):
+                if not chunks:
+                    observe_stage("llm.first_token", time.perf_counter() - started)
+                chunks.append(chunk)
+                yield sse_event("delta", json.dumps({"content": chunk}))
+        except Exception as exc:
+            # Provider errors stay in the server log; clients get the same details as the
+            # 502/504 path
+            print(f"AI streaming failed: {exc!r}")
+            detail = (
+                "AI provider timed out"
+                if isinstance(exc, LLMTimeoutError)
+                else "AI generation failed"
+            )
+            yield sse_event("error", json.dumps({"detail": detail}))
+            return
+        observe_stage("llm.total", time.perf_counter() - started)
+        if key:
+            await get_response_cache().set(key, "".join(chunks))
+
+    try:
+        ai_message = await save_reply(db, conversation, parent, "".join(chunks), window, data)
+    except HTTPException as exc:
+        yield sse_event("error", json.dumps({"detail": exc.detail}))
+        return
+    yield sse_event("done", message_json(ai_message))
+
+
+async def check_queue_capacity(db: AsyncIOMotorDatabase):
+    try:
+        await generation_queue.check_capacity(db)
+    except QueueUnavailableError as exc:
+        raise HTTPException(status_code=503, detail=str(exc), headers={"Retry-After": "5"})
+    # The per-key generation limit, which the async endpoints can't hold a slot for
+    key = current_api_key.get()
+    if key is not None:
+        await admission.check_jobs(db, key)
+
+
+async def enqueue_reply(
+    db: AsyncIOMotorDatabase,
+    conversation: Conversation,
+    parent: Message,
+    window: ContextWindow,
+    data,
+) -> FastJSONResponse:
+    # Everything the worker needs is stored on the job, so it never rebuilds the context window
+    job = await generation_queue.enqueue(
+        db,
+        {
+            "conversation_id": conversation.id,
+            "parent_id": parent.id,
+            "priority": generation_priorities.get(data.context, 0),
+            "request": {
+                "context": data.context,
+                "language": data.language,
+                "content": data.message.content,
+            },
+            "window": window.dict(),
+            "api_key": request_api_key(),
+        },
+    )
+    return FastJSONResponse({"job": job_out(job), "message": message_out(parent)}, status_code=202)
+
+
+async def run_generation_job(db: AsyncIOMotorDatabase, job: dict) -> Optional[dict]:
+    # Worker side of the /async endpoints; returns None when the job was cancelled before saving
+    request = job["request"]
+    data = UpdateResponse(
+        message=MessageUpdate(content=request["content"]),
+        language=request["language"],
+        context=request["context"],
+    )
+    window = ContextWindow(**job["window"])
+    reply = await generate_reply(data, window)
+    if not await generation_queue.begin_save(db, job):
+        return None
+    completion_tokens = count_tokens(reply)
+    record_key_usage(job.get("api_key"), window.prompt_tokens, completion_tokens)
+    ai_message, _ = await gather_stages(
+        crud_conversation.add_message(
+            db,
+            job["conversation_id"],
+            MessageCreate(content=reply, sender="ai", parent_id=str(job["parent_id"])),
+        ),
+        crud_conversation.record_context_usage(
+            db,
+            job["conversation_id"],
+            window.prompt_tokens,
+            completion_tokens,
+            window.summary,
+            context=data.context,
+        ),
+    )
+    if not ai_message:
+        raise RuntimeError("Failed to save AI response")
+    return {"message": message_out(ai_message)}
+
+
+DELTA_DESCRIPTION = "Return only the messages created or changed by this request"
+IDEMPOTENCY_DESCRIPTION = (
+    "Retries with the same key replay the first response instead of generating again"
+)
+
+
+# Endpoints
+@router.get("/conversations/", response_model=ConversationPage)
+async def list_conversations(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: str = Query(None, description="next_cursor from the previous page"),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    conversations = await crud_conversation.list_conversations(
+        db, limit + 1, decode_conversation_cursor(cursor)
+    )
+    next_cursor = None
+    if len(conversations) > limit:
+        conversations = conversations[:limit]
+        next_cursor = encode_conversation_cursor(conversations[-1].updated_at, conversations[-1].id)
+    return page_response(conversations, next_cursor, conversation_summary_out)
+
+
+@router.get("/conversations/export")
+async def export_conversations(
+    compress: bool = Query(False, alias="gzip", description="gzip the stream"),
+    batch_size: int = Query(100, ge=1, le=1000, description="Database cursor batch size"),
+    after: str = Query(
+        None, description="Only conversations with a larger ID, to resume an export"
+    ),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    # NDJSON, one conversation per line in ID order, streamed with constant memory
+    after_id = validate_object_id(after) if after else None
+    filename = "conversations.ndjson.gz" if compress else "conversations.ndjson"
+    return StreamingResponse(
+        export_stream(db, batch_size, after_id, compress),
+        media_type="application/gzip" if compress else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.post("/conversations/", response_model=ConversationOut)
+async def create_conversation(
+    conversation: ConversationCreate, db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    created_conversation = await crud_conversation.create_conversation(db, conversation)
+    if created_conversation:
+        return conversation_response(created_conversation)
+    raise HTTPException(status_code=500, detail="Failed to create conversation")
+
+
+@router.post("/conversations/{conversation_id}/messages", response_model=List[MessageOut])
+async def send_chat_message(
+    conversation_id: str = Path(..., description="The ID of the conversation"),
+    data: CreateResponse = ...,
+    delta: bool = Query(False, description=DELTA_DESCRIPTION),
+    idempotency_key: Optional[str] = Header(
+        None, alias=IDEMPOTENCY_HEADER, description=IDEMPOTENCY_DESCRIPTION
+    ),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    _slot: None = Depends(generation_slot),
+):
+    with span("validation"):
+        conv_id = validate_object_id(conversation_id)
+        validate_context(data.context)
+
+    async def respond():
+        conversation = await load_conversation(db, conv_id)
+        user_message, ai_message = await chat_turn(db, conversation, data)
+
+        if delta:
+            return messages_response([user_message, ai_message])
+        # The snapshot already reflects both new messages
+        return messages_response(conversation.messages)
+
+    return await idempotent(
+        db, idempotency_key, f"POST {conv_id}/messages?delta={delta}", data, respond
+    )
+
+
+@router.post("/conversations/{conversation_id}/messages/stream")
+async def send_chat_message_stream(
+    conversation_id: str = Path(..., description="The ID of the conversation"),
+    data: CreateResponse = ...,
+    idempotency_key: Optional[str] = Header(
+        None, alias=IDEMPOTENCY_HEADER, description=IDEMPOTENCY_DESCRIPTION
+    ),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    _slot: None = Depends(generation_slot),
+):
+    with span("validation"):
+        conv_id = validate_object_id(conversation_id)
+        validate_context(data.context)
+
+    async def respond():
+        conversation, window, user_message = await save_user_message(db, conv_id, data)
+        return StreamingResponse(
+            stream_and_save_reply(db, conversation, user_message, window, data),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    return await idempotent(db, idempotency_key, f"POST {conv_id}/messages/stream", data, respond)
+
+
+@router.post(
+    "/conversations/{conversation_id}/messages/async",
+    response_model=GenerationJobAccepted,
+    status_code=202,
+)
+async def send_chat_message_async(
+    conversation_id: str = Path(..., description="The ID of the conversation"),
+    data: CreateResponse = ...,
+    idempotency_key: Optional[str] = Header(
+        None, alias=IDEMPOTENCY_HEADER, description=IDEMPOTENCY_DESCRIPTION
+    ),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    with span("validation"):
+        conv_id = validate_object_id(conversation_id)
+        validate_context(data.context)
+
+    async def respond():
+        # The user message is saved now; the reply is generated by a queue worker (poll /jobs/{id})
+        await check_queue_capacity(db)
+        conversation, window, user_message = await save_user_message(db, conv_id, data)
+        return await enqueue_reply(db, conversation, user_message, window, data)
+
+    return await idempotent(db, idempotency_key, f"POST {conv_id}/messages/async", data, respond)
+
+
+async def run_batch_item(
+    db: AsyncIOMotorDatabase, item: BatchItem, conv_id: Optional[ObjectId]
+) -> dict:
+    # The turns of one item build on each other, so they run in order against one snapshot
+    messages = []
+    try:
+        if conv_id is None:
+            conversation = await crud_conversation.create_conversation(
+                db, ConversationCreate(title=item.title)
+            )
+            if not conversation:
+                raise HTTPException(status_code=500, detail="Failed to create conversation")
+        else:
+            conversation = await load_conversation(db, conv_id)
+        conv_id = conversation.id
+        for turn in item.messages:
+            data = CreateResponse(
+                message=MessageCreate(sender="user", content=turn.content),
+                language=item.language,
+                context=item.context,
+            )
+            messages.extend(await chat_turn(db, conversation, data))
+    except HTTPException as exc:
+        # Turns saved before the failure are kept and reported
+        return {
+            "conversation_id": conv_id,
+            "status": exc.status_code,
+            "messages": [message_out(m) for m in messages],
+            "error": exc.detail,
+        }
+    return {
+        "conversation_id": conv_id,
+        "status": 200,
+        "messages": [message_out(m) for m in messages],
+        "error": None,
+    }
+
+
+@router.post("/batch/messages", response_model=BatchResponse)
+async def send_batch_messages(
+    data: BatchRequest,
+    idempotency_key: Optional[str] = Header(
+        None, alias=IDEMPOTENCY_HEADER, description=IDEMPOTENCY_DESCRIPTION
+    ),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    # Several conversations advanced in one request; items run concurrently and fail independently
+    with span("validation"):
+        if len(data.items) > settings.BATCH_MAX_ITEMS:
+            raise HTTPException(
+                status_code=422, detail=f"At most {settings.BATCH_MAX_ITEMS} items per batch"
+            )
+        for item in data.items:
+            validate_context(item.context)
+        targets = [
+            validate_object_id(item.conversation_id) if item.conversation_id else None
+            for item in data.items
+        ]
+        existing = [conv_id for conv_id in targets if conv_id]
+        if len(set(existing)) != len(existing):
+            raise HTTPException(
+                status_code=422, detail="A conversation may appear in only one item"
+            )
+
+    semaphore = asyncio.Semaphore(min(data.concurrency, settings.BATCH_MAX_CONCURRENCY))
+
+    key = current_api_key.get()
+
+    async def run(item: BatchItem, conv_id: Optional[ObjectId]) -> dict:
+        # Each item takes one of the key's generation slots, so a batch can't starve the key's
+        # other requests
+        async with semaphore:
+            try:
+                async with admission.slot(key):
+                    return await run_batch_item(db, item, conv_id)
+            except HTTPException as exc:
+                return {
+                    "conversation_id": conv_id,
+                    "status": exc.status_code,
+                    "messages": [],
+                    "error": exc.detail,
+                }
+
+    async def respond():
+        results = await asyncio.gather(
+            *(run(item, conv_id) for item, conv_id in zip(data.items, targets))
+        )
+        return FastJSONResponse({"items": results})
+
+    return await idempotent(db, idempotency_key, "POST batch/messages", data, respond)
+
 
 @router.put("/conversations/{conversation_id}/messages/{message_id}", response_model=List[MessageOut])
 async def edit_message(
     conversation_id: str = Path(..., description="The ID of the conversation"),
     message_id: str = Path(..., description="The ID of the message to edit"),
     data: UpdateResponse = ...,
-    db: AsyncIOMotorDatabase = Depends(get_db)
+    delta: bool = Query(False, description=DELTA_DESCRIPTION),
+    idempotency_key: Optional[str] = Header(
+        None, alias=IDEMPOTENCY_HEADER, description=IDEMPOTENCY_DESCRIPTION
+    ),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    _slot: None = Depends(generation_slot),
 ):
-    conv_id = validate_object_id(conversation_id)
-    msg_id = validate_object_id(message_id)
-    
-    # Update the message
-    updated_message = await crud_conversation.update_message(db, conv_id, msg_id, data.message)
-    if not updated_message:
-        raise HTTPException(status_code=404, detail="Message not found or couldn't be updated")
-    
-    # Fetch the conversation to get updated history
-    conversation = await crud_conversation.get_conversation(db, conv_id)
-    if not conversation:
-        raise HTTPException(status_code=404, detail="Conversation not found")
-    
-    # Prepare conversation history
-    history = [msg.versions[-1].content for msg in conversation.messages[-5:]]  # Last 5 messages
-    
-    # Generate new AI response based on the edited message
-    system_prompt = prompt_mappings[data.context] + " " + "Generate the response in " + data.language + " language."
-    ai_response_content = await generate_ai_response(history, system_prompt + " " + data.message.content)
-    
-    # Save new AI response
-    ai_message = await crud_conversation.add_message(
-        db, 
-        conv_id, 
-        MessageCreate(content=ai_response_content, sender="ai", parent_id=str(updated_message.id), parent_version=updated_message.current_version)
+    with span("validation"):
+        conv_id = validate_object_id(conversation_id)
+        msg_id = validate_object_id(message_id)
+        validate_context(data.context)
+
+    async def respond():
+        conversation = await load_conversation(db, conv_id)
+        updated_message, ai_message = await edit_turn(db, conversation, msg_id, data)
+
+        if delta:
+            return messages_response([updated_message, ai_message])
+        return messages_response(conversation.messages)
+
+    return await idempotent(
+        db, idempotency_key, f"PUT {conv_id}/messages/{msg_id}?delta={delta}", data, respond
+    )
+
+
+@router.put("/conversations/{conversation_id}/messages/{message_id}/stream")
+async def edit_message_stream(
+    conversation_id: str = Path(..., description="The ID of the conversation"),
+    message_id: str = Path(..., description="The ID of the message to edit"),
+    data: UpdateResponse = ...,
+    idempotency_key: Optional[str] = Header(
+        None, alias=IDEMPOTENCY_HEADER, description=IDEMPOTENCY_DESCRIPTION
+    ),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    _slot: None = Depends(generation_slot),
+):
+    with span("validation"):
+        conv_id = validate_object_id(conversation_id)
+        msg_id = validate_object_id(message_id)
+        validate_context(data.context)
+
+    async def respond():
+        conversation, window, updated_message = await save_edited_message(db, conv_id, msg_id, data)
+        return StreamingResponse(
+            stream_and_save_reply(db, conversation, updated_message, window, data),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    return await idempotent(
+        db, idempotency_key, f"PUT {conv_id}/messages/{msg_id}/stream", data, respond
+    )
+
+
+@router.put(
+    "/conversations/{conversation_id}/messages/{message_id}/async",
+    response_model=GenerationJobAccepted,
+    status_code=202,
+)
+async def edit_message_async(
+    conversation_id: str = Path(..., description="The ID of the conversation"),
+    message_id: str = Path(..., description="The ID of the message to edit"),
+    data: UpdateResponse = ...,
+    idempotency_key: Optional[str] = Header(
+        None, alias=IDEMPOTENCY_HEADER, description=IDEMPOTENCY_DESCRIPTION
+    ),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    with span("validation"):
+        conv_id = validate_object_id(conversation_id)
+        msg_id = validate_object_id(message_id)
+        validate_context(data.context)
+
+    async def respond():
+        await check_queue_capacity(db)
+        conversation, window, updated_message = await save_edited_message(db, conv_id, msg_id, data)
+        return await enqueue_reply(db, conversation, updated_message, window, data)
+
+    return await idempotent(
+        db, idempotency_key, f"PUT {conv_id}/messages/{msg_id}/async", data, respond
     )
 
-    if not ai_message:
-        raise HTTPException(status_code=500, detail="Failed to save new AI response")
-    
-    # Fetch the updated conversation
-    updated_conversation = await crud_conversation.get_conversation(db, conv_id)
-    if not updated_conversation:
-        raise HTTPException(status_code=404, detail="Failed to retrieve updated conversation")
-    
-    return updated_conversation.messages
 
 @router.put("/conversations/{conversation_id}/messages/{message_id}/versions/{version_id}", response_model=List[MessageOut])
 async def change_message_version(
     conversation_id: str = Path(..., description="The ID of the conversation"),
     message_id: str = Path(..., description="The ID of the message"),
     version_id: str = Path(..., description="The version ID to change to"),
-    db: AsyncIOMotorDatabase = Depends(get_db)
+    delta: bool = Query(False, description=DELTA_DESCRIPTION),
+    db: AsyncIOMotorDatabase = Depends(get_db),
 ):
     conv_id = validate_object_id(conversation_id)
     msg_id = validate_object_id(message_id)
-    
-    updated_conversation = await crud_conversation.change_message_version(db, conv_id, msg_id, version_id)
+
+    try:
+        updated_conversation = await crud_conversation.change_message_version(
+            db, conv_id, msg_id, version_id
+        )
+    except ConflictError as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
     if updated_conversation:
-        return updated_conversation.messages
+        if delta:
+            return messages_response([m for m in updated_conversation.messages if m.id == msg_id])
+        return messages_response(updated_conversation.messages)
     raise HTTPException(status_code=404, detail="Conversation, message, or version not found")
 
+
 @router.delete("/conversations/{conversation_id}/messages/{message_id}", response_model=List[MessageOut])
 async def delete_message(
     conversation_id: str = Path(..., description="The ID of the conversation"),
@@ -153,16 +782,143 @@ async def delete_message(
 ):
     conv_id = validate_object_id(conversation_id)
     msg_id = validate_object_id(message_id)
-    deleted = await crud_conversation.delete_message(db, conv_id, msg_id)
+    conversation = await crud_conversation.get_conversation(db, conv_id)
+    if not conversation:
+        raise HTTPException(status_code=404, detail="Message not found or couldn't be deleted")
+    message_ids = {m.id for m in conversation.messages}
+    deleted = await crud_conversation.delete_message(db, conv_id, msg_id, conversation)
     if not deleted:
         raise HTTPException(status_code=404, detail="Message not found or couldn't be deleted")
-    
-    # Fetch the updated conversation
-    updated_conversation = await crud_conversation.get_conversation(db, conv_id)
-    if not updated_conversation:
+    # Drop pending replies to anything in the removed subtree
+    await generation_queue.cancel_for_messages(
+        db, conv_id, list(message_ids - {m.id for m in conversation.messages})
+    )
+
+    # Deleting every message removes the conversation itself
+    if not conversation.messages:
         raise HTTPException(status_code=404, detail="Failed to retrieve updated conversation")
-    
-    return updated_conversation.messages
+
+    return messages_response(conversation.messages)
+
+
+@router.get("/conversations/{conversation_id}/messages", response_model=MessagePage)
+async def list_messages(
+    conversation_id: str = Path(..., description="The ID of the conversation"),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: str = Query(None, description="next_cursor from the previous page (a message ID)"),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    conv_id = validate_object_id(conversation_id)
+    messages = await crud_conversation.get_messages_page(
+        db, conv_id, limit + 1, decode_message_cursor(cursor)
+    )
+    if messages is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    next_cursor = None
+    if len(messages) > limit:
+        messages = messages[:limit]
+        next_cursor = str(messages[-1].id)
+    return page_response(messages, next_cursor, message_out)
+
+
+@router.get(
+    "/conversations/{conversation_id}/messages/{message_id}/versions/archived",
+    response_model=List[MessageVersionOut],
+)
+async def get_archived_versions(
+    conversation_id: str = Path(..., description="The ID of the conversation"),
+    message_id: str = Path(..., description="The ID of the message"),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    # Versions moved out of the message by compaction, oldest first; switching to one restores it
+    conv_id = validate_object_id(conversation_id)
+    msg_id = validate_object_id(message_id)
+    versions = await crud_conversation.get_archived_versions(db, conv_id, msg_id)
+    if not versions and not await crud_conversation.get_messages_by_ids(db, [conv_id], [msg_id]):
+        raise HTTPException(status_code=404, detail="Message not found")
+    return FastJSONResponse(
+        [
+            {
+                "id": v.id,
+                "content": v.content,
+                "created_at": v.created_at,
+                "child_messages": v.child_messages,
+            }
+            for v in versions
+        ]
+    )
+
+
+@router.get("/conversations/{conversation_id}/active", response_model=List[MessageOut])
+async def get_active_thread(
+    conversation_id: str = Path(..., description="The ID of the conversation"),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    conv_id = validate_object_id(conversation_id)
+    thread = await crud_conversation.get_active_thread(db, conv_id)
+    if thread is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return messages_response(thread)
+
+
+@router.get("/search", response_model=SearchResults)
+async def search_messages(
+    q: str = Query(..., min_length=1, max_length=500, description="Search text"),
+    mode: str = Query(
+        "text", regex="^(text|semantic)$", description="text: word index; semantic: similar wording"
+    ),
+    context: str = Query(None, description="Only conversations that used this context"),
+    since: datetime = Query(
+        None, description="Only message versions created at or after this time (UTC)"
+    ),
+    until: datetime = Query(
+        None, description="Only message versions created at or before this time (UTC)"
+    ),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    if not settings.SEARCH_ENABLED:
+        raise HTTPException(status_code=404, detail="Search is disabled")
+    # Stored datetimes are naive UTC
+    since, until = (
+        d.astimezone(timezone.utc).replace(tzinfo=None) if d and d.tzinfo else d
+        for d in (since, until)
+    )
+    if mode == "semantic":
+        if not message_indexer.available:
+            raise HTTPException(status_code=503, detail="Semantic search is unavailable")
+        hits = await semantic_search(db, q, limit, context, since, until)
+    else:
+        hits = await text_search(db, q, limit, context, since, until)
+    return FastJSONResponse({"mode": mode, "items": hits})
+
+
+@router.get("/jobs/{job_id}", response_model=GenerationJobOut)
+async def get_generation_job(
+    job_id: str = Path(..., description="The ID of the generation job"),
+    wait: float = Query(
+        0, ge=0, le=30, description="Seconds to wait for the job to finish before answering"
+    ),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    job = await generation_queue.get(db, validate_object_id(job_id), wait)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return FastJSONResponse(job_out(job))
+
+
+@router.delete("/jobs/{job_id}", response_model=GenerationJobOut)
+async def cancel_generation_job(
+    job_id: str = Path(..., description="The ID of the generation job"),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    job = await generation_queue.cancel(db, validate_object_id(job_id))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] != "cancelled":
+        raise HTTPException(status_code=409, detail=f"Job is already {job['status']}")
+    return FastJSONResponse(job_out(job))
+
 
 @router.get("/conversations/{conversation_id}", response_model=ConversationOut)
 async def get_conversation(
@@ -172,5 +928,5 @@ async def get_conversation(
     conv_id = validate_object_id(conversation_id)
     conversation = await crud_conversation.get_conversation(db, conv_id)
     if conversation:
-        return conversation
-    raise HTTPException(status_code=404, detail="Conversation not found")
\ No newline at end of file
+        return conversation_response(conversation)
+    raise HTTPException(status_code=404, detail="Conversation not found")
@@ -2,4 +2,25 @@ prompt_mappings = {
     "Onboarding": "You are an AI customer support agent. Your task is to guide the user through the onboarding process. Ask the user to provide their name, email, and phone number. After collecting this information, you will create a new conversation for the user and ask if they want to proceed with the onboarding process. If the user agrees, you will ask for their address and payment information. If the user does not want to proceed, you will end the conversation. If the user wants to proceed with the onboarding process, you will ask for their address and payment information. If the user does not want to proceed, you will end the conversation.",
     "Customer Support": "You are an AI customer support agent. Your task is to answer the user's questions and help them with their issues. If the user has any questions, you will answer them. If the user has any issues, you will help them resolve them. If the user does not want to proceed, you will end the conversation.",
     "Technical Support": "You are an AI technical support agent. Your task is to answer the user's questions and help them with their issues. If the user has any questions, you will answer them. If the user has any issues, you will help them resolve them. If the user does not want to proceed, you will end the conversation.",
-}
\ No newline at end of file
+}
+
+# Prompt token budget per context (system prompt + history + user message)
+context_token_budgets = {
+    "Onboarding": 2000,
+    "Customer Support": 3000,
+    "Technical Support": 4000,
+}
+
+# Contexts whose replies may be served from the response cache (see LLM_CACHE_ENABLED)
+cacheable_contexts = {
+    "Onboarding": True,
+    "Customer Support": True,
+    "Technical Support": True,
+}
+
+# Queue priority of async generation jobs per context (higher runs first)
+generation_priorities = {
+    "Onboarding": 2,
+    "Customer Support": 1,
+    "Technical Support": 1,
+}
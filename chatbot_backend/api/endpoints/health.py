@@ -0,0 +1,52 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from chatbot_backend.api.timing import TimedRoute
+
+from chatbot_backend.config import settings
+from chatbot_backend.crud.cache import conversation_cache
+from chatbot_backend.db.mongodb import ping
+from chatbot_backend.db.monitoring import pool_metrics
+from chatbot_backend.llm.cache import get_response_cache
+from chatbot_backend.metrics import registry
+from chatbot_backend.warmup import warmup_status
+
+router = APIRouter(route_class=TimedRoute)
+
+
+@router.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+@router.get("/health/ready")
+async def readiness():
+    if await ping():
+        return {"status": "ready", "mongo": "ok", "warmup": warmup_status}
+    return JSONResponse(status_code=503, content={"status": "unavailable", "mongo": "unreachable"})
+
+
+@router.get("/health/pool")
+async def pool_stats():
+    return pool_metrics.snapshot()
+
+
+@router.get("/health/llm-cache")
+async def llm_cache_stats():
+    cache = get_response_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.snapshot()}
+
+
+@router.get("/health/conversation-cache")
+async def conversation_cache_stats():
+    if not settings.CONVERSATION_CACHE_ENABLED:
+        return {"enabled": False}
+    return {"enabled": True, **conversation_cache.snapshot()}
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    # Prometheus text exposition format
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
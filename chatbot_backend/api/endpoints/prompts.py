@@ -0,0 +1,159 @@
+import asyncio
+import json
+import os
+from string import Formatter
+from typing import Dict, Iterable, Optional, Tuple
+
+from chatbot_backend.config import settings
+from chatbot_backend.metrics import registry
+from chatbot_backend.api.endpoints.constants import prompt_mappings
+
+# System prompt templates per context. The built-in prompts in constants.py can be overridden or
+# extended from a JSON file (PROMPT_TEMPLATES_PATH):
+#
+#   {"Billing": "You are a billing assistant. Answer in {language}.", "Onboarding": null}
+#
+# A template may place the language with {language}; otherwise the usual "Generate the response
+# in ... language." sentence is appended. null removes a built-in context. Templates are
+# validated when loaded, and the prompts for PROMPT_LANGUAGES are rendered up front; other
+# languages are rendered on first use. The file is polled every PROMPT_RELOAD_SECONDS and a
+# changed file is swapped in whole, or not at all if it doesn't validate.
+
+LANGUAGE_SENTENCE = " Generate the response in {language} language."
+
+# Rendered prompts kept for languages outside PROMPT_LANGUAGES (the language is client input)
+MAX_RENDERED = 1024
+
+
+class TemplateError(ValueError):
+    pass
+
+
+class UnknownContextError(ValueError):
+    pass
+
+
+def compile_templates(templates: Dict[str, Optional[str]]) -> Dict[str, str]:
+    compiled = {}
+    for context, template in templates.items():
+        if template is None:
+            continue
+        if not context or not isinstance(template, str) or not template.strip():
+            raise TemplateError(f"{context!r}: a template must be a non-empty string")
+        try:
+            fields = {name for _, name, _, _ in Formatter().parse(template) if name is not None}
+        except ValueError as exc:
+            raise TemplateError(f"{context!r}: {exc}")
+        if fields - {"language"}:
+            raise TemplateError(f"{context!r}: only the {{language}} placeholder is supported")
+        compiled[context] = template if fields else template + LANGUAGE_SENTENCE
+    return compiled
+
+
+class PromptRegistry:
+    def __init__(
+        self, defaults: Dict[str, str], path: str, reload_seconds: float, languages: Iterable[str]
+    ):
+        # The built-in prompts are plain text, so their braces are literal
+        self.defaults = {
+            context: prompt.replace("{", "{{").replace("}", "}}")
+            for context, prompt in defaults.items()
+        }
+        self.path = path
+        self.reload_seconds = reload_seconds
+        self.languages = list(languages)
+        self.reloads = 0
+        # Built-in prompts until load() runs at startup (scripts and tests may never call it)
+        self._templates: Dict[str, str] = compile_templates(self.defaults)
+        self._rendered: Dict[Tuple[str, str], str] = {}
+        self._mtime: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def __contains__(self, context: str) -> bool:
+        return context in self._templates
+
+    @property
+    def contexts(self):
+        return list(self._templates)
+
+    def load(self):
+        # Raises OSError or ValueError; at startup a broken file keeps the app from starting
+        templates = dict(self.defaults)
+        mtime = None
+        if self.path:
+            mtime = os.stat(self.path).st_mtime_ns
+            with open(self.path, encoding="utf-8") as f:
+                overrides = json.load(f)
+            if not isinstance(overrides, dict):
+                raise TemplateError(f"{self.path}: expected an object of context -> template")
+            templates.update(overrides)
+        compiled = compile_templates(templates)
+        rendered = {
+            (context, language): template.format(language=language)
+            for context, template in compiled.items()
+            for language in self.languages
+        }
+        self._templates, self._rendered, self._mtime = compiled, rendered, mtime
+
+    def reload_if_changed(self) -> bool:
+        if not self.path:
+            return False
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError as exc:
+            print(f"Prompt templates not reloaded, keeping the current ones: {exc}")
+            return False
+        if mtime == self._mtime:
+            return False
+        try:
+            self.load()
+        except (OSError, ValueError) as exc:
+            # Not retried until the file changes again
+            self._mtime = mtime
+            print(f"Prompt templates not reloaded, keeping the current ones: {exc}")
+            return False
+        self.reloads += 1
+        print(f"Reloaded prompt templates from {self.path}")
+        return True
+
+    def system_prompt(self, context: str, language: str) -> str:
+        prompt = self._rendered.get((context, language))
+        if prompt is None:
+            template = self._templates.get(context)
+            if template is None:
+                raise UnknownContextError(f"Unknown context: {context}")
+            prompt = template.format(language=language)
+            if len(self._rendered) < MAX_RENDERED:
+                self._rendered[(context, language)] = prompt
+        return prompt
+
+    def start(self):
+        if self.path and self.reload_seconds:
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.reload_seconds)
+            self.reload_if_changed()
+
+    def snapshot(self) -> Dict[str, int]:
+        return {
+            "contexts": len(self._templates),
+            "rendered": len(self._rendered),
+            "reloads": self.reloads,
+        }
+
+
+prompt_registry = PromptRegistry(
+    prompt_mappings,
+    settings.PROMPT_TEMPLATES_PATH,
+    settings.PROMPT_RELOAD_SECONDS,
+    settings.PROMPT_LANGUAGES,
+)
+registry.register_gauges("chatbot_prompt_templates", prompt_registry.snapshot)
@@ -0,0 +1,122 @@
+import hashlib
+from datetime import datetime
+from typing import AsyncIterator, Awaitable, Callable
+
+from fastapi import HTTPException, Response
+from fastapi.responses import StreamingResponse
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pydantic import BaseModel
+from pymongo.errors import DuplicateKeyError
+
+
+# Idempotency-Key support for the chat endpoints. The first request with a key reserves it and
+# stores its response once it completes; retries with the same key and payload get that response
+# back without another LLM call. A retry while the original is still running gets a 409, and
+# reusing a key with a different payload gets a 422. Failed requests release the key.
+# Keys expire through a TTL index on `created_at` (see db/indexes.py).
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+def _fingerprint(payload: BaseModel) -> str:
+    return hashlib.sha256(payload.json(sort_keys=True).encode("utf-8")).hexdigest()
+
+
+async def _reserve(db: AsyncIOMotorDatabase, record_id: str, fingerprint: str):
+    # Returns the stored response for a completed request with this key, or None once reserved
+    try:
+        await db.idempotency_keys.insert_one(
+            {
+                "_id": record_id,
+                "fingerprint": fingerprint,
+                "state": "pending",
+                "created_at": datetime.utcnow(),
+            }
+        )
+        return None
+    except DuplicateKeyError:
+        existing = await db.idempotency_keys.find_one({"_id": record_id})
+    if existing is not None and existing["fingerprint"] != fingerprint:
+        raise HTTPException(
+            status_code=422, detail="Idempotency-Key was already used for a different request"
+        )
+    if existing is None or existing["state"] == "pending":
+        raise HTTPException(
+            status_code=409,
+            detail="A request with this Idempotency-Key is still in progress",
+            headers={"Retry-After": "1"},
+        )
+    return Response(
+        content=existing["body"],
+        status_code=existing["status_code"],
+        media_type=existing["media_type"],
+        headers={REPLAYED_HEADER: "true"},
+    )
+
+
+async def _complete(
+    db: AsyncIOMotorDatabase, record_id: str, status_code: int, body: bytes, media_type: str
+):
+    await db.idempotency_keys.update_one(
+        {"_id": record_id},
+        {
+            "$set": {
+                "state": "done",
+                "status_code": status_code,
+                "body": body,
+                "media_type": media_type,
+            }
+        },
+    )
+
+
+async def _release(db: AsyncIOMotorDatabase, record_id: str):
+    await db.idempotency_keys.delete_one({"_id": record_id, "state": "pending"})
+
+
+async def _recorded_stream(
+    db: AsyncIOMotorDatabase,
+    record_id: str,
+    response: StreamingResponse,
+    source: AsyncIterator[str],
+) -> AsyncIterator[str]:
+    # Server-Sent Events are stored whole once the stream ends, unless it ended with an error event
+    events = []
+    completed = False
+    try:
+        async for chunk in source:
+            events.append(chunk)
+            yield chunk
+        completed = not (events and events[-1].startswith("event: error"))
+    finally:
+        if completed:
+            body = "".join(events).encode("utf-8")
+            await _complete(db, record_id, response.status_code, body, response.media_type)
+        else:
+            await _release(db, record_id)
+
+
+async def idempotent(
+    db: AsyncIOMotorDatabase,
+    key: str,
+    scope: str,
+    payload: BaseModel,
+    produce: Callable[[], Awaitable[Response]],
+) -> Response:
+    if not key:
+        return await produce()
+    record_id = f"{scope}|{key}"
+    replay = await _reserve(db, record_id, _fingerprint(payload))
+    if replay is not None:
+        return replay
+    try:
+        response = await produce()
+    except BaseException:
+        await _release(db, record_id)
+        raise
+    if isinstance(response, StreamingResponse):
+        response.body_iterator = _recorded_stream(db, record_id, response, response.body_iterator)
+    else:
+        await _complete(db, record_id, response.status_code, response.body, response.media_type)
+    return response
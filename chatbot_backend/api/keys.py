@@ -0,0 +1,134 @@
+import argparse
+import asyncio
+import hashlib
+import secrets
+import time
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pydantic import BaseModel
+
+from chatbot_backend.config import settings
+from chatbot_backend.db.mongodb import close_mongo_connection, get_database
+
+# API keys, stored in `api_keys` under the SHA-256 of the key (the key itself is never stored):
+#
+#   {"_id": "<sha256>", "name": "acme", "active": true, "rate_per_second": 5, "max_concurrency": 4}
+#
+# Limits a key doesn't set fall back to the API_KEY_* settings. settings.API_KEY is accepted too,
+# as the key named "default". Lookups, including misses, are cached per worker for
+# API_KEY_CACHE_SECONDS, so a revoked key stops working within that time. To manage keys:
+#
+#   python -m chatbot_backend.api.keys create acme [--rate 5 --max-concurrency 4 ...]
+#   python -m chatbot_backend.api.keys revoke acme
+#   python -m chatbot_backend.api.keys list
+
+LIMIT_FIELDS = ("rate_per_second", "burst", "requests_per_minute", "max_concurrency", "max_queued")
+
+
+class ApiKey(BaseModel):
+    id: str
+    name: str
+    rate_per_second: float = 0
+    burst: int = 1
+    requests_per_minute: int = 0
+    max_concurrency: int = 0
+    max_queued: int = 0
+
+
+def hash_key(key: str) -> str:
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def default_limits() -> dict:
+    return {
+        "rate_per_second": settings.API_KEY_RATE_PER_SECOND,
+        "burst": settings.API_KEY_BURST,
+        "requests_per_minute": settings.API_KEY_REQUESTS_PER_MINUTE,
+        "max_concurrency": settings.API_KEY_MAX_CONCURRENCY,
+        "max_queued": settings.API_KEY_MAX_QUEUED,
+    }
+
+
+def anonymous_key() -> ApiKey:
+    # Callers without a key when AUTH_ENABLED is off share one set of limits
+    return ApiKey(id="anonymous", name="anonymous", **default_limits())
+
+
+class KeyStore:
+    def __init__(self, cache_seconds: float):
+        self.cache_seconds = cache_seconds
+        # key hash -> (key or None for an unknown key, expiry)
+        self._cache: Dict[str, Tuple[Optional[ApiKey], float]] = {}
+
+    async def lookup(self, db: AsyncIOMotorDatabase, key: str) -> Optional[ApiKey]:
+        key_hash = hash_key(key)
+        cached = self._cache.get(key_hash)
+        now = time.monotonic()
+        if cached is not None and cached[1] > now:
+            return cached[0]
+        if secrets.compare_digest(key.encode("utf-8"), settings.API_KEY.encode("utf-8")):
+            api_key = ApiKey(id="default", name="default", **default_limits())
+        else:
+            document = await db.api_keys.find_one({"_id": key_hash, "active": True})
+            api_key = None
+            if document is not None:
+                limits = {
+                    **default_limits(),
+                    **{f: document[f] for f in LIMIT_FIELDS if document.get(f) is not None},
+                }
+                api_key = ApiKey(id=key_hash[:16], name=document["name"], **limits)
+        if len(self._cache) >= 10000:
+            self._cache = {h: entry for h, entry in self._cache.items() if entry[1] > now}
+        self._cache[key_hash] = (api_key, now + self.cache_seconds)
+        return api_key
+
+
+key_store = KeyStore(settings.API_KEY_CACHE_SECONDS)
+
+
+async def main(args):
+    try:
+        db = await get_database()
+        if args.command == "create":
+            key = secrets.token_urlsafe(32)
+            limits = {f: getattr(args, f) for f in LIMIT_FIELDS if getattr(args, f) is not None}
+            await db.api_keys.insert_one(
+                {
+                    "_id": hash_key(key),
+                    "name": args.name,
+                    "active": True,
+                    "created_at": datetime.utcnow(),
+                    **limits,
+                }
+            )
+            print(key)
+        elif args.command == "revoke":
+            result = await db.api_keys.update_many(
+                {"name": args.name, "active": True},
+                {"$set": {"active": False, "revoked_at": datetime.utcnow()}},
+            )
+            print(f"Revoked {result.modified_count} keys")
+        else:
+            async for document in db.api_keys.find({}, {"_id": 0}).sort("created_at", 1):
+                print(document)
+    finally:
+        await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage API keys")
+    commands = parser.add_subparsers(dest="command", required=True)
+    create = commands.add_parser(
+        "create", help="create a key and print it (it is not stored in clear)"
+    )
+    create.add_argument("name")
+    create.add_argument("--rate", dest="rate_per_second", type=float)
+    create.add_argument("--burst", type=int)
+    create.add_argument("--requests-per-minute", dest="requests_per_minute", type=int)
+    create.add_argument("--max-concurrency", dest="max_concurrency", type=int)
+    create.add_argument("--max-queued", dest="max_queued", type=int)
+    commands.add_parser("revoke", help="deactivate every key with this name").add_argument("name")
+    commands.add_parser("list")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,31 @@
+import base64
+from datetime import datetime
+from typing import Optional, Tuple
+
+from bson import ObjectId
+from fastapi import HTTPException
+
+# Opaque keyset cursors: clients pass back whatever `next_cursor` they received
+
+
+def encode_conversation_cursor(updated_at: datetime, conversation_id: ObjectId) -> str:
+    raw = f"{updated_at.isoformat()}|{conversation_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_conversation_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, ObjectId]]:
+    if not cursor:
+        return None
+    try:
+        updated_at, conversation_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(updated_at), ObjectId(conversation_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def decode_message_cursor(cursor: Optional[str]) -> Optional[ObjectId]:
+    if not cursor:
+        return None
+    if not ObjectId.is_valid(cursor):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return ObjectId(cursor)
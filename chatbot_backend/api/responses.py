@@ -0,0 +1,80 @@
+from typing import Any, List, Optional
+
+from fastapi.responses import JSONResponse
+
+from chatbot_backend.encoding import dumps
+from chatbot_backend.models import Conversation, ConversationSummary, Message
+
+# Encodes CRUD results straight to JSON, skipping the response_model round trip (re-validating
+# every message into MessageOut, then jsonable_encoder). The dicts below mirror MessageOut,
+# ConversationOut and ConversationSummaryOut with by_alias=True; the decorators keep their
+# response_model for the OpenAPI schema.
+
+
+def message_out(message: Message) -> dict:
+    return {
+        "_id": message.id,
+        "parent_id": message.parent_id,
+        "parent_version": message.parent_version,
+        "sender": message.sender,
+        "current_version": message.current_version,
+        "versions": [
+            {
+                "id": v.id,
+                "content": v.content,
+                "created_at": v.created_at,
+                "child_messages": v.child_messages,
+            }
+            for v in message.versions
+        ],
+        "archived_versions": message.archived_versions,
+    }
+
+
+def conversation_summary_out(conversation: ConversationSummary) -> dict:
+    return {
+        "_id": conversation.id,
+        "title": conversation.title,
+        "created_at": conversation.created_at,
+        "updated_at": conversation.updated_at,
+    }
+
+
+def conversation_out(conversation: Conversation) -> dict:
+    return {
+        **conversation_summary_out(conversation),
+        "messages": [message_out(m) for m in conversation.messages],
+    }
+
+
+def job_out(job: dict) -> dict:
+    # Mirrors GenerationJobOut; a finished job carries the saved AI message (see run_generation_job)
+    return {
+        "_id": job["_id"],
+        "status": job["status"],
+        "conversation_id": job["conversation_id"],
+        "parent_id": job["parent_id"],
+        "priority": job["priority"],
+        "created_at": job["created_at"],
+        "started_at": job.get("started_at"),
+        "finished_at": job.get("finished_at"),
+        "message": (job.get("result") or {}).get("message"),
+        "error": job.get("error"),
+    }
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def messages_response(messages: List[Message]) -> FastJSONResponse:
+    return FastJSONResponse([message_out(m) for m in messages])
+
+
+def conversation_response(conversation: Conversation) -> FastJSONResponse:
+    return FastJSONResponse(conversation_out(conversation))
+
+
+def page_response(items: list, next_cursor: Optional[str], encode) -> FastJSONResponse:
+    return FastJSONResponse({"items": [encode(item) for item in items], "next_cursor": next_cursor})
@@ -0,0 +1,79 @@
+import functools
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional
+
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+
+from chatbot_backend.config import settings
+from chatbot_backend.metrics import observe_stage, request_duration, start_request_spans
+
+# Request timing: the middleware records total latency per route template and, in debug mode,
+# returns the request's spans in a Server-Timing header. TimedRoute splits the time FastAPI
+# spends around the endpoint into request validation and response serialization.
+
+# Per-request marks set by TimedRoute: route template and endpoint start/end times
+_marks: ContextVar[Optional[Dict[str, object]]] = ContextVar("request_marks", default=None)
+
+
+class TimedRoute(APIRoute):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        call = self.dependant.call
+
+        @functools.wraps(call)
+        async def timed_call(**values):
+            marks = _marks.get()
+            if marks is not None:
+                marks["endpoint_start"] = time.perf_counter()
+            try:
+                return await call(**values)
+            finally:
+                if marks is not None:
+                    marks["endpoint_end"] = time.perf_counter()
+
+        # The request handler looks the callable up on each request
+        self.dependant.call = timed_call
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def timed_handler(request: Request) -> Response:
+            marks = _marks.get()
+            if marks is None:
+                marks = {}
+                _marks.set(marks)
+            marks["route"] = self.path_format
+            start = time.perf_counter()
+            response = await handler(request)
+            end = time.perf_counter()
+            if "endpoint_start" in marks:
+                observe_stage("request.validation", marks["endpoint_start"] - start)
+                observe_stage("response.serialization", end - marks["endpoint_end"])
+            return response
+
+        return timed_handler
+
+
+def server_timing(spans) -> str:
+    totals: Dict[str, float] = {}
+    for name, seconds in spans:
+        totals[name] = totals.get(name, 0.0) + seconds
+    return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in totals.items())
+
+
+async def timing_middleware(request: Request, call_next):
+    spans = start_request_spans()
+    marks: Dict[str, object] = {}
+    _marks.set(marks)
+    start = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - start
+    # Unrouted paths share one label to keep the series count bounded
+    request_duration.observe(
+        elapsed, request.method, str(marks.get("route", "unmatched")), str(response.status_code)
+    )
+    if settings.DEBUG_MODE:
+        response.headers["Server-Timing"] = server_timing(spans + [("total", elapsed)])
+    return response
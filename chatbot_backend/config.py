@@ -1,3 +1,5 @@
+from typing import List
+
 from pydantic import BaseSettings
 
 class Settings(BaseSettings):
@@ -6,10 +8,121 @@ class Settings(BaseSettings):
     MONGODB_URL: str = "mongodb://localhost:27017"
     DATABASE_NAME: str = "chatbot_db"
     API_V1_STR: str = "/api/v1"
+    # Accepted besides the keys in `api_keys`
     API_KEY: str = "your-secret-api-key-here"  # Change this!
     GEMINI_API_KEY: str = "your-gemini-api-key-here"  # Change this!
 
+    # MongoDB connection pool
+    MONGO_MIN_POOL_SIZE: int = 0
+    MONGO_MAX_POOL_SIZE: int = 100
+    MONGO_MAX_IDLE_TIME_MS: int = 60000
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = 5000
+    MONGO_WAIT_QUEUE_TIMEOUT_MS: int = 10000
+    # Explain every query pattern at startup and print the ones that scan (see db/indexes.py)
+    MONGO_CHECK_QUERY_PLANS: bool = False
+
+    # Message storage backend: "embedded" (array in the conversation) or "collection"
+    MESSAGE_STORAGE: str = "embedded"
+
+    # LLM provider ("gemini" or "stub" for offline load tests)
+    LLM_PROVIDER: str = "gemini"
+    LLM_MODEL: str = "gemini-1.5-flash"
+    LLM_MAX_CONCURRENCY: int = 16
+    LLM_RATE_LIMIT_PER_SECOND: float = 0  # 0 disables the token bucket
+    LLM_RATE_LIMIT_BURST: int = 1
+    LLM_TIMEOUT_SECONDS: float = 60
+    LLM_STREAM_TIMEOUT_SECONDS: float = 300  # a whole streamed reply, however slowly it is read
+    LLM_MAX_RETRIES: int = 2
+    LLM_RETRY_BASE_DELAY_SECONDS: float = 0.5
+    # New generations get 429 while this many calls wait for the limiter; 0: unbounded
+    LLM_MAX_QUEUED: int = 0
+    STUB_LLM_LATENCY_MS: int = 0
+    STUB_LLM_CHUNK_LATENCY_MS: int = 0
+
+    # Prompt assembly (per-context budgets live in api/endpoints/constants.py)
+    CONTEXT_TOKEN_BUDGET: int = 3000
+    CONTEXT_SUMMARY_TOKEN_BUDGET: int = 300
+    CONTEXT_TURN_SUMMARY_TOKENS: int = 40
+
+    # Prompt templates (api/endpoints/prompts.py): optional JSON file of per-context templates,
+    # polled for changes; prompts for PROMPT_LANGUAGES are rendered at startup
+    PROMPT_TEMPLATES_PATH: str = ""
+    PROMPT_RELOAD_SECONDS: float = 5
+    PROMPT_LANGUAGES: List[str] = ["English"]
+
+    # Startup warm-up (warmup.py): connections opened ahead of the first requests, and the time
+    # allowed for each step before the app starts serving anyway
+    WARMUP_MONGO_CONNECTIONS: int = 4
+    WARMUP_TIMEOUT_SECONDS: float = 10
+
+    # Response cache (opt-in; per-context switches live in api/endpoints/constants.py)
+    LLM_CACHE_ENABLED: bool = False
+    LLM_CACHE_MAX_ENTRIES: int = 1024
+    LLM_CACHE_TTL_SECONDS: float = 3600
+    LLM_CACHE_SHARED: bool = False  # also share entries across workers through MongoDB
+
+    # Hot conversation cache in front of get_conversation (opt-in)
+    CONVERSATION_CACHE_ENABLED: bool = False
+    CONVERSATION_CACHE_MAX_ENTRIES: int = 1000
+    CONVERSATION_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    CONVERSATION_CACHE_TTL_SECONDS: float = 300
+    # Check the stored revision on each hit (needed with several workers)
+    CONVERSATION_CACHE_VALIDATE: bool = True
+    # Or have workers invalidate each other (see shared.py)
+    CONVERSATION_CACHE_SHARED_INVALIDATION: bool = False
+
+    # API keys and admission control (api/keys.py, api/admission.py)
+    AUTH_ENABLED: bool = False  # require a valid X-API-Key on the chat API
+    API_KEY_CACHE_SECONDS: float = 60
+    # Per-key defaults, each overridable on the key's document; 0 disables a limit
+    API_KEY_RATE_PER_SECOND: float = 0  # token bucket, per worker
+    API_KEY_BURST: int = 20
+    API_KEY_REQUESTS_PER_MINUTE: int = 0  # quota across all workers
+    API_KEY_MAX_CONCURRENCY: int = 0  # generations in flight, per worker
+    API_KEY_MAX_QUEUED: int = 16  # generations waiting for a slot, per worker
+    API_KEY_QUEUE_SECONDS: float = 5  # longest wait for a slot before answering 429
+    USAGE_FLUSH_SECONDS: float = 5  # per-key usage is written to `api_key_usage` in batches
+
+    # Coordination between worker processes through MongoDB (shared.py)
+    SHARED_STATE_POLL_SECONDS: float = 1.0
+    SHARED_STATE_RETENTION_SECONDS: int = 3600
+
+    # Production launch (python -m chatbot_backend.server); 0 workers: one per available CPU
+    HOST: str = "0.0.0.0"
+    PORT: int = 8000
+    WORKERS: int = 0
+    # On SIGTERM, how long in-flight requests and running generation jobs get to finish
+    SHUTDOWN_DRAIN_SECONDS: float = 30
+
+    # How long Idempotency-Key records (and their stored responses) are kept
+    IDEMPOTENCY_TTL_SECONDS: int = 86400
+
+    # Background generation for the /async chat endpoints (0 workers disables them)
+    GENERATION_WORKERS: int = 4
+    GENERATION_QUEUE_MAX_DEPTH: int = 1000  # queued jobs across all processes
+    # A running job is re-queued if its worker is gone this long
+    GENERATION_JOB_LEASE_SECONDS: float = 300
+    GENERATION_QUEUE_POLL_SECONDS: float = 1.0
+    GENERATION_JOB_TTL_SECONDS: int = 86400
+
+    # POST /batch/messages: items per request, and how many of them run at once
+    BATCH_MAX_ITEMS: int = 100
+    BATCH_MAX_CONCURRENCY: int = 8
+
+    # Version archive (crud/archive.py): a message keeps its current and newest versions inline
+    VERSION_ARCHIVE_KEEP: int = 3
+    # Archive on edit once a message has more inline versions; 0: only via db.compact_versions
+    VERSION_ARCHIVE_AFTER: int = 0
+    # zlib archived content at least this long; 0 disables
+    VERSION_ARCHIVE_COMPRESS_BYTES: int = 512
+
+    # Message search (opt-in): MongoDB text indexes plus a local vector index (needs numpy)
+    SEARCH_ENABLED: bool = False
+    SEARCH_INDEX_PATH: str = "data/search/vectors.npz"
+    SEARCH_EMBEDDING_DIM: int = 256
+    SEARCH_SYNC_SECONDS: float = 60  # catch up on writes from other workers and save the snapshot
+
     class Config:
         env_file = ".env"
 
-settings = Settings()
\ No newline at end of file
+settings = Settings()
@@ -0,0 +1,125 @@
+import hashlib
+import math
+import re
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+from chatbot_backend.config import settings
+from chatbot_backend.crud.tree import current_content
+from chatbot_backend.models import ContextSummary, Message
+
+# Assembles the conversation history sent to the model within a per-context token budget.
+# The newest turns of the active branch are kept verbatim; older turns are folded into a
+# rolling extractive summary stored on the conversation and extended incrementally.
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+SUMMARY_HEADER = "Summary of earlier conversation:\n"
+
+
+def count_tokens(text: str) -> int:
+    # Local approximation of a BPE tokenizer: punctuation is one token, words ~4 characters each
+    return sum(max(1, math.ceil(len(token) / 4)) for token in _TOKEN_RE.findall(text))
+
+
+class ContextWindow(BaseModel):
+    history: List[str]
+    prompt_tokens: int
+    # Set only when the stored rolling summary needs to be replaced
+    summary: Optional[ContextSummary] = None
+
+
+def _speaker(message: Message) -> str:
+    return "AI" if message.sender == "ai" else "User"
+
+
+def _covered_digest(messages: List[Message]) -> str:
+    digest = hashlib.sha1()
+    for message in messages:
+        digest.update(f"{message.id}:{message.current_version};".encode())
+    return digest.hexdigest()
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    if count_tokens(text) <= max_tokens:
+        return text
+    words = text.split()
+    kept = []
+    used = 0
+    for word in words:
+        used += count_tokens(word)
+        if used > max_tokens:
+            break
+        kept.append(word)
+    return " ".join(kept) + " …"
+
+
+def _summarize_turn(message: Message) -> str:
+    first_sentence = _SENTENCE_RE.split(current_content(message).strip(), 1)[0]
+    return f"{_speaker(message)}: {_truncate(first_sentence, settings.CONTEXT_TURN_SUMMARY_TOKENS)}"
+
+
+def _update_summary(
+    stored: Optional[ContextSummary], older: List[Message], max_tokens: int
+) -> ContextSummary:
+    if (
+        stored
+        and stored.covered_count <= len(older)
+        and _covered_digest(older[: stored.covered_count]) == stored.covered_digest
+    ):
+        # Same branch and versions as last time: only fold in the turns that newly aged out
+        lines = stored.text.split("\n") if stored.text else []
+        new_turns = older[stored.covered_count :]
+    else:
+        lines = []
+        new_turns = older
+    lines.extend(_summarize_turn(m) for m in new_turns)
+    # Compress by dropping the oldest lines once the summary outgrows its own budget
+    while len(lines) > 1 and count_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    text = "\n".join(lines)
+    return ContextSummary(
+        covered_count=len(older),
+        covered_digest=_covered_digest(older),
+        text=text,
+        tokens=count_tokens(text),
+    )
+
+
+def build_context(
+    active_path: List[Message],
+    budget: int,
+    system_prompt: str,
+    user_message: str,
+    stored_summary: Optional[ContextSummary] = None,
+) -> ContextWindow:
+    used = count_tokens(system_prompt) + count_tokens(user_message)
+    available = max(budget - used, 0)
+    lines = [f"{_speaker(m)}: {current_content(m)}" for m in active_path]
+    costs = [count_tokens(line) for line in lines]
+
+    if sum(costs) <= available:
+        return ContextWindow(history=lines, prompt_tokens=used + sum(costs))
+
+    # Not everything fits: reserve room for the summary, then keep the newest turns verbatim
+    summary_budget = min(settings.CONTEXT_SUMMARY_TOKEN_BUDGET, available // 3)
+    remaining = available - summary_budget
+    split = len(lines)
+    while split > 0 and costs[split - 1] <= remaining:
+        split -= 1
+        remaining -= costs[split]
+    recent = lines[split:]
+    used += sum(costs[split:])
+
+    summary = _update_summary(
+        stored_summary, active_path[:split], summary_budget - count_tokens(SUMMARY_HEADER)
+    )
+    history = [SUMMARY_HEADER + summary.text] + recent
+    used += count_tokens(history[0])
+    changed = (
+        stored_summary is None
+        or summary.covered_digest != stored_summary.covered_digest
+        or summary.text != stored_summary.text
+    )
+    return ContextWindow(history=history, prompt_tokens=used, summary=summary if changed else None)
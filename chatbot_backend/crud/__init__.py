@@ -1 +1,36 @@
-from .conversation import crud_conversation
\ No newline at end of file
+from chatbot_backend.config import settings
+from chatbot_backend.metrics import registry
+from .conversation import ConflictError, ConversationCRUD
+from .message_collection import MessageCollectionCRUD
+from .cache import CachedConversationCRUD, conversation_cache
+from .search import SearchIndexedCRUD
+from .sync import SyncConversationCRUD
+from chatbot_backend.search import message_indexer
+from chatbot_backend.shared import shared_state
+
+# "embedded" keeps messages inside the conversation document; "collection" stores them in `messages`
+storage_crud = (
+    MessageCollectionCRUD() if settings.MESSAGE_STORAGE == "collection" else ConversationCRUD()
+)
+crud_conversation = storage_crud
+
+# Blocking counterpart for scripts and batch workers; its loop and client start on first use
+sync_crud = SyncConversationCRUD(storage_crud)
+
+if settings.CONVERSATION_CACHE_ENABLED:
+    if settings.CONVERSATION_CACHE_SHARED_INVALIDATION:
+        # Each worker drops its copy of conversations written by the others
+        shared_state.subscribe("conversation", conversation_cache.invalidate_many)
+
+        def on_change(conversation_id):
+            shared_state.notify("conversation", conversation_id)
+
+    else:
+        on_change = None
+    crud_conversation = CachedConversationCRUD(
+        crud_conversation, conversation_cache, settings.CONVERSATION_CACHE_VALIDATE, on_change
+    )
+    registry.register_gauges("chatbot_conversation_cache", conversation_cache.snapshot)
+
+if settings.SEARCH_ENABLED:
+    crud_conversation = SearchIndexedCRUD(crud_conversation, message_indexer)
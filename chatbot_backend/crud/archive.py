@@ -0,0 +1,165 @@
+import zlib
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from bson import Binary, ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from chatbot_backend.crud.tree import build_children_index, collect_descendants
+from chatbot_backend.models import ArchivedVersion, Message, MessageVersion
+
+# Archive tier for old message versions. Heavily edited messages keep their current version and the
+# newest few others inline; older versions move to `message_archive`, one document per version,
+# together with the inactive branch that hangs off it (the replies given to that version and
+# everything below them). Long archived content is zlib-compressed.
+#
+# Archived versions still count towards version numbering (Message.archived_versions), can be
+# listed through GET .../messages/{id}/versions/archived, and are moved back inline (with their
+# branch) when a client switches to one of them. Exports carry them along with their conversation
+# (db/transfer.py). Both storage backends share this module; the CRUD classes apply the plan to
+# their own layout.
+
+ARCHIVE_COLLECTION = "message_archive"
+
+# (message, versions to archive, inactive branch messages per archived version id)
+ArchivePlan = List[Tuple[Message, List[MessageVersion], Dict[str, List[Message]]]]
+
+
+def plan_archive(
+    messages: List[Message], keep: int, message_ids: Optional[Set[ObjectId]] = None
+) -> ArchivePlan:
+    # Messages arrive parents first, so a message inside a branch that is being archived is
+    # skipped: it moves along with its branch
+    children = build_children_index(messages)
+    by_id = {m.id: m for m in messages}
+    moved: Set[ObjectId] = set()
+    plan = []
+    for message in messages:
+        if (
+            message.id in moved
+            or len(message.versions) <= keep
+            or (message_ids and message.id not in message_ids)
+        ):
+            continue
+        kept = {message.current_version}
+        for version in sorted(message.versions, key=lambda v: v.created_at, reverse=True):
+            if len(kept) >= keep:
+                break
+            kept.add(version.id)
+        archived = [v for v in message.versions if v.id not in kept]
+        branches = {}
+        for version in archived:
+            branch = []
+            for child in children.get(message.id, ()):
+                if child.parent_version == version.id:
+                    branch.append(child)
+                    branch.extend(by_id[i] for i in collect_descendants(children, child.id))
+            moved.update(m.id for m in branch)
+            branches[version.id] = branch
+        plan.append((message, archived, branches))
+    return plan
+
+
+def encode_version(version: MessageVersion, compress_bytes: int) -> dict:
+    document = version.dict()
+    content = document.pop("content").encode("utf-8")
+    if compress_bytes and len(content) >= compress_bytes:
+        document["content_z"] = Binary(zlib.compress(content))
+    else:
+        document["content"] = content.decode("utf-8")
+    return document
+
+
+def decode_version(document: dict) -> dict:
+    document = dict(document)
+    if "content_z" in document:
+        document["content"] = zlib.decompress(document.pop("content_z")).decode("utf-8")
+    return document
+
+
+def archive_documents(
+    conversation_id: ObjectId, plan: ArchivePlan, compress_bytes: int, now: datetime
+) -> List[dict]:
+    return [
+        {
+            "_id": ObjectId(),
+            "conversation_id": conversation_id,
+            "message_id": message.id,
+            "version": encode_version(version, compress_bytes),
+            "branch": [m.dict(by_alias=True) for m in branches[version.id]],
+            "archived_at": now,
+        }
+        for message, versions, branches in plan
+        for version in versions
+    ]
+
+
+def imported_document(
+    conversation_id: ObjectId, archived: ArchivedVersion, compress_bytes: int
+) -> dict:
+    # The stored form of an exported archived version
+    return {
+        "_id": archived.id,
+        "conversation_id": conversation_id,
+        "message_id": archived.message_id,
+        "version": encode_version(archived.version, compress_bytes),
+        "branch": [m.dict(by_alias=True) for m in archived.branch],
+        "archived_at": archived.archived_at,
+    }
+
+
+def apply_archive(messages: List[Message], plan: ArchivePlan) -> List[Message]:
+    # The snapshot's messages after the plan was written: versions trimmed, branches gone
+    for message, versions, _ in plan:
+        archived = {v.id for v in versions}
+        message.versions = [v for v in message.versions if v.id not in archived]
+        message.archived_versions += len(versions)
+    moved = branch_ids(plan)
+    return [m for m in messages if m.id not in moved]
+
+
+def branch_ids(plan: ArchivePlan) -> Set[ObjectId]:
+    return {m.id for _, _, branches in plan for branch in branches.values() for m in branch}
+
+
+async def find_archived(
+    db: AsyncIOMotorDatabase, conversation_id: ObjectId, message_id: ObjectId, version_id: str
+) -> Optional[dict]:
+    return await db[ARCHIVE_COLLECTION].find_one(
+        {"conversation_id": conversation_id, "message_id": message_id, "version.id": version_id}
+    )
+
+
+async def export_archived(
+    db: AsyncIOMotorDatabase, conversation_id: ObjectId
+) -> List[ArchivedVersion]:
+    # Everything a conversation has in the archive, nested branches included, content decompressed
+    cursor = db[ARCHIVE_COLLECTION].find({"conversation_id": conversation_id})
+    return [
+        ArchivedVersion(**{**document, "version": decode_version(document["version"])})
+        async for document in cursor
+    ]
+
+
+async def get_archived_versions(
+    db: AsyncIOMotorDatabase, conversation_id: ObjectId, message_id: ObjectId
+) -> List[MessageVersion]:
+    cursor = db[ARCHIVE_COLLECTION].find(
+        {"conversation_id": conversation_id, "message_id": message_id}, {"version": 1}
+    )
+    versions = [MessageVersion(**decode_version(document["version"])) async for document in cursor]
+    return sorted(versions, key=lambda v: v.created_at)
+
+
+async def delete_archived(
+    db: AsyncIOMotorDatabase, conversation_id: ObjectId, message_ids: Iterable[ObjectId]
+):
+    # Archived versions of deleted messages, and those of the messages inside their archived
+    # branches
+    message_ids = list(message_ids)
+    while message_ids:
+        query = {"conversation_id": conversation_id, "message_id": {"$in": message_ids}}
+        cursor = db[ARCHIVE_COLLECTION].find(query, {"branch._id": 1})
+        nested = [m["_id"] async for document in cursor for m in document.get("branch", [])]
+        await db[ARCHIVE_COLLECTION].delete_many(query)
+        message_ids = nested
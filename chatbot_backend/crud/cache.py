@@ -0,0 +1,226 @@
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from chatbot_backend.config import settings
+from chatbot_backend.metrics import span
+from chatbot_backend.models import Conversation
+
+# In-process LRU of recently active conversations in front of get_conversation, bounded by entry
+# count, approximate size and TTL. Writes made through CachedConversationCRUD store the updated
+# snapshot (write-through). With CONVERSATION_CACHE_VALIDATE each hit is checked against the
+# stored `revision` with a tiny projection read, so several workers never serve a stale tree.
+# Alternatively, on_change reports every conversation this worker writes, which the app passes on
+# to the other workers (CONVERSATION_CACHE_SHARED_INVALIDATION, see shared.py).
+#
+# Cached snapshots are shared by concurrent requests on the same conversation; CRUD methods only
+# mutate them after the corresponding write has succeeded.
+
+
+def estimate_size(conversation: Conversation) -> int:
+    # Rough in-memory footprint of the model objects, in bytes
+    size = 512
+    for message in conversation.messages:
+        size += 400
+        for version in message.versions:
+            size += 250 + len(version.content) + 100 * len(version.child_messages)
+    return size
+
+
+class ConversationCache:
+    def __init__(self, max_entries: int, max_bytes: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl_seconds
+        # conversation id -> (snapshot, estimated size, expiry)
+        self._entries: "OrderedDict[ObjectId, Tuple[Conversation, int, float]]" = OrderedDict()
+        self.bytes = 0
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "stale": 0, "evictions": 0}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, conversation_id: ObjectId) -> Optional[Conversation]:
+        entry = self._entries.get(conversation_id)
+        if entry is None:
+            return None
+        if entry[2] < time.monotonic():
+            self.invalidate(conversation_id)
+            return None
+        self._entries.move_to_end(conversation_id)
+        return entry[0]
+
+    def put(self, conversation: Conversation, write_through: bool = False):
+        # A write-through only lands if the cache holds this very snapshot (or nothing); a different
+        # cached object is a newer load that this snapshot may be missing writes from
+        current = self._entries.get(conversation.id)
+        self.invalidate(conversation.id)
+        if write_through and current is not None and current[0] is not conversation:
+            return
+        size = estimate_size(conversation)
+        if size > self.max_bytes:
+            return
+        self._entries[conversation.id] = (conversation, size, time.monotonic() + self.ttl)
+        self.bytes += size
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            _, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self.bytes -= evicted_size
+            self.stats["evictions"] += 1
+
+    def invalidate(self, conversation_id: ObjectId):
+        entry = self._entries.pop(conversation_id, None)
+        if entry is not None:
+            self.bytes -= entry[1]
+
+    def invalidate_many(self, conversation_ids):
+        for conversation_id in conversation_ids:
+            self.invalidate(conversation_id)
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+    def snapshot(self) -> Dict[str, float]:
+        lookups = self.stats["hits"] + self.stats["misses"] + self.stats["stale"]
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+        }
+
+
+class CachedConversationCRUD:
+    # Wraps a CRUD backend; everything not overridden here goes straight to the backend
+
+    def __init__(
+        self,
+        crud,
+        cache: ConversationCache,
+        validate: bool = True,
+        on_change: Optional[Callable[[ObjectId], None]] = None,
+    ):
+        self.crud = crud
+        self.cache = cache
+        self.validate = validate
+        self.on_change = on_change
+
+    def _changed(self, conversation_id: ObjectId):
+        if self.on_change is not None:
+            self.on_change(conversation_id)
+
+    def __getattr__(self, name):
+        return getattr(self.crud, name)
+
+    def _write_through(self, conversation_id: ObjectId, conversation: Optional[Conversation]):
+        # No snapshot (or a failed write, or one that deleted every message): just drop the entry
+        self._changed(conversation_id)
+        if conversation is not None and conversation.messages:
+            self.cache.put(conversation, write_through=True)
+        else:
+            self.cache.invalidate(conversation_id)
+
+    def _replace(self, conversation_id: ObjectId, conversation: Optional[Conversation]):
+        # For writes that return a freshly read conversation
+        self._changed(conversation_id)
+        if conversation is not None:
+            self.cache.put(conversation)
+        else:
+            self.cache.invalidate(conversation_id)
+
+    async def get_conversation(
+        self, db: AsyncIOMotorDatabase, conversation_id: ObjectId
+    ) -> Optional[Conversation]:
+        cached = self.cache.get(conversation_id)
+        if cached is not None:
+            if not self.validate:
+                self.cache.stats["hits"] += 1
+                return cached
+            with span("mongo.revision_check"):
+                stamp = await db.conversations.find_one({"_id": conversation_id}, {"revision": 1})
+            if stamp is not None and stamp.get("revision", 0) == cached.revision:
+                self.cache.stats["hits"] += 1
+                return cached
+            self.cache.stats["stale"] += 1
+            self.cache.invalidate(conversation_id)
+            if stamp is None:
+                return None
+        else:
+            self.cache.stats["misses"] += 1
+
+        conversation = await self.crud.get_conversation(db, conversation_id)
+        if conversation is not None:
+            self.cache.put(conversation)
+        return conversation
+
+    async def update_conversation(self, db, conversation_id, update_data):
+        conversation = await self.crud.update_conversation(db, conversation_id, update_data)
+        self._replace(conversation_id, conversation)
+        return conversation
+
+    async def delete_conversation(self, db, conversation_id):
+        self.cache.invalidate(conversation_id)
+        self._changed(conversation_id)
+        return await self.crud.delete_conversation(db, conversation_id)
+
+    async def add_message(self, db, conversation_id, message, conversation=None):
+        added = await self.crud.add_message(db, conversation_id, message, conversation)
+        self._write_through(conversation_id, conversation if added else None)
+        return added
+
+    async def update_message(self, db, conversation_id, message_id, update_data, conversation=None):
+        updated = await self.crud.update_message(
+            db, conversation_id, message_id, update_data, conversation
+        )
+        self._write_through(conversation_id, conversation if updated else None)
+        return updated
+
+    async def delete_message(self, db, conversation_id, message_id, conversation=None):
+        deleted = await self.crud.delete_message(db, conversation_id, message_id, conversation)
+        self._write_through(conversation_id, conversation if deleted else None)
+        return deleted
+
+    async def change_message_version(self, db, conversation_id, message_id, version_id):
+        conversation = await self.crud.change_message_version(
+            db, conversation_id, message_id, version_id
+        )
+        self._replace(conversation_id, conversation)
+        return conversation
+
+    async def archive_versions(self, db, conversation_id, conversation=None, message_ids=None):
+        archived = await self.crud.archive_versions(db, conversation_id, conversation, message_ids)
+        if archived:
+            self._write_through(conversation_id, conversation)
+        return archived
+
+    async def insert_conversations(self, db, conversations, replace=False):
+        inserted = await self.crud.insert_conversations(db, conversations, replace)
+        for conversation in conversations:
+            self.cache.invalidate(conversation.id)
+            self._changed(conversation.id)
+        return inserted
+
+    async def record_context_usage(
+        self,
+        db,
+        conversation_id,
+        prompt_tokens,
+        completion_tokens,
+        summary=None,
+        conversation=None,
+        context=None,
+    ):
+        await self.crud.record_context_usage(
+            db, conversation_id, prompt_tokens, completion_tokens, summary, conversation, context
+        )
+        self._write_through(conversation_id, conversation)
+
+
+conversation_cache = ConversationCache(
+    settings.CONVERSATION_CACHE_MAX_ENTRIES,
+    settings.CONVERSATION_CACHE_MAX_BYTES,
+    settings.CONVERSATION_CACHE_TTL_SECONDS,
+)
@@ -1,12 +1,53 @@
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from bson import ObjectId
-from typing import List, Optional, Set
+from pymongo import ASCENDING, DESCENDING, ReplaceOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
 from datetime import datetime
 
 # Importing our schemas
 from chatbot_backend.schema import ConversationCreate, MessageCreate, MessageUpdate, ConversationUpdate
-from chatbot_backend.models import Conversation, Message, MessageVersion
+from chatbot_backend.models import (
+    ContextSummary,
+    Conversation,
+    ConversationSummary,
+    Message,
+    MessageVersion,
+)
+from chatbot_backend.config import settings
+from chatbot_backend.crud import archive
+from chatbot_backend.crud.tree import build_children_index, collect_descendants, resolve_active_path
+from chatbot_backend.db import indexes
+from chatbot_backend.metrics import instrument_crud
 
+# Attempts at appending a version before giving up with a ConflictError
+VERSION_WRITE_ATTEMPTS = 3
+
+
+class ConflictError(Exception):
+    pass
+
+
+async def bulk_insert(collection, documents: List[dict], replace: bool = False) -> int:
+    # Unordered batch write for imports; returns the number of documents written. Without
+    # `replace`, documents whose _id already exists are skipped (so a batch can be re-run).
+    if not documents:
+        return 0
+    if replace:
+        result = await collection.bulk_write(
+            [ReplaceOne({"_id": d["_id"]}, d, upsert=True) for d in documents], ordered=False
+        )
+        return result.upserted_count + result.matched_count
+    try:
+        result = await collection.insert_many(documents, ordered=False)
+        return len(result.inserted_ids)
+    except BulkWriteError as exc:
+        if any(error["code"] != 11000 for error in exc.details["writeErrors"]):
+            raise
+        return exc.details["nInserted"]
+
+
+@instrument_crud
 class ConversationCRUD:
     @staticmethod
     async def create_conversation(db: AsyncIOMotorDatabase, conversation: ConversationCreate) -> Conversation:
@@ -14,36 +55,49 @@ class ConversationCRUD:
         conversation_dict['created_at'] = datetime.utcnow()
         conversation_dict['updated_at'] = conversation_dict['created_at']
         conversation_dict['messages'] = []
+        conversation_dict['active_path'] = []
+        conversation_dict['revision'] = 0
         result = await db.conversations.insert_one(conversation_dict)
-        return await ConversationCRUD.get_conversation(db, result.inserted_id)
+        conversation_dict['_id'] = result.inserted_id
+        return Conversation.from_db(conversation_dict)
 
     @staticmethod
     async def get_conversation(db: AsyncIOMotorDatabase, conversation_id: ObjectId) -> Optional[Conversation]:
         conversation = await db.conversations.find_one({"_id": conversation_id})
         if conversation:
-            return Conversation(**conversation)
+            return Conversation.from_db(conversation)
         return None
 
     @staticmethod
     async def update_conversation(db: AsyncIOMotorDatabase, conversation_id: ObjectId, update_data: ConversationUpdate) -> Optional[Conversation]:
         update_dict = update_data.dict(exclude_unset=True)
         update_dict['updated_at'] = datetime.utcnow()
-        result = await db.conversations.update_one(
+        conversation = await db.conversations.find_one_and_update(
             {"_id": conversation_id},
-            {"$set": update_dict}
+            {"$set": update_dict, "$inc": {"revision": 1}},
+            return_document=ReturnDocument.AFTER,
         )
-        if result.modified_count:
-            return await ConversationCRUD.get_conversation(db, conversation_id)
+        if conversation:
+            return Conversation.from_db(conversation)
         return None
 
     @staticmethod
     async def delete_conversation(db: AsyncIOMotorDatabase, conversation_id: ObjectId) -> bool:
         result = await db.conversations.delete_one({"_id": conversation_id})
+        await db[archive.ARCHIVE_COLLECTION].delete_many({"conversation_id": conversation_id})
         return result.deleted_count > 0
 
     @staticmethod
-    async def delete_message(db: AsyncIOMotorDatabase, conversation_id: ObjectId, message_id: ObjectId) -> bool:
-        conversation = await ConversationCRUD.get_conversation(db, conversation_id)
+    async def delete_message(
+        db: AsyncIOMotorDatabase,
+        conversation_id: ObjectId,
+        message_id: ObjectId,
+        conversation: Optional[Conversation] = None,
+    ) -> bool:
+        # When a loaded conversation is passed in it is used instead of re-reading and is kept in
+        # sync
+        if conversation is None:
+            conversation = await ConversationCRUD.get_conversation(db, conversation_id)
         if not conversation:
             return False
 
@@ -58,39 +112,65 @@ class ConversationCRUD:
 
         # If we're deleting all messages, delete the entire conversation
         if len(messages_to_delete) == len(conversation.messages):
-            result = await db.conversations.delete_one({"_id": conversation_id})
-            return result.deleted_count > 0
+            deleted = await ConversationCRUD.delete_conversation(db, conversation_id)
+            if deleted:
+                conversation.messages = []
+            return deleted
 
         # Update the parent's child_messages
+        writes = 0
         if message_to_delete.parent_id:
-            await db.conversations.update_one(
+            unlinked = await db.conversations.update_one(
                 {"_id": conversation_id, "messages._id": message_to_delete.parent_id},
-                {"$unset": {f"messages.$.versions.$[ver].child_messages.{str(message_id)}": ""}},
-                array_filters=[{"ver.id": message_to_delete.parent_version}]
+                {
+                    "$unset": {f"messages.$.versions.$[ver].child_messages.{str(message_id)}": ""},
+                    "$inc": {"revision": 1},
+                },
+                array_filters=[{"ver.id": message_to_delete.parent_version}],
             )
+            writes += unlinked.modified_count
 
         # Delete all collected messages
+        now = datetime.utcnow()
+        previous_path = conversation.active_path
+        new_path = ConversationCRUD._path_after_delete(conversation, messages_to_delete)
         result = await db.conversations.update_one(
             {"_id": conversation_id},
             {
                 "$pull": {"messages": {"_id": {"$in": list(messages_to_delete)}}},
-                "$set": {"updated_at": datetime.utcnow()}
-            }
+                "$set": {"updated_at": now},
+                "$inc": {"revision": 1},
+            },
         )
 
+        conversation.revision += writes + result.modified_count
+        if result.modified_count:
+            path_written = await db.conversations.bulk_write(
+                ConversationCRUD._active_path_writes(conversation_id, previous_path, new_path),
+                ordered=True,
+            )
+            conversation.revision += path_written.modified_count
+            await archive.delete_archived(db, conversation_id, messages_to_delete)
+            ConversationCRUD._apply_deleted_messages(
+                conversation, message_to_delete, messages_to_delete, now
+            )
+            conversation.active_path = new_path
         return result.modified_count > 0
 
     @staticmethod
     def _collect_descendant_messages(messages: List[Message], parent_id: ObjectId) -> Set[ObjectId]:
-        descendants = set()
-        for message in messages:
-            if message.parent_id == parent_id:
-                descendants.add(message.id)
-                descendants.update(ConversationCRUD._collect_descendant_messages(messages, message.id))
-        return descendants
+        # O(n): one pass to index children by parent, then an iterative walk of the subtree
+        return collect_descendants(build_children_index(messages), parent_id)
 
     @staticmethod
-    async def add_message(db: AsyncIOMotorDatabase, conversation_id: ObjectId, message: MessageCreate) -> Optional[Message]:
+    async def add_message(
+        db: AsyncIOMotorDatabase,
+        conversation_id: ObjectId,
+        message: MessageCreate,
+        conversation: Optional[Conversation] = None,
+    ) -> Optional[Message]:
+        # When a loaded conversation is passed in, the parent is looked up in it and the new
+        # message is applied to it in memory, so callers never need to re-read the document
         message_dict = message.dict()
         message_dict['_id'] = ObjectId()
         message_dict['current_version'] = "v1"
@@ -104,107 +184,690 @@ class ConversationCRUD:
         ]
 
         # Get the correct parent version
+        parent_message = None
         if message_dict.get('parent_id'):
-            parent_message = await ConversationCRUD._get_message(db, conversation_id, message_dict['parent_id'])
+            if conversation is not None:
+                parent_message = ConversationCRUD._find_message(
+                    conversation, message_dict['parent_id']
+                )
+            else:
+                parent_message = await ConversationCRUD._get_message(
+                    db, conversation_id, message_dict['parent_id']
+                )
             if parent_message:
                 message_dict['parent_version'] = parent_message.current_version
 
-        update_result = await db.conversations.update_one(
-            {"_id": conversation_id},
-            {
-                "$push": {"messages": message_dict},
-                "$set": {"updated_at": datetime.utcnow()}
-            }
+        now = datetime.utcnow()
+        new_message = Message.from_db(message_dict)
+        previous_path = conversation.active_path if conversation is not None else None
+        new_path = (
+            ConversationCRUD._path_after_add(conversation, new_message)
+            if conversation is not None
+            else None
         )
+        # The message and the link from its parent's version go out as one ordered bulk write (the
+        # $push and the array-filter $set can't share an update, but they can share a round trip)
+        operations = [
+            UpdateOne(
+                {"_id": conversation_id},
+                {
+                    "$push": {"messages": message_dict},
+                    "$inc": {"revision": 1},
+                    **ConversationCRUD._with_active_path({"updated_at": now}, new_path),
+                },
+            )
+        ]
+        if message_dict.get('parent_id'):
+            operations.append(
+                ConversationCRUD._parent_link(
+                    conversation_id,
+                    message_dict['parent_id'],
+                    message_dict['parent_version'],
+                    str(message_dict['_id']),
+                )
+            )
+        operations += ConversationCRUD._active_path_writes(conversation_id, previous_path, new_path)
+        result = await db.conversations.bulk_write(operations, ordered=True)
 
-        if update_result.modified_count:
-            if message_dict.get('parent_id'):
-                await ConversationCRUD._update_parent_child_messages(db, conversation_id, message_dict['parent_id'], message_dict['parent_version'], str(message_dict['_id']))
-            return Message(**message_dict)
+        if result.matched_count:
+            if conversation is not None:
+                ConversationCRUD._apply_added_message(
+                    conversation, parent_message, new_message, now
+                )
+                conversation.revision += result.modified_count
+                conversation.active_path = new_path
+            return new_message
         return None
 
     @staticmethod
-    async def update_message(db: AsyncIOMotorDatabase, conversation_id: ObjectId, message_id: ObjectId, update_data: MessageUpdate) -> Optional[Message]:
-        conversation = await ConversationCRUD.get_conversation(db, conversation_id)
-        if not conversation:
+    async def update_message(
+        db: AsyncIOMotorDatabase,
+        conversation_id: ObjectId,
+        message_id: ObjectId,
+        update_data: MessageUpdate,
+        conversation: Optional[Conversation] = None,
+    ) -> Optional[Message]:
+        if conversation is not None:
+            message = ConversationCRUD._find_message(conversation, message_id)
+        else:
+            message = await ConversationCRUD._get_message(db, conversation_id, message_id)
+        if not message:
             return None
 
-        for message in conversation.messages:
-            if message.id == message_id:
-                new_version = f"v{len(message.versions) + 1}"
-                new_version_dict = {
-                    "id": new_version,
-                    "content": update_data.content,
-                    "created_at": datetime.utcnow(),
-                    "child_messages": {}
-                }
+        now = datetime.utcnow()
+        previous_path = conversation.active_path if conversation is not None else None
+        new_path = (
+            ConversationCRUD._path_after_edit(conversation, message_id)
+            if conversation is not None
+            else None
+        )
+        for _ in range(VERSION_WRITE_ATTEMPTS):
+            # Optimistic concurrency: the write only applies if the message still has the number of
+            # versions we numbered from, so concurrent edits can't produce duplicate version ids
+            new_version = f"v{message.archived_versions + len(message.versions) + 1}"
+            new_version_dict = {
+                "id": new_version,
+                "content": update_data.content,
+                "created_at": now,
+                "child_messages": {},
+            }
 
-                update_result = await db.conversations.update_one(
-                    {"_id": conversation_id, "messages._id": message_id},
-                    {
-                        "$push": {"messages.$.versions": new_version_dict},
-                        "$set": {
-                            "messages.$.current_version": new_version,
-                            "updated_at": datetime.utcnow()
+            # Only the edited message is projected back, not the whole conversation
+            updated = await db.conversations.find_one_and_update(
+                {
+                    "_id": conversation_id,
+                    "messages": {
+                        "$elemMatch": {
+                            "_id": message_id,
+                            **ConversationCRUD._version_guard(message),
                         }
-                    }
-                )
+                    },
+                },
+                {
+                    "$push": {"messages.$.versions": new_version_dict},
+                    "$inc": {"revision": 1},
+                    **ConversationCRUD._with_active_path(
+                        {"messages.$.current_version": new_version, "updated_at": now}, new_path
+                    ),
+                },
+                projection={"messages.$": 1},
+                return_document=ReturnDocument.AFTER,
+            )
+            if updated and updated.get("messages"):
+                break
+            # Lost the race (or the message is gone): re-read it and renumber
+            message = await ConversationCRUD._get_message(db, conversation_id, message_id)
+            if not message:
+                return None
+        else:
+            raise ConflictError("Message was edited concurrently; please retry")
+        path_writes = ConversationCRUD._active_path_writes(conversation_id, previous_path, new_path)
+        path_written = (
+            await db.conversations.bulk_write(path_writes, ordered=True) if path_writes else None
+        )
 
-                if update_result.modified_count:
-                    updated_conversation = await ConversationCRUD.get_conversation(db, conversation_id)
-                    for updated_message in updated_conversation.messages:
-                        if updated_message.id == message_id:
-                            return updated_message
-        return None
+        updated_message = Message.from_db(updated["messages"][0])
+        if conversation is not None:
+            conversation.messages = [
+                updated_message if m.id == message_id else m for m in conversation.messages
+            ]
+            conversation.updated_at = now
+            conversation.active_path = new_path
+            conversation.revision += 1 + (path_written.modified_count if path_written else 0)
+        if (
+            settings.VERSION_ARCHIVE_AFTER
+            and len(updated_message.versions) > settings.VERSION_ARCHIVE_AFTER
+        ):
+            await ConversationCRUD.archive_versions(db, conversation_id, conversation, {message_id})
+        return updated_message
+
+    @staticmethod
+    def _version_guard(message: Message) -> dict:
+        # Matches the message only while it holds the versions it was read with (inline and
+        # archived)
+        return {
+            "versions": {"$size": len(message.versions)},
+            "archived_versions": message.archived_versions or {"$in": [0, None]},
+        }
+
+    @staticmethod
+    def _revision_guard(conversation: Conversation) -> dict:
+        # Conversations written before revisions existed have no field yet
+        return {"revision": conversation.revision or {"$in": [0, None]}}
+
+    @staticmethod
+    async def archive_versions(
+        db: AsyncIOMotorDatabase,
+        conversation_id: ObjectId,
+        conversation: Optional[Conversation] = None,
+        message_ids: Optional[Set[ObjectId]] = None,
+    ) -> int:
+        # Moves old versions, and the branches under them, to the archive (see crud/archive.py);
+        # returns the number of versions moved. Nothing moves if the conversation changed meanwhile.
+        if conversation is None:
+            conversation = await ConversationCRUD.get_conversation(db, conversation_id)
+        if not conversation:
+            return 0
+        plan = archive.plan_archive(
+            conversation.messages, settings.VERSION_ARCHIVE_KEEP, message_ids
+        )
+        if not plan:
+            return 0
+        documents = archive.archive_documents(
+            conversation_id, plan, settings.VERSION_ARCHIVE_COMPRESS_BYTES, datetime.utcnow()
+        )
+        # Copies first, so a failure in between never loses a version
+        await db[archive.ARCHIVE_COLLECTION].insert_many(documents)
+        update = {"$set": {}, "$inc": {"revision": 1}}
+        array_filters = []
+        for i, (message, versions, _) in enumerate(plan):
+            archived = {v.id for v in versions}
+            update["$set"][f"messages.$[m{i}].versions"] = [
+                v.dict() for v in message.versions if v.id not in archived
+            ]
+            update["$set"][f"messages.$[m{i}].archived_versions"] = message.archived_versions + len(
+                versions
+            )
+            array_filters.append({f"m{i}._id": message.id})
+        result = await db.conversations.update_one(
+            {"_id": conversation_id, **ConversationCRUD._revision_guard(conversation)},
+            update,
+            array_filters=array_filters,
+        )
+        if not result.modified_count:
+            await db[archive.ARCHIVE_COLLECTION].delete_many(
+                {"_id": {"$in": [d["_id"] for d in documents]}}
+            )
+            return 0
+        writes = 1
+        moved = archive.branch_ids(plan)
+        if moved:
+            # A separate write: $pull on the array can't share an update with $set on its elements
+            pulled = await db.conversations.update_one(
+                {"_id": conversation_id},
+                {"$pull": {"messages": {"_id": {"$in": list(moved)}}}, "$inc": {"revision": 1}},
+            )
+            writes += pulled.modified_count
+        conversation.messages = archive.apply_archive(conversation.messages, plan)
+        conversation.revision += writes
+        return len(documents)
+
+    @staticmethod
+    async def _restore_version(
+        db: AsyncIOMotorDatabase, conversation_id: ObjectId, message_id: ObjectId, version_id: str
+    ) -> bool:
+        # Moves an archived version and its branch back inline; False if it isn't archived.
+        # One write guarded on the revision, retried like update_message.
+        document = await archive.find_archived(db, conversation_id, message_id, version_id)
+        if not document:
+            return False
+        version = MessageVersion(**archive.decode_version(document["version"]))
+        for _ in range(VERSION_WRITE_ATTEMPTS):
+            conversation = await ConversationCRUD.get_conversation(db, conversation_id)
+            message = (
+                ConversationCRUD._find_message(conversation, message_id) if conversation else None
+            )
+            if not message:
+                return False
+            if any(v.id == version_id for v in message.versions):
+                # An interrupted restore already put it back
+                break
+            message.versions = sorted(message.versions + [version], key=lambda v: v.created_at)
+            message.archived_versions = max(message.archived_versions - 1, 0)
+            present = {m.id for m in conversation.messages}
+            messages = [m.dict(by_alias=True) for m in conversation.messages]
+            messages += [m for m in document["branch"] if m["_id"] not in present]
+            result = await db.conversations.update_one(
+                {"_id": conversation_id, **ConversationCRUD._revision_guard(conversation)},
+                {"$set": {"messages": messages}, "$inc": {"revision": 1}},
+            )
+            if result.modified_count:
+                break
+        else:
+            raise ConflictError("Conversation was changed concurrently; please retry")
+        await db[archive.ARCHIVE_COLLECTION].delete_one({"_id": document["_id"]})
+        return True
 
     @staticmethod
-    async def _update_parent_child_messages(db: AsyncIOMotorDatabase, conversation_id: ObjectId, parent_id: ObjectId, parent_version: str, child_id: str):
-        await db.conversations.update_one(
+    async def get_archived_versions(
+        db: AsyncIOMotorDatabase, conversation_id: ObjectId, message_id: ObjectId
+    ) -> List[MessageVersion]:
+        return await archive.get_archived_versions(db, conversation_id, message_id)
+
+    @staticmethod
+    def _parent_link(
+        conversation_id: ObjectId, parent_id: ObjectId, parent_version: str, child_id: str
+    ) -> UpdateOne:
+        return UpdateOne(
             {
                 "_id": conversation_id,
                 "messages._id": parent_id,
-                "messages.versions.id": parent_version
+                "messages.versions.id": parent_version,
             },
             {
-                "$set": {
-                    "messages.$[msg].versions.$[ver].child_messages": {child_id: "v1"}
-                }
+                # Only this child's key, so links to its siblings are kept
+                "$set": {f"messages.$[msg].versions.$[ver].child_messages.{child_id}": "v1"},
+                "$inc": {"revision": 1},
             },
-            array_filters=[
-                {"msg._id": parent_id},
-                {"ver.id": parent_version}
-            ]
+            array_filters=[{"msg._id": parent_id}, {"ver.id": parent_version}],
         )
 
     @staticmethod
     async def _get_message(db: AsyncIOMotorDatabase, conversation_id: ObjectId, message_id: ObjectId) -> Optional[Message]:
-        conversation = await ConversationCRUD.get_conversation(db, conversation_id)
-        if conversation:
-            for message in conversation.messages:
-                if message.id == message_id:
-                    return message
+        # Positional projection returns just the matching message instead of the whole array
+        conversation = await db.conversations.find_one(
+            {"_id": conversation_id, "messages._id": message_id}, {"messages.$": 1}
+        )
+        if conversation and conversation.get("messages"):
+            return Message.from_db(conversation["messages"][0])
         return None
 
+    @staticmethod
+    def _find_message(
+        conversation: Conversation, message_id: Optional[ObjectId]
+    ) -> Optional[Message]:
+        if message_id is None:
+            return None
+        return next((m for m in conversation.messages if m.id == message_id), None)
+
+    # In-memory mirrors of the writes above, used to keep a loaded snapshot in sync
+
+    @staticmethod
+    def _apply_added_message(
+        conversation: Conversation,
+        parent_message: Optional[Message],
+        new_message: Message,
+        now: datetime,
+    ):
+        if parent_message:
+            for version in parent_message.versions:
+                if version.id == new_message.parent_version:
+                    version.child_messages = {**version.child_messages, str(new_message.id): "v1"}
+        conversation.messages.append(new_message)
+        conversation.updated_at = now
+
+    @staticmethod
+    def _apply_deleted_messages(
+        conversation: Conversation, deleted_root: Message, deleted_ids: Set[ObjectId], now: datetime
+    ):
+        parent = ConversationCRUD._find_message(conversation, deleted_root.parent_id)
+        if parent:
+            for version in parent.versions:
+                if version.id == deleted_root.parent_version:
+                    version.child_messages.pop(str(deleted_root.id), None)
+        conversation.messages = [m for m in conversation.messages if m.id not in deleted_ids]
+        conversation.updated_at = now
+
+    # Materialized active path: writes that have a snapshot compute the new path up front and
+    # store it right after the write (_active_path_writes); writes without one clear it in the
+    # same update so readers recompute it
+
+    @staticmethod
+    def _with_active_path(set_fields: dict, active_path: Optional[List[ObjectId]]) -> dict:
+        if active_path is None:
+            return {"$set": set_fields, "$unset": {"active_path": ""}}
+        return {"$set": set_fields}
+
+    @staticmethod
+    def _path_guard(previous: Optional[List[ObjectId]]) -> dict:
+        return {"active_path": {"$exists": False} if previous is None else previous}
+
+    @staticmethod
+    def _active_path_writes(
+        conversation_id: ObjectId,
+        previous: Optional[List[ObjectId]],
+        active_path: Optional[List[ObjectId]],
+    ) -> List[UpdateOne]:
+        # Compare-and-set against the path the snapshot was read with, as _store_active_path does.
+        # If another write moved it meanwhile, our path may be stale, so it's cleared instead.
+        if active_path is None:
+            return []
+        writes = []
+        if active_path != previous:
+            writes.append(
+                UpdateOne(
+                    {"_id": conversation_id, **ConversationCRUD._path_guard(previous)},
+                    {"$set": {"active_path": active_path}, "$inc": {"revision": 1}},
+                )
+            )
+        writes.append(
+            UpdateOne(
+                {"_id": conversation_id, "active_path": {"$exists": True, "$ne": active_path}},
+                {"$unset": {"active_path": ""}, "$inc": {"revision": 1}},
+            )
+        )
+        return writes
+
+    @staticmethod
+    def _active_path_ids(conversation: Conversation) -> List[ObjectId]:
+        if conversation.active_path is None:
+            conversation.active_path = [m.id for m in resolve_active_path(conversation.messages)]
+        return conversation.active_path
+
+    @staticmethod
+    def _path_after_add(conversation: Conversation, new_message: Message) -> List[ObjectId]:
+        # A new message becomes the newest child of its parent's current version, so it's active
+        # whenever its parent is (or it is a new root)
+        path = ConversationCRUD._active_path_ids(conversation)
+        if new_message.parent_id is None:
+            return [new_message.id]
+        if new_message.parent_id in path:
+            return path[: path.index(new_message.parent_id) + 1] + [new_message.id]
+        return list(path)
+
+    @staticmethod
+    def _path_after_edit(conversation: Conversation, message_id: ObjectId) -> List[ObjectId]:
+        # The new version has no replies yet, so an edited active message ends the path
+        path = ConversationCRUD._active_path_ids(conversation)
+        if message_id in path:
+            return path[: path.index(message_id) + 1]
+        return list(path)
+
+    @staticmethod
+    def _path_after_delete(
+        conversation: Conversation, deleted_ids: Set[ObjectId]
+    ) -> List[ObjectId]:
+        remaining = [m for m in conversation.messages if m.id not in deleted_ids]
+        return [m.id for m in resolve_active_path(remaining)]
+
+    @staticmethod
+    def _order_path(path: List[ObjectId], messages: List[Message]) -> Optional[List[Message]]:
+        by_id = {m.id: m for m in messages}
+        if any(message_id not in by_id for message_id in path):
+            return None
+        return [by_id[message_id] for message_id in path]
+
+    @staticmethod
+    async def _store_active_path(
+        db: AsyncIOMotorDatabase, conversation: Conversation, previous: Optional[List[ObjectId]]
+    ) -> List[Message]:
+        # Compare-and-set against the path we read, so a concurrent write's path isn't overwritten
+        path = resolve_active_path(conversation.messages)
+        path_ids = [m.id for m in path]
+        result = await db.conversations.update_one(
+            {"_id": conversation.id, **ConversationCRUD._path_guard(previous)},
+            {"$set": {"active_path": path_ids}, "$inc": {"revision": 1}},
+        )
+        conversation.revision += result.modified_count
+        conversation.active_path = path_ids
+        return path
+
+    @staticmethod
+    async def get_active_thread(
+        db: AsyncIOMotorDatabase, conversation_id: ObjectId
+    ) -> Optional[List[Message]]:
+        # Only the messages on the materialized path leave the server
+        pipeline = [
+            {"$match": {"_id": conversation_id}},
+            {
+                "$project": {
+                    "active_path": 1,
+                    "messages": {
+                        "$filter": {
+                            "input": "$messages",
+                            "as": "m",
+                            "cond": {"$in": ["$$m._id", {"$ifNull": ["$active_path", []]}]},
+                        }
+                    },
+                }
+            },
+        ]
+        stored = None
+        async for doc in db.conversations.aggregate(pipeline):
+            stored = doc.get("active_path")
+            if stored is not None:
+                thread = ConversationCRUD._order_path(
+                    stored, [Message.from_db(m) for m in doc["messages"]]
+                )
+                if thread is not None:
+                    return thread
+            break
+        else:
+            return None
+
+        conversation = await ConversationCRUD.get_conversation(db, conversation_id)
+        if not conversation:
+            return None
+        return await ConversationCRUD._store_active_path(db, conversation, stored)
+
+    @staticmethod
+    async def record_context_usage(
+        db: AsyncIOMotorDatabase,
+        conversation_id: ObjectId,
+        prompt_tokens: int,
+        completion_tokens: int,
+        summary: Optional[ContextSummary] = None,
+        conversation: Optional[Conversation] = None,
+        context: Optional[str] = None,
+    ):
+        # Per-turn token accounting plus the rolling summary, when the context builder changed it,
+        # and the prompt context of the turn (searchable by context)
+        increments = {
+            "token_usage.requests": 1,
+            "token_usage.prompt_tokens": prompt_tokens,
+            "token_usage.completion_tokens": completion_tokens,
+        }
+        update = {
+            "$inc": {**increments, "revision": 1},
+            "$set": {
+                "last_usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "at": datetime.utcnow(),
+                }
+            },
+        }
+        if summary is not None:
+            update["$set"]["context_summary"] = summary.dict()
+        if context is not None:
+            update["$addToSet"] = {"contexts": context}
+        result = await db.conversations.update_one({"_id": conversation_id}, update)
+        if conversation is not None and result.modified_count:
+            usage = dict(conversation.token_usage)
+            for key, value in increments.items():
+                field = key.split(".", 1)[1]
+                usage[field] = usage.get(field, 0) + value
+            conversation.token_usage = usage
+            if summary is not None:
+                conversation.context_summary = summary
+            if context is not None and context not in conversation.contexts:
+                conversation.contexts = conversation.contexts + [context]
+            conversation.revision += 1
+
+    @staticmethod
+    async def ensure_indexes(db: AsyncIOMotorDatabase):
+        # Declared in db/indexes.py
+        await indexes.ensure_indexes(db, ["conversations"])
+
     @staticmethod
     async def get_all_conversations(db: AsyncIOMotorDatabase, skip: int = 0, limit: int = 100) -> List[Conversation]:
         cursor = db.conversations.find().skip(skip).limit(limit)
         conversations = await cursor.to_list(length=limit)
-        return [Conversation(**conv) for conv in conversations]
+        return [Conversation.from_db(conv) for conv in conversations]
+
+    @staticmethod
+    async def iter_conversations(
+        db: AsyncIOMotorDatabase,
+        batch_size: int = 100,
+        after: Optional[ObjectId] = None,
+        updated_since: Optional[datetime] = None,
+    ) -> AsyncIterator[Conversation]:
+        # Streams every conversation in _id order, holding one cursor batch at a time
+        query = {"_id": {"$gt": after}} if after else {}
+        if updated_since:
+            query["updated_at"] = {"$gte": updated_since}
+        async for conversation in db.conversations.find(query, batch_size=batch_size).sort(
+            "_id", ASCENDING
+        ):
+            yield Conversation.from_db(conversation)
 
     @staticmethod
-    async def change_message_version(db: AsyncIOMotorDatabase, conversation_id: ObjectId, message_id: ObjectId, version_id: str) -> Optional[Conversation]:
-        update_result = await db.conversations.update_one(
-            {"_id": conversation_id, "messages._id": message_id},
+    async def insert_conversations(
+        db: AsyncIOMotorDatabase, conversations: List[Conversation], replace: bool = False
+    ) -> int:
+        return await bulk_insert(
+            db.conversations, [c.dict(by_alias=True) for c in conversations], replace
+        )
+
+    @staticmethod
+    async def get_messages_by_ids(
+        db: AsyncIOMotorDatabase, conversation_ids: List[ObjectId], message_ids: List[ObjectId]
+    ) -> Dict[ObjectId, Message]:
+        # The given messages that still exist, by id, in one round trip
+        pipeline = [
+            {"$match": {"_id": {"$in": conversation_ids}}},
             {
-                "$set": {
-                    "messages.$.current_version": version_id,
-                    "updated_at": datetime.utcnow()
+                "$project": {
+                    "messages": {
+                        "$filter": {
+                            "input": "$messages",
+                            "as": "m",
+                            "cond": {"$in": ["$$m._id", message_ids]},
+                        }
+                    }
                 }
+            },
+        ]
+        found = {}
+        async for conversation in db.conversations.aggregate(pipeline):
+            for message in conversation.get("messages", []):
+                found[message["_id"]] = Message.from_db(message)
+        return found
+
+    @staticmethod
+    async def search_messages(
+        db: AsyncIOMotorDatabase,
+        text: str,
+        limit: int,
+        context: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> List[Tuple[ConversationSummary, Message, float]]:
+        # Text index search (see db/indexes.py); the index covers whole conversations here, so every
+        # message of the best `limit` conversations comes back with the conversation's score and
+        # the caller picks out the matching versions
+        query = {"$text": {"$search": text}}
+        if context:
+            query["contexts"] = context
+        if since:
+            query["updated_at"] = {"$gte": since}
+        if until:
+            query["created_at"] = {"$lte": until}
+        score = {"$meta": "textScore"}
+        cursor = (
+            db.conversations.find(
+                query, {"score": score, "title": 1, "created_at": 1, "updated_at": 1, "messages": 1}
+            )
+            .sort([("score", score)])
+            .limit(limit)
+        )
+        results = []
+        async for document in cursor:
+            summary = ConversationSummary.from_db(document)
+            results.extend(
+                (summary, Message.from_db(m), document["score"])
+                for m in document.get("messages", [])
+            )
+        return results
+
+    @staticmethod
+    async def list_conversations(
+        db: AsyncIOMotorDatabase, limit: int, before: Optional[Tuple[datetime, ObjectId]] = None
+    ) -> List[ConversationSummary]:
+        # Keyset pagination, newest first; `before` is the (updated_at, _id) of the last item
+        # already seen
+        query = {}
+        if before:
+            updated_at, conversation_id = before
+            query = {
+                "$or": [
+                    {"updated_at": {"$lt": updated_at}},
+                    {"updated_at": updated_at, "_id": {"$lt": conversation_id}},
+                ]
             }
+        cursor = (
+            db.conversations.find(query, {"messages": 0})
+            .sort([("updated_at", DESCENDING), ("_id", DESCENDING)])
+            .limit(limit)
         )
+        return [ConversationSummary.from_db(conv) async for conv in cursor]
 
-        if update_result.modified_count:
-            return await ConversationCRUD.get_conversation(db, conversation_id)
+    @staticmethod
+    async def get_messages_page(
+        db: AsyncIOMotorDatabase,
+        conversation_id: ObjectId,
+        limit: int,
+        after: Optional[ObjectId] = None,
+    ) -> Optional[List[Message]]:
+        # Messages in array (insertion) order, starting after the `after` message; None if the
+        # conversation doesn't exist. Ids don't follow insertion order across processes, so the
+        # cursor is located by position; if its message was deleted meanwhile, paging continues
+        # with the messages whose ids sort after it.
+        messages = {"$slice": ["$messages", limit]}
+        if after:
+            messages = {
+                "$let": {
+                    "vars": {"position": {"$indexOfArray": ["$messages._id", after]}},
+                    "in": {
+                        "$cond": [
+                            {"$gte": ["$$position", 0]},
+                            {"$slice": ["$messages", {"$add": ["$$position", 1]}, limit]},
+                            {
+                                "$slice": [
+                                    {
+                                        "$filter": {
+                                            "input": "$messages",
+                                            "as": "m",
+                                            "cond": {"$gt": ["$$m._id", after]},
+                                        }
+                                    },
+                                    limit,
+                                ]
+                            },
+                        ]
+                    },
+                }
+            }
+        pipeline = [{"$match": {"_id": conversation_id}}, {"$project": {"messages": messages}}]
+        async for conversation in db.conversations.aggregate(pipeline):
+            return [Message.from_db(message) for message in conversation.get("messages", [])]
         return None
 
-crud_conversation = ConversationCRUD()
\ No newline at end of file
+    @staticmethod
+    async def change_message_version(
+        db: AsyncIOMotorDatabase, conversation_id: ObjectId, message_id: ObjectId, version_id: str
+    ) -> Optional[Conversation]:
+        # Only switch to a version the message actually has
+        query = {
+            "_id": conversation_id,
+            "messages": {"$elemMatch": {"_id": message_id, "versions.id": version_id}},
+        }
+        update = {
+            "$set": {"messages.$.current_version": version_id, "updated_at": datetime.utcnow()},
+            "$inc": {"revision": 1},
+        }
+        conversation = await db.conversations.find_one_and_update(
+            query, update, return_document=ReturnDocument.AFTER
+        )
+        if not conversation and await ConversationCRUD._restore_version(
+            db, conversation_id, message_id, version_id
+        ):
+            # It was archived and is inline again
+            conversation = await db.conversations.find_one_and_update(
+                query, update, return_document=ReturnDocument.AFTER
+            )
+
+        if conversation:
+            conversation = Conversation.from_db(conversation)
+            path = [m.id for m in resolve_active_path(conversation.messages)]
+            if path != conversation.active_path:
+                result = await db.conversations.bulk_write(
+                    ConversationCRUD._active_path_writes(
+                        conversation_id, conversation.active_path, path
+                    ),
+                    ordered=True,
+                )
+                conversation.revision += result.modified_count
+                conversation.active_path = path
+            return conversation
+        return None
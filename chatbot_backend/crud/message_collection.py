@@ -0,0 +1,647 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from bson import ObjectId
+from pymongo import ASCENDING, InsertOne, ReturnDocument, UpdateOne
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+from datetime import datetime
+
+from chatbot_backend.schema import (
+    ConversationCreate,
+    MessageCreate,
+    MessageUpdate,
+    ConversationUpdate,
+)
+from chatbot_backend.models import Conversation, ConversationSummary, Message
+from chatbot_backend.config import settings
+from chatbot_backend.crud import archive
+from chatbot_backend.crud.conversation import (
+    VERSION_WRITE_ATTEMPTS,
+    ConflictError,
+    ConversationCRUD,
+    bulk_insert,
+)
+from chatbot_backend.crud.tree import resolve_active_path
+from chatbot_backend.db import indexes
+from chatbot_backend.metrics import instrument_crud
+
+
+# Stores each message as its own document in `messages` (keyed by conversation_id) so a turn
+# writes a few small documents instead of rewriting an ever-growing embedded array.
+# Same interface and return shapes as ConversationCRUD.
+@instrument_crud
+class MessageCollectionCRUD(ConversationCRUD):
+    @staticmethod
+    async def ensure_indexes(db: AsyncIOMotorDatabase):
+        # Declared in db/indexes.py
+        await indexes.ensure_indexes(db, ["conversations", "messages"])
+
+    @staticmethod
+    async def _load_messages(db: AsyncIOMotorDatabase, conversation_id: ObjectId) -> List[Message]:
+        cursor = db.messages.find({"conversation_id": conversation_id}).sort(
+            [("created_at", ASCENDING), ("_id", ASCENDING)]
+        )
+        return [Message.from_db(message) async for message in cursor]
+
+    @staticmethod
+    async def _touch(
+        db: AsyncIOMotorDatabase,
+        conversation_id: ObjectId,
+        now: datetime,
+        active_path: Optional[List[ObjectId]] = None,
+        previous_path: Optional[List[ObjectId]] = None,
+    ):
+        # Every message write ends with this, so the conversation's revision moves after the
+        # messages have changed and a reader never pairs the new revision with old messages.
+        # The new path is compare-and-set against the one the snapshot was read with.
+        operations = [
+            UpdateOne(
+                {"_id": conversation_id},
+                {
+                    **MessageCollectionCRUD._with_active_path({"updated_at": now}, active_path),
+                    "$inc": {"revision": 1},
+                },
+            )
+        ]
+        operations += MessageCollectionCRUD._active_path_writes(
+            conversation_id, previous_path, active_path
+        )
+        return await db.conversations.bulk_write(operations, ordered=True)
+
+    @staticmethod
+    async def create_conversation(
+        db: AsyncIOMotorDatabase, conversation: ConversationCreate
+    ) -> Conversation:
+        conversation_dict = conversation.dict()
+        conversation_dict["created_at"] = datetime.utcnow()
+        conversation_dict["updated_at"] = conversation_dict["created_at"]
+        conversation_dict["active_path"] = []
+        conversation_dict["revision"] = 0
+        result = await db.conversations.insert_one(conversation_dict)
+        conversation_dict["_id"] = result.inserted_id
+        return Conversation.from_db({**conversation_dict, "messages": []})
+
+    @staticmethod
+    async def get_conversation(
+        db: AsyncIOMotorDatabase, conversation_id: ObjectId
+    ) -> Optional[Conversation]:
+        conversation = await db.conversations.find_one({"_id": conversation_id}, {"messages": 0})
+        if conversation:
+            conversation["messages"] = await MessageCollectionCRUD._load_messages(
+                db, conversation_id
+            )
+            return Conversation.from_db(conversation)
+        return None
+
+    @staticmethod
+    async def update_conversation(
+        db: AsyncIOMotorDatabase, conversation_id: ObjectId, update_data: ConversationUpdate
+    ) -> Optional[Conversation]:
+        update_dict = update_data.dict(exclude_unset=True)
+        update_dict["updated_at"] = datetime.utcnow()
+        result = await db.conversations.update_one(
+            {"_id": conversation_id}, {"$set": update_dict, "$inc": {"revision": 1}}
+        )
+        if result.matched_count:
+            return await MessageCollectionCRUD.get_conversation(db, conversation_id)
+        return None
+
+    @staticmethod
+    async def delete_conversation(db: AsyncIOMotorDatabase, conversation_id: ObjectId) -> bool:
+        result = await db.conversations.delete_one({"_id": conversation_id})
+        await db.messages.delete_many({"conversation_id": conversation_id})
+        await db[archive.ARCHIVE_COLLECTION].delete_many({"conversation_id": conversation_id})
+        return result.deleted_count > 0
+
+    @staticmethod
+    async def delete_message(
+        db: AsyncIOMotorDatabase,
+        conversation_id: ObjectId,
+        message_id: ObjectId,
+        conversation: Optional[Conversation] = None,
+    ) -> bool:
+        if conversation is None:
+            conversation = await MessageCollectionCRUD.get_conversation(db, conversation_id)
+        if not conversation:
+            return False
+
+        message_to_delete = MessageCollectionCRUD._find_message(conversation, message_id)
+        if not message_to_delete:
+            return False
+
+        messages_to_delete = MessageCollectionCRUD._collect_descendant_messages(
+            conversation.messages, message_id
+        )
+        messages_to_delete.add(message_id)
+
+        # If we're deleting all messages, delete the entire conversation
+        if len(messages_to_delete) == len(conversation.messages):
+            deleted = await MessageCollectionCRUD.delete_conversation(db, conversation_id)
+            if deleted:
+                conversation.messages = []
+            return deleted
+
+        if message_to_delete.parent_id:
+            await db.messages.update_one(
+                {"_id": message_to_delete.parent_id, "conversation_id": conversation_id},
+                {"$unset": {f"versions.$[ver].child_messages.{str(message_id)}": ""}},
+                array_filters=[{"ver.id": message_to_delete.parent_version}],
+            )
+
+        now = datetime.utcnow()
+        result = await db.messages.delete_many(
+            {"conversation_id": conversation_id, "_id": {"$in": list(messages_to_delete)}}
+        )
+        if result.deleted_count:
+            await archive.delete_archived(db, conversation_id, messages_to_delete)
+            new_path = MessageCollectionCRUD._path_after_delete(conversation, messages_to_delete)
+            touched = await MessageCollectionCRUD._touch(
+                db, conversation_id, now, new_path, conversation.active_path
+            )
+            conversation.revision += touched.modified_count
+            MessageCollectionCRUD._apply_deleted_messages(
+                conversation, message_to_delete, messages_to_delete, now
+            )
+            conversation.active_path = new_path
+        return result.deleted_count > 0
+
+    @staticmethod
+    async def add_message(
+        db: AsyncIOMotorDatabase,
+        conversation_id: ObjectId,
+        message: MessageCreate,
+        conversation: Optional[Conversation] = None,
+    ) -> Optional[Message]:
+        now = datetime.utcnow()
+        message_dict = message.dict()
+        message_dict["_id"] = ObjectId()
+        message_dict["conversation_id"] = conversation_id
+        message_dict["created_at"] = now
+        message_dict["current_version"] = "v1"
+        message_dict["versions"] = [
+            {
+                "id": "v1",
+                "content": message_dict.pop("content"),
+                "created_at": now,
+                "child_messages": {},
+            }
+        ]
+
+        parent_message = None
+        if message_dict.get("parent_id"):
+            if conversation is not None:
+                parent_message = MessageCollectionCRUD._find_message(
+                    conversation, message_dict["parent_id"]
+                )
+            else:
+                parent_message = await MessageCollectionCRUD._get_message(
+                    db, conversation_id, message_dict["parent_id"]
+                )
+            if parent_message:
+                message_dict["parent_version"] = parent_message.current_version
+
+        new_message = Message.from_db(message_dict)
+        previous_path = conversation.active_path if conversation is not None else None
+        new_path = (
+            MessageCollectionCRUD._path_after_add(conversation, new_message)
+            if conversation is not None
+            else None
+        )
+
+        # One round trip for the message and its parent's link
+        operations = [InsertOne(message_dict)]
+        if message_dict.get("parent_id"):
+            operations.append(
+                MessageCollectionCRUD._parent_link(
+                    conversation_id,
+                    message_dict["parent_id"],
+                    message_dict["parent_version"],
+                    str(message_dict["_id"]),
+                )
+            )
+        await db.messages.bulk_write(operations, ordered=True)
+
+        # Mirror the embedded backend, which fails the write for a conversation that doesn't exist
+        touched = await MessageCollectionCRUD._touch(
+            db, conversation_id, now, new_path, previous_path
+        )
+        if not touched.matched_count:
+            await db.messages.delete_one({"_id": message_dict["_id"]})
+            return None
+        if conversation is not None:
+            MessageCollectionCRUD._apply_added_message(
+                conversation, parent_message, new_message, now
+            )
+            conversation.active_path = new_path
+            conversation.revision += touched.modified_count
+        return new_message
+
+    @staticmethod
+    async def update_message(
+        db: AsyncIOMotorDatabase,
+        conversation_id: ObjectId,
+        message_id: ObjectId,
+        update_data: MessageUpdate,
+        conversation: Optional[Conversation] = None,
+    ) -> Optional[Message]:
+        if conversation is not None:
+            message = MessageCollectionCRUD._find_message(conversation, message_id)
+        else:
+            message = await MessageCollectionCRUD._get_message(db, conversation_id, message_id)
+        if not message:
+            return None
+
+        now = datetime.utcnow()
+        for _ in range(VERSION_WRITE_ATTEMPTS):
+            # Numbered from the versions we read; applies only if nobody appended one meanwhile
+            new_version = f"v{message.archived_versions + len(message.versions) + 1}"
+            updated = await db.messages.find_one_and_update(
+                {
+                    "_id": message_id,
+                    "conversation_id": conversation_id,
+                    **MessageCollectionCRUD._version_guard(message),
+                },
+                {
+                    "$push": {
+                        "versions": {
+                            "id": new_version,
+                            "content": update_data.content,
+                            "created_at": now,
+                            "child_messages": {},
+                        }
+                    },
+                    "$set": {"current_version": new_version},
+                },
+                return_document=ReturnDocument.AFTER,
+            )
+            if updated:
+                break
+            message = await MessageCollectionCRUD._get_message(db, conversation_id, message_id)
+            if not message:
+                return None
+        else:
+            raise ConflictError("Message was edited concurrently; please retry")
+        previous_path = conversation.active_path if conversation is not None else None
+        new_path = (
+            MessageCollectionCRUD._path_after_edit(conversation, message_id)
+            if conversation is not None
+            else None
+        )
+        touched = await MessageCollectionCRUD._touch(
+            db, conversation_id, now, new_path, previous_path
+        )
+
+        updated_message = Message.from_db(updated)
+        if conversation is not None:
+            conversation.messages = [
+                updated_message if m.id == message_id else m for m in conversation.messages
+            ]
+            conversation.updated_at = now
+            conversation.active_path = new_path
+            conversation.revision += touched.modified_count
+        if (
+            settings.VERSION_ARCHIVE_AFTER
+            and len(updated_message.versions) > settings.VERSION_ARCHIVE_AFTER
+        ):
+            await MessageCollectionCRUD.archive_versions(
+                db, conversation_id, conversation, {message_id}
+            )
+        return updated_message
+
+    @staticmethod
+    async def archive_versions(
+        db: AsyncIOMotorDatabase,
+        conversation_id: ObjectId,
+        conversation: Optional[Conversation] = None,
+        message_ids: Optional[Set[ObjectId]] = None,
+    ) -> int:
+        # Each message is trimmed on its own, guarded by the versions it was planned from
+        messages = (
+            conversation.messages
+            if conversation is not None
+            else await MessageCollectionCRUD._load_messages(db, conversation_id)
+        )
+        plan = archive.plan_archive(messages, settings.VERSION_ARCHIVE_KEEP, message_ids)
+        if not plan:
+            return 0
+        now = datetime.utcnow()
+        archived = 0
+        applied = []
+        for entry in plan:
+            message, versions, _ = entry
+            documents = archive.archive_documents(
+                conversation_id, [entry], settings.VERSION_ARCHIVE_COMPRESS_BYTES, now
+            )
+            await db[archive.ARCHIVE_COLLECTION].insert_many(documents)
+            moved = {v.id for v in versions}
+            result = await db.messages.update_one(
+                {
+                    "_id": message.id,
+                    "conversation_id": conversation_id,
+                    **MessageCollectionCRUD._version_guard(message),
+                },
+                {
+                    "$set": {"versions": [v.dict() for v in message.versions if v.id not in moved]},
+                    "$inc": {"archived_versions": len(versions)},
+                },
+            )
+            if not result.modified_count:
+                await db[archive.ARCHIVE_COLLECTION].delete_many(
+                    {"_id": {"$in": [d["_id"] for d in documents]}}
+                )
+                continue
+            branch = archive.branch_ids([entry])
+            if branch:
+                await db.messages.delete_many(
+                    {"conversation_id": conversation_id, "_id": {"$in": list(branch)}}
+                )
+            applied.append(entry)
+            archived += len(documents)
+        if applied:
+            # Not user activity: the revision moves (so caches reload) but updated_at stays
+            touched = await db.conversations.update_one(
+                {"_id": conversation_id}, {"$inc": {"revision": 1}}
+            )
+            if conversation is not None:
+                conversation.messages = archive.apply_archive(conversation.messages, applied)
+                conversation.revision += touched.modified_count
+        return archived
+
+    @staticmethod
+    async def _restore_version(
+        db: AsyncIOMotorDatabase, conversation_id: ObjectId, message_id: ObjectId, version_id: str
+    ) -> bool:
+        document = await archive.find_archived(db, conversation_id, message_id, version_id)
+        if not document:
+            return False
+        branch = []
+        for message in document["branch"]:
+            message["conversation_id"] = conversation_id
+            message["created_at"] = message["versions"][0]["created_at"]
+            branch.append(message)
+        # Messages already back from an interrupted restore are skipped. Until the version is inline
+        # again the branch hangs off a version the message doesn't have, so it's on no path.
+        await bulk_insert(db.messages, branch)
+        version = archive.decode_version(document["version"])
+        restored = None
+        for _ in range(VERSION_WRITE_ATTEMPTS):
+            message = await MessageCollectionCRUD._get_message(db, conversation_id, message_id)
+            if not message:
+                restored = False
+                break
+            if any(v.id == version_id for v in message.versions):
+                restored = True
+                break
+            result = await db.messages.update_one(
+                {
+                    "_id": message_id,
+                    "conversation_id": conversation_id,
+                    **ConversationCRUD._version_guard(message),
+                },
+                {
+                    "$push": {"versions": {"$each": [version], "$sort": {"created_at": 1}}},
+                    "$inc": {"archived_versions": -1},
+                },
+            )
+            if result.modified_count:
+                restored = True
+                break
+        if not restored:
+            # The archive keeps the branch until a restore goes through
+            await db.messages.delete_many({"_id": {"$in": [m["_id"] for m in branch]}})
+            if restored is None:
+                raise ConflictError("Message was changed concurrently; please retry")
+            return False
+        await db[archive.ARCHIVE_COLLECTION].delete_one({"_id": document["_id"]})
+        return True
+
+    @staticmethod
+    def _parent_link(
+        conversation_id: ObjectId, parent_id: ObjectId, parent_version: str, child_id: str
+    ) -> UpdateOne:
+        return UpdateOne(
+            {"_id": parent_id, "conversation_id": conversation_id},
+            {"$set": {f"versions.$[ver].child_messages.{child_id}": "v1"}},
+            array_filters=[{"ver.id": parent_version}],
+        )
+
+    @staticmethod
+    async def _get_message(
+        db: AsyncIOMotorDatabase, conversation_id: ObjectId, message_id: ObjectId
+    ) -> Optional[Message]:
+        message = await db.messages.find_one(
+            {"_id": message_id, "conversation_id": conversation_id}
+        )
+        if message:
+            return Message.from_db(message)
+        return None
+
+    @staticmethod
+    async def get_all_conversations(
+        db: AsyncIOMotorDatabase, skip: int = 0, limit: int = 100
+    ) -> List[Conversation]:
+        cursor = db.conversations.find({}, {"messages": 0}).skip(skip).limit(limit)
+        conversations = await cursor.to_list(length=limit)
+        for conv in conversations:
+            conv["messages"] = await MessageCollectionCRUD._load_messages(db, conv["_id"])
+        return [Conversation.from_db(conv) for conv in conversations]
+
+    @staticmethod
+    async def iter_conversations(
+        db: AsyncIOMotorDatabase,
+        batch_size: int = 100,
+        after: Optional[ObjectId] = None,
+        updated_since: Optional[datetime] = None,
+    ) -> AsyncIterator[Conversation]:
+        # Merge join of two cursors sorted the same way (conversations by _id, messages by
+        # conversation_id, _id), so memory stays at one conversation however many are exported
+        query = {"_id": {"$gt": after}} if after else {}
+        if updated_since:
+            # Usually a few recently active conversations: load their messages one by one
+            query["updated_at"] = {"$gte": updated_since}
+            async for conversation in db.conversations.find(
+                query, {"messages": 0}, batch_size=batch_size
+            ).sort("_id", ASCENDING):
+                conversation["messages"] = await MessageCollectionCRUD._load_messages(
+                    db, conversation["_id"]
+                )
+                yield Conversation.from_db(conversation)
+            return
+        message_query = {"conversation_id": {"$gt": after}} if after else {}
+        conversations = db.conversations.find(query, {"messages": 0}, batch_size=batch_size).sort(
+            "_id", ASCENDING
+        )
+        messages = (
+            db.messages.find(message_query, batch_size=batch_size * 10)
+            .sort([("conversation_id", ASCENDING), ("_id", ASCENDING)])
+            .__aiter__()
+        )
+        pending = await anext(messages, None)
+        async for conversation in conversations:
+            items = []
+            # Messages of conversations that no longer exist are skipped
+            while pending is not None and pending["conversation_id"] <= conversation["_id"]:
+                if pending["conversation_id"] == conversation["_id"]:
+                    items.append(Message.from_db(pending))
+                pending = await anext(messages, None)
+            conversation["messages"] = items
+            yield Conversation.from_db(conversation)
+
+    @staticmethod
+    async def insert_conversations(
+        db: AsyncIOMotorDatabase, conversations: List[Conversation], replace: bool = False
+    ) -> int:
+        if not replace:
+            # Existing conversations are left untouched, including their messages
+            existing = {
+                c["_id"]
+                async for c in db.conversations.find(
+                    {"_id": {"$in": [c.id for c in conversations]}}, {"_id": 1}
+                )
+            }
+            conversations = [c for c in conversations if c.id not in existing]
+        conversation_documents = []
+        message_documents = []
+        for conversation in conversations:
+            document = conversation.dict(by_alias=True)
+            for message in document.pop("messages"):
+                message["conversation_id"] = conversation.id
+                message["created_at"] = (
+                    message["versions"][0]["created_at"]
+                    if message["versions"]
+                    else conversation.created_at
+                )
+                message_documents.append(message)
+            conversation_documents.append(document)
+        if replace:
+            # Replaced conversations get exactly the imported messages
+            await db.messages.delete_many(
+                {"conversation_id": {"$in": [c.id for c in conversations]}}
+            )
+        # Messages first: a conversation only shows up once all of its messages are written
+        await bulk_insert(db.messages, message_documents, replace)
+        return await bulk_insert(db.conversations, conversation_documents, replace)
+
+    @staticmethod
+    async def get_messages_by_ids(
+        db: AsyncIOMotorDatabase, conversation_ids: List[ObjectId], message_ids: List[ObjectId]
+    ) -> Dict[ObjectId, Message]:
+        cursor = db.messages.find(
+            {"_id": {"$in": message_ids}, "conversation_id": {"$in": conversation_ids}}
+        )
+        return {message["_id"]: Message.from_db(message) async for message in cursor}
+
+    @staticmethod
+    async def search_messages(
+        db: AsyncIOMotorDatabase,
+        text: str,
+        limit: int,
+        context: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> List[Tuple[ConversationSummary, Message, float]]:
+        # Text index on the messages themselves, so each hit has its own score. The context lives
+        # on the conversation, so with a context filter more messages are read and the rest dropped.
+        query = {"$text": {"$search": text}}
+        if until:
+            query["created_at"] = {"$lte": until}
+        score = {"$meta": "textScore"}
+        cursor = (
+            db.messages.find(query, {"score": score})
+            .sort([("score", score)])
+            .limit(limit * 4 if context else limit)
+        )
+        documents = [document async for document in cursor]
+        conversation_query = {"_id": {"$in": list({d["conversation_id"] for d in documents})}}
+        if context:
+            conversation_query["contexts"] = context
+        if since:
+            conversation_query["updated_at"] = {"$gte": since}
+        summaries = {
+            c["_id"]: ConversationSummary.from_db(c)
+            async for c in db.conversations.find(
+                conversation_query, {"title": 1, "created_at": 1, "updated_at": 1}
+            )
+        }
+        results = [
+            (summaries[d["conversation_id"]], Message.from_db(d), d["score"])
+            for d in documents
+            if d["conversation_id"] in summaries
+        ]
+        return results[:limit]
+
+    @staticmethod
+    async def get_messages_page(
+        db: AsyncIOMotorDatabase,
+        conversation_id: ObjectId,
+        limit: int,
+        after: Optional[ObjectId] = None,
+    ) -> Optional[List[Message]]:
+        # Messages in the order _load_messages returns them, (created_at, _id), starting after the
+        # `after` message; None if the conversation doesn't exist. Imported and migrated messages
+        # don't have ids in created_at order, so the keyset is on both fields. If the cursor
+        # message was deleted meanwhile, paging continues with the messages whose ids sort after it.
+        if not await db.conversations.find_one({"_id": conversation_id}, {"_id": 1}):
+            return None
+        query = {"conversation_id": conversation_id}
+        if after:
+            previous = await db.messages.find_one(
+                {"_id": after, "conversation_id": conversation_id}, {"created_at": 1}
+            )
+            if previous:
+                query["$or"] = [
+                    {"created_at": {"$gt": previous["created_at"]}},
+                    {"created_at": previous["created_at"], "_id": {"$gt": after}},
+                ]
+            else:
+                query["_id"] = {"$gt": after}
+        cursor = (
+            db.messages.find(query)
+            .sort([("created_at", ASCENDING), ("_id", ASCENDING)])
+            .limit(limit)
+        )
+        return [Message.from_db(message) async for message in cursor]
+
+    @staticmethod
+    async def change_message_version(
+        db: AsyncIOMotorDatabase, conversation_id: ObjectId, message_id: ObjectId, version_id: str
+    ) -> Optional[Conversation]:
+        query = {"_id": message_id, "conversation_id": conversation_id, "versions.id": version_id}
+        result = await db.messages.update_one(query, {"$set": {"current_version": version_id}})
+        if not result.matched_count and await MessageCollectionCRUD._restore_version(
+            db, conversation_id, message_id, version_id
+        ):
+            # It was archived and is inline again
+            result = await db.messages.update_one(query, {"$set": {"current_version": version_id}})
+        if not result.matched_count:
+            return None
+        conversation = await MessageCollectionCRUD.get_conversation(db, conversation_id)
+        if conversation:
+            now = datetime.utcnow()
+            path = [m.id for m in resolve_active_path(conversation.messages)]
+            touched = await MessageCollectionCRUD._touch(
+                db, conversation_id, now, path, conversation.active_path
+            )
+            conversation.revision += touched.modified_count
+            conversation.updated_at = now
+            conversation.active_path = path
+        return conversation
+
+    @staticmethod
+    async def get_active_thread(
+        db: AsyncIOMotorDatabase, conversation_id: ObjectId
+    ) -> Optional[List[Message]]:
+        conversation = await db.conversations.find_one({"_id": conversation_id}, {"active_path": 1})
+        if not conversation:
+            return None
+        stored = conversation.get("active_path")
+        if stored is not None:
+            cursor = db.messages.find({"conversation_id": conversation_id, "_id": {"$in": stored}})
+            thread = MessageCollectionCRUD._order_path(
+                stored, [Message.from_db(m) async for m in cursor]
+            )
+            if thread is not None:
+                return thread
+
+        conversation = await MessageCollectionCRUD.get_conversation(db, conversation_id)
+        if not conversation:
+            return None
+        return await MessageCollectionCRUD._store_active_path(db, conversation, stored)
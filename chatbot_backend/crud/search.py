@@ -0,0 +1,55 @@
+from bson import ObjectId
+
+from chatbot_backend.search import MessageIndexer
+
+# Keeps the search index in step with message writes made through the wrapped CRUD backend.
+# Everything not overridden here goes straight to the backend. Deletes without a loaded snapshot
+# don't know the removed subtree; those rows are dropped the first time a search finds them gone.
+
+
+class SearchIndexedCRUD:
+    def __init__(self, crud, indexer: MessageIndexer):
+        self.crud = crud
+        self.indexer = indexer
+
+    def __getattr__(self, name):
+        return getattr(self.crud, name)
+
+    async def add_message(self, db, conversation_id, message, conversation=None):
+        added = await self.crud.add_message(db, conversation_id, message, conversation)
+        if added:
+            self.indexer.add_messages(conversation_id, [added])
+        return added
+
+    async def update_message(self, db, conversation_id, message_id, update_data, conversation=None):
+        updated = await self.crud.update_message(
+            db, conversation_id, message_id, update_data, conversation
+        )
+        if updated:
+            self.indexer.add_messages(conversation_id, [updated])
+        return updated
+
+    async def delete_message(self, db, conversation_id, message_id, conversation=None):
+        removed = None
+        if conversation is not None:
+            removed = self.crud._collect_descendant_messages(conversation.messages, message_id) | {
+                message_id
+            }
+        deleted = await self.crud.delete_message(db, conversation_id, message_id, conversation)
+        if deleted and removed:
+            self.indexer.remove_messages(removed)
+        return deleted
+
+    async def delete_conversation(self, db, conversation_id: ObjectId):
+        deleted = await self.crud.delete_conversation(db, conversation_id)
+        if deleted:
+            self.indexer.remove_conversation(conversation_id)
+        return deleted
+
+    async def insert_conversations(self, db, conversations, replace=False):
+        inserted = await self.crud.insert_conversations(db, conversations, replace)
+        for conversation in conversations:
+            if replace:
+                self.indexer.remove_conversation(conversation.id)
+            self.indexer.add_messages(conversation.id, conversation.messages)
+        return inserted
@@ -0,0 +1,118 @@
+import asyncio
+import inspect
+import threading
+from concurrent.futures import Future
+from typing import Callable, Iterator, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+
+from chatbot_backend.config import settings
+from chatbot_backend.db.mongodb import client_options
+
+# Blocking access to the same CRUD backend the app uses, for scripts and batch workers that
+# aren't written as coroutines:
+#
+#   from chatbot_backend.crud import sync_crud
+#   conversation = sync_crud.get_conversation(conversation_id)
+#   futures = [sync_crud.submit("add_message", conversation_id, message) for message in messages]
+#
+# Methods take the same arguments as crud_conversation minus the db handle. Calls run on a private
+# event loop in a background thread with its own Motor client, created on first use with the app's
+# pool settings and command/pool listeners, so they share the queries, the mongo.* spans and the
+# metrics. submit() returns a concurrent.futures.Future without waiting, which lets a worker keep
+# many calls in flight over the pool. The wrapped backend is the storage layer itself: the
+# in-process conversation cache and search index belong to the app's loop, and both catch up on
+# writes made elsewhere (revision checks and the periodic index sync).
+
+
+class SyncConversationCRUD:
+    def __init__(self, crud, connect: Optional[Callable[[], AsyncIOMotorDatabase]] = None):
+        self.crud = crud
+        self.connect = connect
+        self.db: Optional[AsyncIOMotorDatabase] = None
+        self._client: Optional[AsyncIOMotorClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        attribute = getattr(self.crud, name)
+        if inspect.isasyncgenfunction(attribute):
+            return lambda *args, **kwargs: self.iterate(name, *args, **kwargs)
+        if inspect.iscoroutinefunction(attribute):
+            return lambda *args, **kwargs: self.call(name, *args, **kwargs)
+        return attribute
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _start(self):
+        with self._lock:
+            if self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="sync-crud", daemon=True)
+            thread.start()
+            self._loop, self._thread = loop, thread
+            # The client binds to the loop it is created on
+            asyncio.run_coroutine_threadsafe(self._open(), loop).result()
+
+    async def _open(self):
+        if self.connect is not None:
+            self.db = self.connect()
+        else:
+            self._client = AsyncIOMotorClient(settings.MONGODB_URL, **client_options())
+            self.db = self._client[settings.DATABASE_NAME]
+
+    def run(self, coro_fn: Callable, *args, **kwargs) -> Future:
+        # Schedules coro_fn(db, *args, **kwargs) on the background loop
+        self._start()
+        return asyncio.run_coroutine_threadsafe(coro_fn(self.db, *args, **kwargs), self._loop)
+
+    def submit(self, name: str, *args, **kwargs) -> Future:
+        return self.run(getattr(self.crud, name), *args, **kwargs)
+
+    def call(self, name: str, *args, **kwargs):
+        self._check_blocking()
+        return self.submit(name, *args, **kwargs).result()
+
+    @staticmethod
+    def _check_blocking():
+        # Waiting here from a coroutine would stall every other task on that loop
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        raise RuntimeError(
+            "Blocking CRUD call from a running event loop; await crud_conversation instead"
+        )
+
+    def iterate(self, name: str, *args, **kwargs) -> Iterator:
+        self._check_blocking()
+        self._start()
+        iterator = getattr(self.crud, name)(self.db, *args, **kwargs).__aiter__()
+        try:
+            while True:
+                try:
+                    yield asyncio.run_coroutine_threadsafe(
+                        iterator.__anext__(), self._loop
+                    ).result()
+                except StopAsyncIteration:
+                    return
+        finally:
+            # Closes the cursor when the caller stops early
+            asyncio.run_coroutine_threadsafe(iterator.aclose(), self._loop).result()
+
+    def close(self):
+        with self._lock:
+            if self._loop is None:
+                return
+            if self._client is not None:
+                self._loop.call_soon_threadsafe(self._client.close)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._loop = self._thread = self._client = self.db = None
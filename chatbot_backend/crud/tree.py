@@ -0,0 +1,68 @@
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set
+
+from bson import ObjectId
+
+from chatbot_backend.models import Message
+
+# Helpers for walking the message tree. Everything is built from a single pass over the
+# messages and walked iteratively, so long linear threads can't hit the recursion limit.
+
+ChildrenIndex = Dict[Optional[ObjectId], List[Message]]
+
+
+def build_children_index(messages: Iterable[Message]) -> ChildrenIndex:
+    children: ChildrenIndex = defaultdict(list)
+    for message in messages:
+        children[message.parent_id].append(message)
+    return children
+
+
+def collect_descendants(children: ChildrenIndex, root_id: ObjectId) -> Set[ObjectId]:
+    descendants = set()
+    stack = [root_id]
+    while stack:
+        for child in children.get(stack.pop(), ()):
+            if child.id not in descendants:
+                descendants.add(child.id)
+                stack.append(child.id)
+    return descendants
+
+
+def current_content(message: Message) -> str:
+    for version in message.versions:
+        if version.id == message.current_version:
+            return version.content
+    return message.versions[-1].content
+
+
+def ancestor_path(messages: List[Message], message_id: ObjectId) -> List[Message]:
+    # The message's ancestors, root first
+    by_id = {m.id: m for m in messages}
+    path = []
+    seen = {message_id}
+    message = by_id.get(message_id)
+    while message is not None and message.parent_id is not None and message.parent_id not in seen:
+        seen.add(message.parent_id)
+        message = by_id.get(message.parent_id)
+        if message is not None:
+            path.append(message)
+    return path[::-1]
+
+
+def resolve_active_path(messages: List[Message]) -> List[Message]:
+    # Walk from the newest root along current versions; at each step follow the newest child
+    # attached to the parent's current version
+    children = build_children_index(messages)
+    roots = children.get(None, [])
+    path = []
+    seen = set()
+    current = roots[-1] if roots else None
+    while current is not None and current.id not in seen:
+        seen.add(current.id)
+        path.append(current)
+        attached = [
+            c for c in children.get(current.id, ()) if c.parent_version == current.current_version
+        ]
+        current = attached[-1] if attached else None
+    return path
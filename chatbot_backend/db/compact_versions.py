@@ -0,0 +1,60 @@
+import argparse
+import asyncio
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from chatbot_backend.config import settings
+from chatbot_backend.crud import crud_conversation
+from chatbot_backend.crud.archive import plan_archive
+from chatbot_backend.db.indexes import ensure_indexes
+from chatbot_backend.db.mongodb import close_mongo_connection, get_database
+
+# Moves old message versions (and the inactive branches under them) to the archive collection,
+# keeping the current and newest VERSION_ARCHIVE_KEEP versions of each message inline (see
+# crud/archive.py). Safe to re-run and to run next to the app: a conversation written to while it
+# is being compacted is skipped and picked up by the next run.
+#
+#   python -m chatbot_backend.db.compact_versions [--keep 3] [--batch-size 100] [--dry-run]
+
+
+async def compact(db: AsyncIOMotorDatabase, batch_size: int = 100, dry_run: bool = False) -> dict:
+    await ensure_indexes(db)
+    stats = {"conversations": 0, "versions": 0}
+    async for conversation in crud_conversation.iter_conversations(db, batch_size):
+        if dry_run:
+            archived = sum(
+                len(versions)
+                for _, versions, _ in plan_archive(
+                    conversation.messages, settings.VERSION_ARCHIVE_KEEP
+                )
+            )
+        else:
+            archived = await crud_conversation.archive_versions(db, conversation.id, conversation)
+        stats["conversations"] += archived > 0
+        stats["versions"] += archived
+    return stats
+
+
+async def main(args):
+    if args.keep:
+        settings.VERSION_ARCHIVE_KEEP = args.keep
+    try:
+        stats = await compact(await get_database(), args.batch_size, args.dry_run)
+        verb = "Would archive" if args.dry_run else "Archived"
+        print(f"{verb} {stats['versions']} versions from {stats['conversations']} conversations")
+    finally:
+        await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Move old message versions to the archive collection"
+    )
+    parser.add_argument(
+        "--keep",
+        type=int,
+        help="versions to keep inline per message (default VERSION_ARCHIVE_KEEP)",
+    )
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--dry-run", action="store_true")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,354 @@
+import argparse
+import asyncio
+import sys
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+from pymongo.errors import OperationFailure
+
+from chatbot_backend.config import settings
+from chatbot_backend.db.mongodb import close_mongo_connection, get_database
+
+# Every index the app relies on, declared per collection and created idempotently at startup
+# (create_indexes is a no-op for an index that already exists; a changed TTL is applied in place).
+#
+#   python -m chatbot_backend.db.indexes [--create]
+#
+# lists missing and undeclared indexes, then runs explain() on each query pattern below and flags
+# collection scans (and blocking in-memory sorts). Exits non-zero when something needs attention.
+
+# Errors returned when an index with the same keys exists with other options
+INDEX_CONFLICT_CODES = (85, 86)
+
+
+def declared_indexes() -> Dict[str, List[IndexModel]]:
+    # Embedded message lookups ({_id, "messages._id"}) and their array-filter updates are already
+    # pinned to one document by _id, so the messages array needs no multikey index
+    declared = {
+        "conversations": [
+            # list_conversations: newest first, keyset on (updated_at, _id)
+            IndexModel([("updated_at", DESCENDING), ("_id", DESCENDING)]),
+        ],
+        "messages": [
+            IndexModel([("conversation_id", ASCENDING), ("parent_id", ASCENDING)]),
+            # _load_messages and get_messages_page sort on (created_at, _id) within a conversation
+            IndexModel(
+                [("conversation_id", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)]
+            ),
+            # The export merge join
+            IndexModel([("conversation_id", ASCENDING), ("_id", ASCENDING)]),
+        ],
+        "generation_jobs": [
+            IndexModel(
+                [("status", ASCENDING), ("priority", DESCENDING), ("created_at", ASCENDING)]
+            ),
+            IndexModel([("conversation_id", ASCENDING), ("parent_id", ASCENDING)]),
+            # Admission.check_jobs
+            IndexModel([("api_key.id", ASCENDING), ("status", ASCENDING)]),
+            IndexModel("finished_at", expireAfterSeconds=settings.GENERATION_JOB_TTL_SECONDS),
+        ],
+        "idempotency_keys": [
+            IndexModel("created_at", expireAfterSeconds=settings.IDEMPOTENCY_TTL_SECONDS),
+        ],
+        "llm_response_cache": [
+            IndexModel("expires_at", expireAfterSeconds=0),
+        ],
+        "message_archive": [
+            IndexModel([("conversation_id", ASCENDING), ("message_id", ASCENDING)]),
+        ],
+        # Coordination between workers (shared.py); the TTL index on `at` also serves the poll
+        "shared_events": [
+            IndexModel("at", expireAfterSeconds=settings.SHARED_STATE_RETENTION_SECONDS),
+        ],
+        "shared_counters": [
+            IndexModel("expires_at", expireAfterSeconds=0),
+        ],
+        # API keys are looked up by _id (their hash); revoke goes by name
+        "api_keys": [
+            IndexModel([("name", ASCENDING), ("active", ASCENDING)]),
+        ],
+        # Usage reports per key over a range of days
+        "api_key_usage": [
+            IndexModel([("key_id", ASCENDING), ("day", ASCENDING)]),
+        ],
+    }
+    if settings.SEARCH_ENABLED:
+        # Message search (search/service.py); a collection can have only one text index
+        declared["conversations"].append(IndexModel([("messages.versions.content", TEXT)]))
+        declared["messages"].append(IndexModel([("versions.content", TEXT)]))
+    return declared
+
+
+def default_collections() -> List[str]:
+    # Collections the current configuration uses
+    collections = [
+        "conversations",
+        "generation_jobs",
+        "idempotency_keys",
+        "message_archive",
+        "shared_counters",
+        "api_keys",
+        "api_key_usage",
+    ]
+    if settings.MESSAGE_STORAGE == "collection":
+        collections.append("messages")
+    if settings.LLM_CACHE_ENABLED and settings.LLM_CACHE_SHARED:
+        collections.append("llm_response_cache")
+    if settings.CONVERSATION_CACHE_ENABLED and settings.CONVERSATION_CACHE_SHARED_INVALIDATION:
+        collections.append("shared_events")
+    return collections
+
+
+async def ensure_indexes(db: AsyncIOMotorDatabase, collections: Optional[Iterable[str]] = None):
+    declared = declared_indexes()
+    for name in collections or default_collections():
+        for model in declared[name]:
+            try:
+                await db[name].create_indexes([model])
+            except OperationFailure as exc:
+                spec = model.document
+                if exc.code not in INDEX_CONFLICT_CODES or "expireAfterSeconds" not in spec:
+                    raise
+                # Same keys with another TTL: update the expiry instead of failing startup
+                await db.command(
+                    "collMod",
+                    name,
+                    index={
+                        "keyPattern": spec["key"],
+                        "expireAfterSeconds": spec["expireAfterSeconds"],
+                    },
+                )
+
+
+async def index_report(
+    db: AsyncIOMotorDatabase, collections: Iterable[str]
+) -> List[Tuple[str, str, str]]:
+    # (collection, "missing" | "undeclared", key pattern) for indexes that differ from the
+    # declarations
+    declared = declared_indexes()
+    report = []
+    for name in collections:
+        existing = {tuple(info["key"]) for info in (await db[name].index_information()).values()}
+        wanted = {_stored_key(model) for model in declared[name]}
+        for key in sorted(wanted - existing):
+            report.append((name, "missing", _format_key(key)))
+        for key in sorted(existing - wanted - {(("_id", 1),)}):
+            report.append((name, "undeclared", _format_key(key)))
+    return report
+
+
+def _stored_key(model: IndexModel) -> tuple:
+    # Text indexes are listed by index_information() under their internal key
+    key = tuple(model.document["key"].items())
+    if any(direction == TEXT for _, direction in key):
+        return (("_fts", TEXT), ("_ftsx", 1))
+    return key
+
+
+def _format_key(key) -> str:
+    return ", ".join(f"{field}: {direction}" for field, direction in key)
+
+
+def query_patterns() -> List[Tuple[str, str, dict, Optional[list]]]:
+    # (name, collection, filter, sort) for every query the CRUD layer and the job queue issue.
+    # Writes are listed by their filter, which is what the planner picks an index for. Only find
+    # commands are explained: the aggregations (get_active_thread and get_messages_by_ids with
+    # embedded messages) are left out on purpose, since their first stage is a $match on the
+    # conversation _id, which the _id index always serves.
+    oid, now = ObjectId(), datetime.utcnow()
+    patterns = [
+        ("get_conversation / by-id updates", "conversations", {"_id": oid}, None),
+        ("_get_message (embedded)", "conversations", {"_id": oid, "messages._id": oid}, None),
+        (
+            "update_message (embedded)",
+            "conversations",
+            {"_id": oid, "messages": {"$elemMatch": {"_id": oid, "versions": {"$size": 1}}}},
+            None,
+        ),
+        (
+            "list_conversations",
+            "conversations",
+            {},
+            [("updated_at", DESCENDING), ("_id", DESCENDING)],
+        ),
+        (
+            "list_conversations (next page)",
+            "conversations",
+            {"$or": [{"updated_at": {"$lt": now}}, {"updated_at": now, "_id": {"$lt": oid}}]},
+            [("updated_at", DESCENDING), ("_id", DESCENDING)],
+        ),
+        ("iter_conversations", "conversations", {"_id": {"$gt": oid}}, [("_id", ASCENDING)]),
+        (
+            "claim generation job",
+            "generation_jobs",
+            {"$or": [{"status": "queued"}, {"status": "running", "lease_until": {"$lt": now}}]},
+            [("priority", DESCENDING), ("created_at", ASCENDING)],
+        ),
+        ("queue depth", "generation_jobs", {"status": "queued"}, None),
+        (
+            "abandoned saves",
+            "generation_jobs",
+            {"status": "saving", "lease_until": {"$lt": now}},
+            None,
+        ),
+        (
+            "unfinished jobs per key",
+            "generation_jobs",
+            {"api_key.id": "key", "status": {"$in": ["queued", "running", "saving"]}},
+            None,
+        ),
+        (
+            "archived versions / restore",
+            "message_archive",
+            {"conversation_id": oid, "message_id": oid, "version.id": "v1"},
+            None,
+        ),
+        (
+            "delete archived",
+            "message_archive",
+            {"conversation_id": oid, "message_id": {"$in": [oid]}},
+            None,
+        ),
+        ("export archived", "message_archive", {"conversation_id": oid}, None),
+        (
+            "cancel_for_messages",
+            "generation_jobs",
+            {
+                "conversation_id": oid,
+                "parent_id": {"$in": [oid]},
+                "status": {"$in": ["queued", "running"]},
+            },
+            None,
+        ),
+        (
+            "shared events poll",
+            "shared_events",
+            {"at": {"$gte": now}, "origin": {"$ne": "worker"}},
+            None,
+        ),
+        ("revoke api key", "api_keys", {"name": "name", "active": True}, None),
+    ]
+    if settings.MESSAGE_STORAGE == "collection":
+        patterns += [
+            (
+                "_load_messages",
+                "messages",
+                {"conversation_id": oid},
+                [("created_at", ASCENDING), ("_id", ASCENDING)],
+            ),
+            (
+                "_get_message / by-id updates",
+                "messages",
+                {"_id": oid, "conversation_id": oid},
+                None,
+            ),
+            (
+                "delete_message subtree / get_active_thread",
+                "messages",
+                {"conversation_id": oid, "_id": {"$in": [oid]}},
+                None,
+            ),
+            (
+                "get_messages_by_ids",
+                "messages",
+                {"_id": {"$in": [oid]}, "conversation_id": {"$in": [oid]}},
+                None,
+            ),
+            ("delete_conversation", "messages", {"conversation_id": oid}, None),
+            (
+                "get_messages_page",
+                "messages",
+                {
+                    "conversation_id": oid,
+                    "$or": [{"created_at": {"$gt": now}}, {"created_at": now, "_id": {"$gt": oid}}],
+                },
+                [("created_at", ASCENDING), ("_id", ASCENDING)],
+            ),
+            (
+                "iter_conversations (messages)",
+                "messages",
+                {"conversation_id": {"$gt": oid}},
+                [("conversation_id", ASCENDING), ("_id", ASCENDING)],
+            ),
+        ]
+    if settings.SEARCH_ENABLED:
+        # No sort: ordering by textScore is always done in memory, and the text index bounds it
+        patterns.append(
+            (
+                "search_messages",
+                "messages" if settings.MESSAGE_STORAGE == "collection" else "conversations",
+                {"$text": {"$search": "word"}},
+                None,
+            )
+        )
+    return patterns
+
+
+def plan_stages(plan) -> List[str]:
+    # Every "stage" in an explain() plan tree (classic and slot-based engine layouts)
+    stages = []
+    if isinstance(plan, dict):
+        if isinstance(plan.get("stage"), str):
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(plan_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            stages.extend(plan_stages(value))
+    return stages
+
+
+async def explain(
+    db: AsyncIOMotorDatabase, collection: str, query: dict, sort: Optional[list]
+) -> List[str]:
+    command = {"find": collection, "filter": query, "limit": 1}
+    if sort:
+        command["sort"] = dict(sort)
+    result = await db.command({"explain": command, "verbosity": "queryPlanner"})
+    return plan_stages(result["queryPlanner"]["winningPlan"])
+
+
+async def check_query_plans(db: AsyncIOMotorDatabase) -> List[Tuple[str, str, List[str]]]:
+    # (pattern, "ok" | "COLLSCAN" | "SORT" | "no data", stages)
+    results = []
+    for name, collection, query, sort in query_patterns():
+        stages = await explain(db, collection, query, sort)
+        if stages == ["EOF"]:
+            verdict = "no data"  # the collection doesn't exist yet, so there is no plan to check
+        elif "COLLSCAN" in stages:
+            verdict = "COLLSCAN"
+        elif "SORT" in stages:
+            verdict = "SORT"
+        else:
+            verdict = "ok"
+        results.append((name, verdict, stages))
+    return results
+
+
+async def main(args) -> int:
+    try:
+        db = await get_database()
+        collections = default_collections()
+        if args.create:
+            await ensure_indexes(db, collections)
+        problems = 0
+        for collection, state, key in await index_report(db, collections):
+            print(f"{state:>10}  {collection}  {{{key}}}")
+            problems += state == "missing"
+        for name, verdict, stages in await check_query_plans(db):
+            print(f"{verdict:>10}  {name}  [{' > '.join(stages)}]")
+            problems += verdict in ("COLLSCAN", "SORT")
+        return 1 if problems else 0
+    finally:
+        await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Check declared indexes and the query plans that rely on them"
+    )
+    parser.add_argument("--create", action="store_true", help="create missing indexes first")
+    sys.exit(asyncio.run(main(parser.parse_args())))
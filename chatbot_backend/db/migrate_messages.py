@@ -0,0 +1,75 @@
+import argparse
+import asyncio
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReplaceOne
+
+from chatbot_backend.crud.message_collection import MessageCollectionCRUD
+from chatbot_backend.db.mongodb import close_mongo_connection, get_database
+
+# Moves embedded `conversation.messages` arrays into the `messages` collection used by
+# MESSAGE_STORAGE=collection. Safe to re-run: messages are upserted by _id and the embedded
+# array is only removed once its messages have been written.
+#
+#   python -m chatbot_backend.db.migrate_messages [--batch-size 100] [--dry-run] [--keep-embedded]
+
+
+def message_documents(conversation: dict) -> list:
+    documents = []
+    for message in conversation.get("messages", []):
+        document = dict(message)
+        document["conversation_id"] = conversation["_id"]
+        versions = document.get("versions") or []
+        document.setdefault(
+            "created_at", versions[0]["created_at"] if versions else conversation["created_at"]
+        )
+        documents.append(document)
+    return documents
+
+
+async def migrate(
+    db: AsyncIOMotorDatabase,
+    batch_size: int = 100,
+    dry_run: bool = False,
+    keep_embedded: bool = False,
+) -> dict:
+    await MessageCollectionCRUD.ensure_indexes(db)
+    stats = {"conversations": 0, "messages": 0}
+    cursor = db.conversations.find({"messages.0": {"$exists": True}}, batch_size=batch_size)
+    async for conversation in cursor:
+        documents = message_documents(conversation)
+        stats["conversations"] += 1
+        stats["messages"] += len(documents)
+        if dry_run:
+            continue
+        await db.messages.bulk_write(
+            [ReplaceOne({"_id": d["_id"]}, d, upsert=True) for d in documents], ordered=False
+        )
+        if not keep_embedded:
+            await db.conversations.update_one(
+                {"_id": conversation["_id"]}, {"$unset": {"messages": ""}}
+            )
+    return stats
+
+
+async def main(args):
+    try:
+        stats = await migrate(
+            await get_database(), args.batch_size, args.dry_run, args.keep_embedded
+        )
+        verb = "Would migrate" if args.dry_run else "Migrated"
+        print(f"{verb} {stats['messages']} messages from {stats['conversations']} conversations")
+    finally:
+        await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Move embedded messages into the messages collection"
+    )
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument(
+        "--keep-embedded", action="store_true", help="don't remove the embedded arrays"
+    )
+    asyncio.run(main(parser.parse_args()))
@@ -1,22 +1,49 @@
-from pymongo import MongoClient
-from motor.motor_asyncio import AsyncIOMotorClient
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
 from ..config import settings
+from .monitoring import command_metrics, pool_metrics
 
 class Database:
     client: AsyncIOMotorClient = None
 
 db = Database()
 
-def get_sync_database():
-    return MongoClient(settings.MONGODB_URL)[settings.DATABASE_NAME]
 
-async def get_database() -> AsyncIOMotorClient:
-    return db.client[settings.DATABASE_NAME]
+def client_options() -> dict:
+    return {
+        "minPoolSize": settings.MONGO_MIN_POOL_SIZE,
+        "maxPoolSize": settings.MONGO_MAX_POOL_SIZE,
+        "maxIdleTimeMS": settings.MONGO_MAX_IDLE_TIME_MS,
+        "serverSelectionTimeoutMS": settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "waitQueueTimeoutMS": settings.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "event_listeners": [pool_metrics, command_metrics],
+    }
+
+
+def get_client() -> AsyncIOMotorClient:
+    # The process-wide client; created lazily if the app's startup hook hasn't run (e.g. scripts)
+    if db.client is None:
+        db.client = AsyncIOMotorClient(settings.MONGODB_URL, **client_options())
+    return db.client
+
+
+async def get_database() -> AsyncIOMotorDatabase:
+    return get_client()[settings.DATABASE_NAME]
+
+
+async def ping() -> bool:
+    try:
+        await get_client().admin.command("ping")
+        return True
+    except Exception:
+        return False
+
 
 async def connect_to_mongo():
-    db.client = AsyncIOMotorClient(settings.MONGODB_URL)
+    get_client()
     print("Connected to MongoDB")
 
 async def close_mongo_connection():
-    db.client.close()
-    print("Closed MongoDB connection")
\ No newline at end of file
+    if db.client is not None:
+        db.client.close()
+        db.client = None
+    print("Closed MongoDB connection")
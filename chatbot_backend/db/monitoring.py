@@ -0,0 +1,124 @@
+import threading
+import time
+from typing import Dict
+
+from pymongo import monitoring
+
+from chatbot_backend.metrics import registry
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    # pymongo emits pool events synchronously on the thread doing the checkout
+    # (a Motor executor thread), so a thread-local is enough to time the wait queue.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.pools_open = 0
+            self.connections_open = 0
+            self.checked_out = 0
+            self.checkouts_total = 0
+            self.checkout_failures = 0
+            self.wait_queue_seconds_total = 0.0
+            self.wait_queue_seconds_max = 0.0
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            avg_wait = (
+                self.wait_queue_seconds_total / self.checkouts_total
+                if self.checkouts_total
+                else 0.0
+            )
+            return {
+                "pools_open": self.pools_open,
+                "connections_open": self.connections_open,
+                "checked_out": self.checked_out,
+                "checkouts_total": self.checkouts_total,
+                "checkout_failures": self.checkout_failures,
+                "wait_queue_seconds_total": self.wait_queue_seconds_total,
+                "wait_queue_seconds_avg": avg_wait,
+                "wait_queue_seconds_max": self.wait_queue_seconds_max,
+            }
+
+    def _record_wait(self):
+        started = getattr(self._local, "checkout_started", None)
+        self._local.checkout_started = None
+        if started is None:
+            return 0.0
+        return time.perf_counter() - started
+
+    def pool_created(self, event):
+        with self._lock:
+            self.pools_open += 1
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        with self._lock:
+            self.pools_open = max(self.pools_open - 1, 0)
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections_open += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections_open = max(self.connections_open - 1, 0)
+
+    def connection_check_out_started(self, event):
+        self._local.checkout_started = time.perf_counter()
+
+    def connection_check_out_failed(self, event):
+        self._record_wait()
+        with self._lock:
+            self.checkout_failures += 1
+
+    def connection_checked_out(self, event):
+        waited = self._record_wait()
+        with self._lock:
+            self.checked_out += 1
+            self.checkouts_total += 1
+            self.wait_queue_seconds_total += waited
+            self.wait_queue_seconds_max = max(self.wait_queue_seconds_max, waited)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out = max(self.checked_out - 1, 0)
+
+
+pool_metrics = PoolMetrics()
+
+
+class CommandMetrics(monitoring.CommandListener):
+    # Server round-trip time per command, as seen by the driver (excludes pool waits and decoding)
+
+    def __init__(self):
+        self.duration = registry.histogram(
+            "chatbot_mongo_command_duration_seconds",
+            "MongoDB command round-trip time",
+            ("command", "outcome"),
+        )
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self.duration.observe(event.duration_micros / 1e6, event.command_name, "ok")
+
+    def failed(self, event):
+        self.duration.observe(event.duration_micros / 1e6, event.command_name, "error")
+
+
+command_metrics = CommandMetrics()
+registry.register_gauges("chatbot_mongo_pool", pool_metrics.snapshot)
@@ -0,0 +1,239 @@
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import sys
+import zlib
+from typing import AsyncIterator, BinaryIO, Iterator, List, Optional, Tuple
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pydantic import ValidationError
+
+from chatbot_backend.config import settings
+from chatbot_backend.crud import archive, crud_conversation
+from chatbot_backend.crud.conversation import bulk_insert
+from chatbot_backend.db.mongodb import close_mongo_connection, get_database
+from chatbot_backend.encoding import dumps
+from chatbot_backend.models import ArchivedVersion, Conversation
+
+# Streaming export/import of conversations as NDJSON, one `Conversation` per line (the same
+# fields as the model, ObjectIds as hex strings, datetimes in ISO format), optionally gzipped.
+# Conversations with archived versions also carry them under "archive", so the archive tier
+# (crud/archive.py) survives the round trip.
+# Export walks a cursor in _id order, so memory stays flat and `--after` resumes an interrupted
+# run. Import validates every line against the model, writes unordered batches and records a
+# checkpoint after each one; `--resume` continues after the last completed batch.
+#
+#   python -m chatbot_backend.db.transfer export conversations.ndjson.gz \
+#       [--batch-size 100] [--after ID]
+#   python -m chatbot_backend.db.transfer import conversations.ndjson.gz \
+#       [--batch-size 500] [--replace] [--resume]
+#
+# The same stream is served by GET /api/v1/conversations/export.
+
+CHUNK_BYTES = 64 * 1024
+
+
+class ConversationRecord(Conversation):
+    # One line of the stream
+    archive: List[ArchivedVersion] = []
+
+    def conversation(self) -> Conversation:
+        return Conversation.construct(
+            **{name: getattr(self, name) for name in Conversation.__fields__}
+        )
+
+
+def encode_conversation(conversation: Conversation, archived: List[ArchivedVersion] = ()) -> bytes:
+    document = conversation.dict(by_alias=True)
+    if archived:
+        document["archive"] = [a.dict(by_alias=True) for a in archived]
+    return dumps(document) + b"\n"
+
+
+async def archived_versions(
+    db: AsyncIOMotorDatabase, conversation: Conversation
+) -> List[ArchivedVersion]:
+    # Only conversations with archived versions pay for the extra read
+    if not any(m.archived_versions for m in conversation.messages):
+        return []
+    return await archive.export_archived(db, conversation.id)
+
+
+async def export_stream(
+    db: AsyncIOMotorDatabase,
+    batch_size: int = 100,
+    after: Optional[ObjectId] = None,
+    compress: bool = False,
+) -> AsyncIterator[bytes]:
+    # Lines are sent in chunks of about CHUNK_BYTES; with `compress`, as one gzip stream
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    buffer = bytearray()
+    async for conversation in crud_conversation.iter_conversations(db, batch_size, after):
+        buffer += encode_conversation(conversation, await archived_versions(db, conversation))
+        if len(buffer) >= CHUNK_BYTES:
+            chunk = compressor.compress(bytes(buffer)) if compressor else bytes(buffer)
+            buffer.clear()
+            if chunk:
+                yield chunk
+    if compressor:
+        yield compressor.compress(bytes(buffer)) + compressor.flush()
+    elif buffer:
+        yield bytes(buffer)
+
+
+def _open_input(path: str) -> BinaryIO:
+    if path == "-":
+        return sys.stdin.buffer
+    with open(path, "rb") as f:
+        gzipped = f.read(2) == b"\x1f\x8b"
+    return gzip.open(path, "rb") if gzipped else open(path, "rb")
+
+
+def _read_checkpoint(path: str) -> dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"line": 0, "imported": 0, "skipped": 0, "invalid": 0}
+
+
+def _write_checkpoint(path: str, state: dict):
+    # Atomic replace, so a crash never leaves a torn checkpoint
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f)
+    os.replace(path + ".tmp", path)
+
+
+def _batches(
+    lines: Iterator[bytes], start: int, batch_size: int, state: dict
+) -> Iterator[Tuple[int, List[ConversationRecord]]]:
+    # (last line number, records) per batch; lines up to `start` were imported already
+    batch = []
+    for number, line in enumerate(lines, 1):
+        if number <= start or not line.strip():
+            continue
+        try:
+            batch.append(ConversationRecord.parse_raw(line))
+        except (ValidationError, ValueError) as exc:
+            state["invalid"] += 1
+            print(f"line {number}: skipped, {exc}".replace("\n", " "), file=sys.stderr)
+        if len(batch) >= batch_size:
+            yield number, batch
+            batch = []
+    if batch:
+        yield number, batch
+
+
+async def import_archived(
+    db: AsyncIOMotorDatabase, records: List[ConversationRecord], replace: bool
+):
+    # Written before the conversations, like messages. Without `replace`, conversations that
+    # already exist keep their own archive; with it, they get exactly the imported one.
+    documents = [
+        archive.imported_document(record.id, archived, settings.VERSION_ARCHIVE_COMPRESS_BYTES)
+        for record in records
+        for archived in record.archive
+    ]
+    collection = db[archive.ARCHIVE_COLLECTION]
+    if replace:
+        await collection.delete_many(
+            {"conversation_id": {"$in": [record.id for record in records]}}
+        )
+    elif documents:
+        ids = list({d["conversation_id"] for d in documents})
+        existing = {
+            c["_id"] async for c in db.conversations.find({"_id": {"$in": ids}}, {"_id": 1})
+        }
+        documents = [d for d in documents if d["conversation_id"] not in existing]
+    await bulk_insert(collection, documents, replace)
+
+
+async def import_file(
+    db: AsyncIOMotorDatabase,
+    path: str,
+    batch_size: int = 500,
+    replace: bool = False,
+    resume: bool = False,
+) -> dict:
+    await crud_conversation.ensure_indexes(db)
+    checkpoint = path + ".checkpoint" if path != "-" else None
+    state = (
+        _read_checkpoint(checkpoint)
+        if resume and checkpoint
+        else {"line": 0, "imported": 0, "skipped": 0, "invalid": 0}
+    )
+    with _open_input(path) as f:
+        for number, batch in _batches(f, state["line"], batch_size, state):
+            await import_archived(db, batch, replace)
+            written = await crud_conversation.insert_conversations(
+                db, [record.conversation() for record in batch], replace
+            )
+            state["imported"] += written
+            state["skipped"] += len(batch) - written
+            state["line"] = number
+            if checkpoint:
+                _write_checkpoint(checkpoint, state)
+    if checkpoint and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    return state
+
+
+async def export_file(
+    db: AsyncIOMotorDatabase, path: str, batch_size: int = 100, after: Optional[ObjectId] = None
+):
+    compress = path.endswith(".gz")
+    out = sys.stdout.buffer if path == "-" else open(path, "ab" if after else "wb")
+    try:
+        async for chunk in export_stream(db, batch_size, after, compress):
+            out.write(chunk)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+
+
+async def main(args):
+    try:
+        db = await get_database()
+        if args.command == "export":
+            await export_file(
+                db, args.path, args.batch_size, ObjectId(args.after) if args.after else None
+            )
+        else:
+            state = await import_file(db, args.path, args.batch_size, args.replace, args.resume)
+            print(
+                f"Imported {state['imported']} conversations "
+                f"({state['skipped']} already present, {state['invalid']} invalid lines)",
+                file=sys.stderr,
+            )
+    finally:
+        await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export or import conversations as NDJSON")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser(
+        "export", help="write conversations to a file (.gz to compress, - for stdout)"
+    )
+    export_parser.add_argument("path")
+    export_parser.add_argument("--batch-size", type=int, default=100, help="cursor batch size")
+    export_parser.add_argument(
+        "--after", help="only conversations with a larger _id (appends to the file)"
+    )
+    import_parser = commands.add_parser(
+        "import", help="read conversations from a file (gzip detected, - for stdin)"
+    )
+    import_parser.add_argument("path")
+    import_parser.add_argument(
+        "--batch-size", type=int, default=500, help="conversations per bulk write"
+    )
+    import_parser.add_argument(
+        "--replace", action="store_true", help="overwrite conversations that already exist"
+    )
+    import_parser.add_argument(
+        "--resume", action="store_true", help="continue from the last checkpoint"
+    )
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,29 @@
+import json
+from datetime import datetime
+from typing import Any
+
+from bson import ObjectId
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib encoder produces the same output, only slower
+    orjson = None
+
+# JSON encoding shared by the API responses and the NDJSON export: ObjectIds as hex strings,
+# datetimes in ISO format.
+
+
+def _default(value: Any):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode(
+        "utf-8"
+    )
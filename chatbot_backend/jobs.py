@@ -0,0 +1,271 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+
+from chatbot_backend.config import settings
+from chatbot_backend.metrics import observe_stage, registry
+
+# Background generation for the async chat endpoints. Jobs are documents in `generation_jobs`, so
+# any worker process can report their status, and every process runs GENERATION_WORKERS tasks
+# that claim the highest-priority queued job (oldest first). A claimed job holds a lease, renewed
+# while it runs; if its process dies, a running job is claimed again once the lease has run out,
+# and a saving one fails, since its reply may already be written. Every claim counts an attempt,
+# and only the worker holding the latest attempt may save or finish the job. Finished jobs expire
+# through a TTL index on `finished_at` (indexes are declared in db/indexes.py).
+#
+# A job moves queued -> running -> saving -> done, or ends as failed/cancelled. Cancellation is
+# only possible before "saving", so a cancelled job never writes its reply.
+
+QUEUED = "queued"
+RUNNING = "running"
+SAVING = "saving"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+CANCELLABLE = (QUEUED, RUNNING)
+
+
+class QueueUnavailableError(Exception):
+    pass
+
+
+class GenerationQueue:
+    def __init__(self, workers: int, max_depth: int, lease_seconds: float, poll_seconds: float):
+        self.workers = workers
+        self.max_depth = max_depth
+        self.lease = timedelta(seconds=lease_seconds)
+        self.poll_seconds = poll_seconds
+        self.handler: Optional[
+            Callable[[AsyncIOMotorDatabase, dict], Awaitable[Optional[dict]]]
+        ] = None
+        self._tasks: List[asyncio.Task] = []
+        self._draining = False
+        self._wakeup: Optional[asyncio.Event] = None
+        # job id -> handler task, for jobs running in this process
+        self._running: Dict[ObjectId, asyncio.Task] = {}
+        # Set (and replaced) whenever this process finishes a job, to wake long-polls early
+        self._progress: Optional[asyncio.Event] = None
+        self.stats: Dict[str, int] = {"completed": 0, "failed": 0, "cancelled": 0, "rejected": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._tasks)
+
+    def start(
+        self,
+        db: AsyncIOMotorDatabase,
+        handler: Callable[[AsyncIOMotorDatabase, dict], Awaitable[Optional[dict]]],
+    ):
+        self.handler = handler
+        self._draining = False
+        self._wakeup = asyncio.Event()
+        self._progress = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._work(db)) for _ in range(self.workers)]
+
+    async def stop(self):
+        # Jobs in progress go back to the queue (see _run)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def drain(self, timeout: float):
+        # Graceful shutdown: claim nothing new, let running jobs finish within the timeout, then
+        # hand the rest back to the queue
+        self._draining = True
+        if self._wakeup is not None:
+            self._wakeup.set()
+        if self._tasks:
+            await asyncio.wait(self._tasks, timeout=timeout)
+        await self.stop()
+
+    async def check_capacity(self, db: AsyncIOMotorDatabase):
+        # Called before the user message is written, so a rejected request leaves nothing behind
+        if not self.enabled:
+            raise QueueUnavailableError("Async generation is disabled")
+        if await db.generation_jobs.count_documents({"status": QUEUED}) >= self.max_depth:
+            self.stats["rejected"] += 1
+            raise QueueUnavailableError("Generation queue is full")
+
+    async def unfinished_for_key(self, db: AsyncIOMotorDatabase, key_id: str) -> int:
+        return await db.generation_jobs.count_documents(
+            {"api_key.id": key_id, "status": {"$in": [QUEUED, RUNNING, SAVING]}}
+        )
+
+    async def enqueue(self, db: AsyncIOMotorDatabase, job: dict) -> dict:
+        job.update(
+            {"_id": ObjectId(), "status": QUEUED, "created_at": datetime.utcnow(), "attempts": 0}
+        )
+        await db.generation_jobs.insert_one(job)
+        self._wakeup.set()
+        return job
+
+    async def get(
+        self, db: AsyncIOMotorDatabase, job_id: ObjectId, wait: float = 0
+    ) -> Optional[dict]:
+        # With wait > 0, long-polls until the job finishes or the timeout runs out
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + wait
+        while True:
+            job = await db.generation_jobs.find_one({"_id": job_id})
+            remaining = deadline - loop.time()
+            if job is None or job["status"] in FINISHED or remaining <= 0:
+                return job
+            delay = min(self.poll_seconds, remaining)
+            if self._progress is None:
+                await asyncio.sleep(delay)
+                continue
+            try:
+                await asyncio.wait_for(self._progress.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def cancel(self, db: AsyncIOMotorDatabase, job_id: ObjectId) -> Optional[dict]:
+        # Returns the job as it stands afterwards; its status tells whether the cancel applied
+        await self._cancel_where(db, {"_id": job_id})
+        return await db.generation_jobs.find_one({"_id": job_id})
+
+    async def cancel_for_messages(
+        self, db: AsyncIOMotorDatabase, conversation_id: ObjectId, message_ids: List[ObjectId]
+    ) -> int:
+        # Pending replies to messages that were just edited or deleted
+        if not message_ids:
+            return 0
+        return await self._cancel_where(
+            db, {"conversation_id": conversation_id, "parent_id": {"$in": message_ids}}
+        )
+
+    async def _cancel_where(self, db: AsyncIOMotorDatabase, query: dict) -> int:
+        query = {**query, "status": {"$in": list(CANCELLABLE)}}
+        job_ids = [job["_id"] async for job in db.generation_jobs.find(query, {"_id": 1})]
+        if not job_ids:
+            return 0
+        result = await db.generation_jobs.update_many(
+            {**query, "_id": {"$in": job_ids}},
+            {"$set": {"status": CANCELLED, "finished_at": datetime.utcnow()}},
+        )
+        self.stats["cancelled"] += result.modified_count
+        for job_id in job_ids:
+            # Jobs running in other processes notice at begin_save
+            task = self._running.get(job_id)
+            if task is not None:
+                task.cancel()
+        return result.modified_count
+
+    async def begin_save(self, db: AsyncIOMotorDatabase, job: dict) -> bool:
+        # Called by the handler right before it writes the reply; False means the job was cancelled
+        # (or claimed again after its lease ran out)
+        result = await db.generation_jobs.update_one(
+            {**self._owned(job), "status": RUNNING}, {"$set": {"status": SAVING}}
+        )
+        return result.modified_count > 0
+
+    @staticmethod
+    def _owned(job: dict) -> dict:
+        return {"_id": job["_id"], "attempts": job["attempts"]}
+
+    async def _fail_abandoned(self, db: AsyncIOMotorDatabase, now: datetime):
+        # Saving jobs whose worker is gone aren't run again: the reply may be saved already
+        result = await db.generation_jobs.update_many(
+            {"status": SAVING, "lease_until": {"$lt": now}},
+            {
+                "$set": {
+                    "status": FAILED,
+                    "error": "The worker stopped while saving the reply",
+                    "finished_at": now,
+                }
+            },
+        )
+        self.stats["failed"] += result.modified_count
+
+    async def _heartbeat(self, db: AsyncIOMotorDatabase, job: dict):
+        # Renews the lease three times per lease period for as long as the job runs here
+        while True:
+            await asyncio.sleep(self.lease.total_seconds() / 3)
+            try:
+                await db.generation_jobs.update_one(
+                    {**self._owned(job), "status": {"$in": [RUNNING, SAVING]}},
+                    {"$set": {"lease_until": datetime.utcnow() + self.lease}},
+                )
+            except Exception as exc:
+                print(f"Lease renewal of job {job['_id']} failed: {exc}")
+
+    async def _claim(self, db: AsyncIOMotorDatabase) -> Optional[dict]:
+        now = datetime.utcnow()
+        await self._fail_abandoned(db, now)
+        return await db.generation_jobs.find_one_and_update(
+            {"$or": [{"status": QUEUED}, {"status": RUNNING, "lease_until": {"$lt": now}}]},
+            {
+                "$set": {"status": RUNNING, "started_at": now, "lease_until": now + self.lease},
+                "$inc": {"attempts": 1},
+            },
+            sort=[("priority", DESCENDING), ("created_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _work(self, db: AsyncIOMotorDatabase):
+        while not self._draining:
+            self._wakeup.clear()
+            try:
+                job = await self._claim(db)
+            except Exception:
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(db, job)
+
+    async def _run(self, db: AsyncIOMotorDatabase, job: dict):
+        observe_stage("queue.wait", (job["started_at"] - job["created_at"]).total_seconds())
+        task = asyncio.create_task(self.handler(db, job))
+        heartbeat = asyncio.create_task(self._heartbeat(db, job))
+        self._running[job["_id"]] = task
+        update = None
+        try:
+            result = await asyncio.shield(task)
+            if result is not None:
+                update = {"status": DONE, "result": result}
+                self.stats["completed"] += 1
+        except asyncio.CancelledError:
+            if not task.cancelled():
+                # The worker itself is shutting down: hand the job back for the other processes
+                task.cancel()
+                await db.generation_jobs.update_one(
+                    {**self._owned(job), "status": RUNNING},
+                    {"$set": {"status": QUEUED}, "$unset": {"lease_until": ""}},
+                )
+                raise
+        except Exception as exc:
+            update = {"status": FAILED, "error": getattr(exc, "detail", None) or str(exc)}
+            self.stats["failed"] += 1
+        finally:
+            heartbeat.cancel()
+            self._running.pop(job["_id"], None)
+        # A handler that returns None was cancelled before saving; the job is already marked
+        if update is not None:
+            update["finished_at"] = datetime.utcnow()
+            await db.generation_jobs.update_one(
+                {**self._owned(job), "status": {"$in": [RUNNING, SAVING]}}, {"$set": update}
+            )
+        self._progress.set()
+        self._progress = asyncio.Event()
+
+    def snapshot(self) -> Dict[str, int]:
+        return {**self.stats, "workers": len(self._tasks), "running": len(self._running)}
+
+
+generation_queue = GenerationQueue(
+    settings.GENERATION_WORKERS,
+    settings.GENERATION_QUEUE_MAX_DEPTH,
+    settings.GENERATION_JOB_LEASE_SECONDS,
+    settings.GENERATION_QUEUE_POLL_SECONDS,
+)
+registry.register_gauges("chatbot_generation_queue", generation_queue.snapshot)
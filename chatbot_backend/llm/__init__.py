@@ -0,0 +1,4 @@
+from .base import LLMError, LLMProvider, LLMTimeoutError
+from .cache import ResponseCache, get_response_cache
+from .client import LLMClient
+from .provider import get_llm
@@ -0,0 +1,27 @@
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Tuple, Type
+
+
+class LLMError(Exception):
+    pass
+
+
+class LLMTimeoutError(LLMError):
+    pass
+
+
+class LLMProvider(ABC):
+    name: str = "base"
+    # Exceptions worth retrying (quota, transient unavailability); everything else fails fast
+    retryable_exceptions: Tuple[Type[BaseException], ...] = ()
+
+    @abstractmethod
+    async def generate(self, prompt: str) -> str:
+        ...
+
+    @abstractmethod
+    def stream(self, prompt: str) -> AsyncIterator[str]:
+        ...
+
+    async def warm_up(self) -> None:
+        pass
@@ -0,0 +1,141 @@
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from chatbot_backend.config import settings
+from chatbot_backend.metrics import registry
+
+# Opt-in cache of generated replies, keyed on (context, language, normalized history + message).
+# An in-process LRU answers repeats on the same worker; the optional Mongo tier shares entries
+# across workers and expires them through a TTL index.
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION_RE = re.compile(r"[\s.!?,;:]+$")
+
+
+def normalize(text: str) -> str:
+    return _TRAILING_PUNCTUATION_RE.sub("", _WHITESPACE_RE.sub(" ", text.strip().lower()))
+
+
+def cache_key(context: str, language: str, history: List[str], message: str) -> str:
+    digest = hashlib.sha256()
+    for part in (
+        [context, normalize(language)] + [normalize(h) for h in history] + [normalize(message)]
+    ):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class LRUCache:
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: str):
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
+class ResponseCache:
+    collection_name = "llm_response_cache"
+
+    def __init__(self, max_entries: int, ttl_seconds: float, shared: bool = False):
+        self.local = LRUCache(max_entries, ttl_seconds)
+        self.ttl = ttl_seconds
+        self.shared = shared
+        self.stats: Dict[str, int] = {"local_hits": 0, "shared_hits": 0, "misses": 0, "stores": 0}
+        self._indexed = False
+
+    async def _collection(self):
+        from chatbot_backend.db.indexes import ensure_indexes
+        from chatbot_backend.db.mongodb import get_database
+
+        db = await get_database()
+        if not self._indexed:
+            await ensure_indexes(db, [self.collection_name])
+            self._indexed = True
+        return db[self.collection_name]
+
+    async def get(self, key: str) -> Optional[str]:
+        value = self.local.get(key)
+        if value is not None:
+            self.stats["local_hits"] += 1
+            return value
+        if self.shared:
+            collection = await self._collection()
+            # The TTL monitor only runs once a minute, so check expiry explicitly as well
+            entry = await collection.find_one(
+                {"_id": key, "expires_at": {"$gt": datetime.utcnow()}}
+            )
+            if entry:
+                self.stats["shared_hits"] += 1
+                self.local.set(key, entry["response"])
+                return entry["response"]
+        self.stats["misses"] += 1
+        return None
+
+    async def set(self, key: str, value: str):
+        self.local.set(key, value)
+        self.stats["stores"] += 1
+        if self.shared:
+            collection = await self._collection()
+            await collection.replace_one(
+                {"_id": key},
+                {
+                    "_id": key,
+                    "response": value,
+                    "expires_at": datetime.utcnow() + timedelta(seconds=self.ttl),
+                },
+                upsert=True,
+            )
+
+    def snapshot(self) -> Dict[str, float]:
+        lookups = self.stats["local_hits"] + self.stats["shared_hits"] + self.stats["misses"]
+        hits = self.stats["local_hits"] + self.stats["shared_hits"]
+        return {
+            **self.stats,
+            "entries": len(self.local),
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
+
+
+_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    # None when caching is disabled
+    global _cache
+    if not settings.LLM_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        _cache = ResponseCache(
+            settings.LLM_CACHE_MAX_ENTRIES,
+            settings.LLM_CACHE_TTL_SECONDS,
+            settings.LLM_CACHE_SHARED,
+        )
+        registry.register_gauges("chatbot_llm_cache", _cache.snapshot)
+    return _cache
@@ -0,0 +1,105 @@
+import asyncio
+import random
+from typing import AsyncIterator
+
+from .base import LLMError, LLMProvider, LLMTimeoutError
+from .limiter import ConcurrencyLimiter
+
+
+class LLMClient:
+    # Wraps a provider with the process-wide limiter, per-call timeouts and jittered retries
+    def __init__(
+        self,
+        provider: LLMProvider,
+        limiter: ConcurrencyLimiter,
+        timeout: float,
+        max_retries: int = 2,
+        retry_base_delay: float = 0.5,
+        stream_timeout: float = 300,
+    ):
+        self.provider = provider
+        self.limiter = limiter
+        self.timeout = timeout
+        self.stream_timeout = stream_timeout
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+
+    def _is_retryable(self, exc: BaseException) -> bool:
+        return isinstance(exc, (asyncio.TimeoutError,) + tuple(self.provider.retryable_exceptions))
+
+    async def _backoff(self, attempt: int):
+        # Full jitter: sleep a random amount up to base * 2^attempt
+        await asyncio.sleep(random.uniform(0, self.retry_base_delay * (2**attempt)))
+
+    async def generate(self, prompt: str) -> str:
+        attempt = 0
+        while True:
+            try:
+                async with self.limiter:
+                    return await asyncio.wait_for(self.provider.generate(prompt), self.timeout)
+            except Exception as exc:
+                if attempt >= self.max_retries or not self._is_retryable(exc):
+                    raise self._wrap(exc) from exc
+            await self._backoff(attempt)
+            attempt += 1
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        # The provider is read by a task of its own into an unbounded queue, so the limiter slot
+        # is given back when generation ends, not when a slow client has read the last chunk
+        queue: asyncio.Queue = asyncio.Queue()
+        reader = asyncio.create_task(self._read_stream(prompt, queue))
+        try:
+            while True:
+                kind, value = await queue.get()
+                if kind == "chunk":
+                    yield value
+                elif kind == "error":
+                    raise self._wrap(value) from value
+                else:
+                    return
+        finally:
+            # The client went away before the end
+            reader.cancel()
+
+    async def _read_stream(self, prompt: str, queue: asyncio.Queue):
+        # Retries are only safe until the first chunk has been queued. Each attempt also has an
+        # overall deadline, so a model that keeps trickling chunks can't hold the slot forever.
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        while True:
+            started = False
+            try:
+                async with self.limiter:
+                    deadline = loop.time() + self.stream_timeout
+                    iterator = self.provider.stream(prompt).__aiter__()
+                    while True:
+                        wait = min(self.timeout, deadline - loop.time())
+                        try:
+                            chunk = await asyncio.wait_for(iterator.__anext__(), wait)
+                        except StopAsyncIteration:
+                            queue.put_nowait(("end", None))
+                            return
+                        started = True
+                        queue.put_nowait(("chunk", chunk))
+            except Exception as exc:
+                if started or attempt >= self.max_retries or not self._is_retryable(exc):
+                    queue.put_nowait(("error", exc))
+                    return
+            await self._backoff(attempt)
+            attempt += 1
+
+    async def warm_up(self):
+        # Opens the provider's connection ahead of the first request; not counted against the
+        # limiter
+        try:
+            await asyncio.wait_for(self.provider.warm_up(), self.timeout)
+        except Exception as exc:
+            raise self._wrap(exc) from exc
+
+    @staticmethod
+    def _wrap(exc: BaseException) -> LLMError:
+        if isinstance(exc, LLMError):
+            return exc
+        if isinstance(exc, asyncio.TimeoutError):
+            return LLMTimeoutError("AI provider timed out")
+        return LLMError(str(exc) or exc.__class__.__name__)
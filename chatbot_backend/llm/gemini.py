@@ -0,0 +1,35 @@
+from typing import AsyncIterator
+
+from .base import LLMProvider
+
+
+class GeminiProvider(LLMProvider):
+    name = "gemini"
+
+    def __init__(self, api_key: str, model_name: str):
+        # Imported here so the stub provider works on machines without the Gemini SDK
+        import google.generativeai as genai
+        from google.api_core import exceptions as google_exceptions
+
+        genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel(model_name)
+        self.retryable_exceptions = (
+            google_exceptions.ResourceExhausted,
+            google_exceptions.ServiceUnavailable,
+            google_exceptions.DeadlineExceeded,
+            google_exceptions.InternalServerError,
+        )
+
+    async def warm_up(self):
+        # Counting tokens sets up the API channel without generating anything
+        await self.model.count_tokens_async("ping")
+
+    async def generate(self, prompt: str) -> str:
+        response = await self.model.generate_content_async(prompt)
+        return response.text
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        response = await self.model.generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            if chunk.text:
+                yield chunk.text
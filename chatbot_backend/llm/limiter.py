@@ -0,0 +1,62 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    # Allows `rate` acquisitions per second with bursts of up to `capacity`
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self) -> float:
+        # Takes a token without waiting; otherwise returns the seconds until one is available
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        async with self._lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+
+class ConcurrencyLimiter:
+    # Caps in-flight LLM calls per process and, optionally, their start rate
+    def __init__(self, max_concurrency: int, rate_per_second: float = 0, burst: int = 1):
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._bucket = TokenBucket(rate_per_second, max(burst, 1)) if rate_per_second > 0 else None
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.waiting = 0
+
+    async def __aenter__(self):
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        try:
+            if self._bucket:
+                await self._bucket.acquire()
+        except BaseException:
+            self._semaphore.release()
+            raise
+        self.in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.in_flight -= 1
+        self._semaphore.release()
@@ -0,0 +1,43 @@
+from typing import Optional
+
+from chatbot_backend.config import settings
+
+from .base import LLMProvider
+from .client import LLMClient
+from .limiter import ConcurrencyLimiter
+
+_llm: Optional[LLMClient] = None
+
+
+def create_provider() -> LLMProvider:
+    if settings.LLM_PROVIDER == "stub":
+        from .stub import StubProvider
+
+        return StubProvider(
+            latency_ms=settings.STUB_LLM_LATENCY_MS,
+            chunk_latency_ms=settings.STUB_LLM_CHUNK_LATENCY_MS,
+        )
+    if settings.LLM_PROVIDER == "gemini":
+        from .gemini import GeminiProvider
+
+        return GeminiProvider(settings.GEMINI_API_KEY, settings.LLM_MODEL)
+    raise ValueError(f"Unknown LLM provider: {settings.LLM_PROVIDER}")
+
+
+def get_llm() -> LLMClient:
+    # One client per process, created on first use rather than at import time
+    global _llm
+    if _llm is None:
+        _llm = LLMClient(
+            create_provider(),
+            ConcurrencyLimiter(
+                settings.LLM_MAX_CONCURRENCY,
+                settings.LLM_RATE_LIMIT_PER_SECOND,
+                settings.LLM_RATE_LIMIT_BURST,
+            ),
+            timeout=settings.LLM_TIMEOUT_SECONDS,
+            max_retries=settings.LLM_MAX_RETRIES,
+            retry_base_delay=settings.LLM_RETRY_BASE_DELAY_SECONDS,
+            stream_timeout=settings.LLM_STREAM_TIMEOUT_SECONDS,
+        )
+    return _llm
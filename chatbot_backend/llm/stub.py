@@ -0,0 +1,57 @@
+import asyncio
+import hashlib
+from typing import AsyncIterator, List
+
+from .base import LLMProvider
+
+_WORDS = [
+    "sure",
+    "happy",
+    "to",
+    "help",
+    "with",
+    "that",
+    "please",
+    "share",
+    "a",
+    "few",
+    "more",
+    "details",
+    "about",
+    "your",
+    "account",
+    "and",
+    "the",
+    "issue",
+    "you",
+    "are",
+    "seeing",
+]
+
+
+class StubProvider(LLMProvider):
+    # Deterministic offline provider for load tests: the same prompt always yields the same reply
+    name = "stub"
+
+    def __init__(self, latency_ms: int = 0, chunk_latency_ms: int = 0, reply_words: int = 24):
+        self.latency = latency_ms / 1000
+        self.chunk_latency = chunk_latency_ms / 1000
+        self.reply_words = reply_words
+
+    def _reply(self, prompt: str) -> List[str]:
+        digest = hashlib.sha256(prompt.encode("utf-8")).digest()
+        words = [_WORDS[digest[i % len(digest)] % len(_WORDS)] for i in range(self.reply_words)]
+        return [word if i == 0 else " " + word for i, word in enumerate(words)]
+
+    async def generate(self, prompt: str) -> str:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return "".join(self._reply(prompt))
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        for chunk in self._reply(prompt):
+            if self.chunk_latency:
+                await asyncio.sleep(self.chunk_latency)
+            yield chunk
@@ -1,9 +1,57 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .db.mongodb import connect_to_mongo, close_mongo_connection
-from .api.endpoints import chat
+from .config import settings
+from .db.mongodb import connect_to_mongo, close_mongo_connection, get_database
+from .db.indexes import check_query_plans, ensure_indexes
+from .jobs import generation_queue
+from .crud import crud_conversation
+from .search import message_indexer
+from .api.endpoints import chat, health
+from .api.endpoints.prompts import prompt_registry
+from .warmup import warm_up
+from .shared import shared_state
+from .usage import usage_recorder
+from .api.timing import timing_middleware
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Runs in each worker process: every worker owns its Mongo pool, LLM client, caches and
+    # background tasks. An invalid template file stops the startup here instead of failing
+    # requests later
+    prompt_registry.load()
+    prompt_registry.start()
+    await connect_to_mongo()
+    db = await get_database()
+    await ensure_indexes(db)
+    if settings.MONGO_CHECK_QUERY_PLANS:
+        for name, verdict, stages in await check_query_plans(db):
+            if verdict in ("COLLSCAN", "SORT"):
+                print(f"Query plan warning: {name} uses {verdict} ({' > '.join(stages)})")
+    await warm_up(db)
+    if settings.GENERATION_WORKERS:
+        generation_queue.start(db, chat.run_generation_job)
+    if settings.SEARCH_ENABLED:
+        message_indexer.start(db, crud_conversation)
+    if shared_state.subscribed:
+        shared_state.start(db)
+    usage_recorder.start(db)
+
+    yield
 
-app = FastAPI()
+    # On SIGTERM the server stops accepting connections and lets in-flight requests (streams
+    # included) finish first; queue workers then get the same grace period for running jobs
+    await generation_queue.drain(settings.SHUTDOWN_DRAIN_SECONDS)
+    await message_indexer.stop()
+    await shared_state.stop(db)
+    await usage_recorder.stop(db)
+    await prompt_registry.stop()
+    await close_mongo_connection()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # CORS middleware
 app.add_middleware(
@@ -14,18 +62,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Event handlers
-@app.on_event("startup")
-async def startup_event():
-    await connect_to_mongo()
-
-@app.on_event("shutdown")
-async def shutdown_event():
-    await close_mongo_connection()
+# Request latency histograms and, in debug mode, Server-Timing headers
+app.middleware("http")(timing_middleware)
 
 # Include routers
 app.include_router(chat.router, prefix="/api/v1", tags=["chat"])
+app.include_router(health.router, tags=["health"])
 
 if __name__ == "__main__":
+    # Development server with auto-reload; production runs `python -m chatbot_backend.server`
     import uvicorn
-    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    uvicorn.run("chatbot_backend.main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,151 @@
+import bisect
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+# In-process latency histograms rendered in the Prometheus text format at /metrics, plus the
+# per-request span list behind the Server-Timing header (see api/timing.py).
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# (name, seconds) spans recorded while handling the current request
+_request_spans: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar(
+    "request_spans", default=None
+)
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Tuple[str, ...],
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        # label values -> (per-bucket counts, sum, count)
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *label_values: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, (counts, total, count) in sorted(self._series.items()):
+                labels = ",".join(f'{k}="{v}"' for k, v in zip(self.labels, label_values))
+                prefix = labels + "," if labels else ""
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+                lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {count}')
+                suffix = f"{{{labels}}}" if labels else ""
+                lines.append(f"{self.name}_sum{suffix} {total}")
+                lines.append(f"{self.name}_count{suffix} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.histograms: Dict[str, Histogram] = {}
+        # Called at render time; each returns {metric name: value} gauges
+        self.gauge_collectors: List[Tuple[str, Callable[[], Dict[str, float]]]] = []
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        if name not in self.histograms:
+            self.histograms[name] = Histogram(name, help, labels, buckets)
+        return self.histograms[name]
+
+    def register_gauges(self, prefix: str, collector: Callable[[], Dict[str, float]]):
+        self.gauge_collectors.append((prefix, collector))
+
+    def render(self) -> str:
+        lines = []
+        for histogram in self.histograms.values():
+            lines.extend(histogram.render())
+        for prefix, collector in self.gauge_collectors:
+            for key, value in collector().items():
+                if isinstance(value, (int, float)):
+                    lines.append(f"# TYPE {prefix}_{key} gauge")
+                    lines.append(f"{prefix}_{key} {float(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+request_duration = registry.histogram(
+    "chatbot_request_duration_seconds",
+    "HTTP request latency by route",
+    ("method", "route", "status"),
+)
+stage_duration = registry.histogram(
+    "chatbot_stage_duration_seconds",
+    "Latency of the stages of a request (mongo.*, llm.*, prompt.*, ...)",
+    ("stage",),
+)
+
+
+def start_request_spans() -> List[Tuple[str, float]]:
+    spans: List[Tuple[str, float]] = []
+    _request_spans.set(spans)
+    return spans
+
+
+def observe_stage(stage: str, seconds: float):
+    stage_duration.observe(seconds, stage)
+    spans = _request_spans.get()
+    if spans is not None:
+        spans.append((stage, seconds))
+
+
+@contextmanager
+def span(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+def timed(stage: str):
+    # Decorator for coroutine functions
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with span(stage):
+                return await fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def instrument_crud(cls):
+    # Wraps every coroutine method defined on a CRUD class in a "mongo.<method>" span
+    for name, attribute in list(vars(cls).items()):
+        if isinstance(attribute, staticmethod) and inspect.iscoroutinefunction(attribute.__func__):
+            setattr(cls, name, staticmethod(timed(f"mongo.{name.lstrip('_')}")(attribute.__func__)))
+    return cls
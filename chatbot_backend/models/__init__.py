@@ -1,2 +1,8 @@
-from .conversation import Conversation, Message, MessageVersion
-
+from .conversation import (
+    ArchivedVersion,
+    ContextSummary,
+    Conversation,
+    ConversationSummary,
+    Message,
+    MessageVersion,
+)
@@ -18,6 +18,20 @@ class PyObjectId(ObjectId):
     def __modify_schema__(cls, field_schema):
         field_schema.update(type="string")
 
+
+def _trusted(model, document: dict, **nested):
+    # Builds `model` from a document we wrote ourselves without re-running validation.
+    # Unknown keys (e.g. conversation_id on stored messages) are dropped; missing optional
+    # fields get their defaults.
+    values = {
+        name: document[field.alias]
+        for name, field in model.__fields__.items()
+        if field.alias in document
+    }
+    values.update(nested)
+    return model.construct(**values)
+
+
 class MessageVersion(BaseModel):
     id: str
     content: str
@@ -31,20 +45,92 @@ class Message(BaseModel):
     sender: str
     current_version: str
     versions: List[MessageVersion]
+    # Older versions moved to the archive (crud/archive.py); they still count for numbering
+    archived_versions: int = 0
+
+    class Config:
+        allow_population_by_field_name = True
+        arbitrary_types_allowed = True
+        json_encoders = {ObjectId: str}
+
+    @classmethod
+    def from_db(cls, document: dict) -> "Message":
+        return _trusted(
+            cls,
+            document,
+            versions=[_trusted(MessageVersion, v) for v in document.get("versions", [])],
+        )
+
+
+class ArchivedVersion(BaseModel):
+    # A version moved to the archive tier (crud/archive.py), with the inactive branch under it
+    id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
+    message_id: PyObjectId
+    version: MessageVersion
+    branch: List[Message] = []
+    archived_at: datetime
+
+    class Config:
+        allow_population_by_field_name = True
+        arbitrary_types_allowed = True
+        json_encoders = {ObjectId: str}
+
+
+class ContextSummary(BaseModel):
+    # Number of turns folded into the summary and a digest of their "<message id>:<version>" keys
+    covered_count: int = 0
+    covered_digest: str = ""
+    text: str = ""
+    tokens: int = 0
+
+
+class ConversationSummary(BaseModel):
+    id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
+    title: str
+    created_at: datetime
+    updated_at: datetime
 
     class Config:
         allow_population_by_field_name = True
         arbitrary_types_allowed = True
         json_encoders = {ObjectId: str}
 
+    @classmethod
+    def from_db(cls, document: dict) -> "ConversationSummary":
+        return _trusted(cls, document)
+
+
 class Conversation(BaseModel):
     id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
     title: str
     created_at: datetime
     updated_at: datetime
     messages: List[Message]
+    # Materialized ids of the active branch, root first; None when it needs recomputing
+    active_path: Optional[List[PyObjectId]] = None
+    context_summary: Optional[ContextSummary] = None
+    token_usage: Dict[str, int] = {}
+    # Prompt contexts ("Customer Support", ...) the conversation has been used with
+    contexts: List[str] = []
+    # Incremented by every write to the conversation; used as a version stamp by caches
+    revision: int = 0
 
     class Config:
         allow_population_by_field_name = True
         arbitrary_types_allowed = True
-        json_encoders = {ObjectId: str}
\ No newline at end of file
+        json_encoders = {ObjectId: str}
+
+    @classmethod
+    def from_db(cls, document: dict) -> "Conversation":
+        # Messages may already be models (MessageCollectionCRUD loads them separately)
+        messages = [
+            m if isinstance(m, Message) else Message.from_db(m)
+            for m in document.get("messages", [])
+        ]
+        summary = document.get("context_summary")
+        return _trusted(
+            cls,
+            document,
+            messages=messages,
+            context_summary=_trusted(ContextSummary, summary) if summary is not None else None,
+        )
@@ -1 +1,21 @@
-from .conversation import MessageVersionCreate, MessageCreate, ConversationCreate, MessageVersionOut, MessageOut, ConversationOut, MessageUpdate, ConversationUpdate, CreateResponse, UpdateResponse    
\ No newline at end of file
+from .conversation import (
+    MessageVersionCreate,
+    MessageCreate,
+    ConversationCreate,
+    MessageVersionOut,
+    MessageOut,
+    ConversationOut,
+    MessageUpdate,
+    ConversationUpdate,
+    CreateResponse,
+    UpdateResponse,
+    ConversationSummaryOut,
+    ConversationPage,
+    MessagePage,
+    GenerationJobOut,
+    GenerationJobAccepted,
+    SearchResults,
+    BatchItem,
+    BatchRequest,
+    BatchResponse,
+)
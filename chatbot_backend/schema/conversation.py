@@ -1,22 +1,9 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, root_validator
 from typing import List, Dict, Optional
 from datetime import datetime
 from bson import ObjectId
 
-class PyObjectId(ObjectId):
-    @classmethod
-    def __get_validators__(cls):
-        yield cls.validate
-
-    @classmethod
-    def validate(cls, v):
-        if not ObjectId.is_valid(v):
-            raise ValueError("Invalid ObjectId")
-        return ObjectId(v)
-
-    @classmethod
-    def __modify_schema__(cls, field_schema):
-        field_schema.update(type="string")
+from chatbot_backend.models.conversation import PyObjectId
 
 # Schemas for creating new items
 
@@ -50,6 +37,7 @@ class MessageOut(BaseModel):
     sender: str
     current_version: str
     versions: List[MessageVersionOut]
+    archived_versions: int = 0
 
     class Config:
         orm_mode = True
@@ -70,6 +58,84 @@ class ConversationOut(BaseModel):
         arbitrary_types_allowed = True
         json_encoders = {ObjectId: str}
 
+
+class ConversationSummaryOut(BaseModel):
+    id: PyObjectId = Field(..., alias="_id")
+    title: str
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        orm_mode = True
+        allow_population_by_field_name = True
+        arbitrary_types_allowed = True
+        json_encoders = {ObjectId: str}
+
+
+class ConversationPage(BaseModel):
+    items: List[ConversationSummaryOut]
+    next_cursor: Optional[str] = None
+
+    class Config:
+        json_encoders = {ObjectId: str}
+
+
+class MessagePage(BaseModel):
+    items: List[MessageOut]
+    next_cursor: Optional[str] = None
+
+    class Config:
+        json_encoders = {ObjectId: str}
+
+
+class GenerationJobOut(BaseModel):
+    id: PyObjectId = Field(..., alias="_id")
+    status: str
+    conversation_id: PyObjectId
+    parent_id: PyObjectId
+    priority: int
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    message: Optional[MessageOut] = None
+    error: Optional[str] = None
+
+    class Config:
+        allow_population_by_field_name = True
+        json_encoders = {ObjectId: str}
+
+
+class GenerationJobAccepted(BaseModel):
+    job: GenerationJobOut
+    message: MessageOut
+
+    class Config:
+        json_encoders = {ObjectId: str}
+
+
+class SearchHit(BaseModel):
+    conversation_id: PyObjectId
+    title: str
+    message_id: PyObjectId
+    version_id: str
+    current: bool
+    sender: str
+    content: str
+    created_at: datetime
+    score: float
+
+    class Config:
+        json_encoders = {ObjectId: str}
+
+
+class SearchResults(BaseModel):
+    mode: str
+    items: List[SearchHit]
+
+    class Config:
+        json_encoders = {ObjectId: str}
+
+
 # Schemas for updates
 
 class MessageUpdate(BaseModel):
@@ -85,5 +151,43 @@ class UpdateResponse(BaseModel):
     language: str
     context: str
 
+
+class BatchItem(BaseModel):
+    # An existing conversation, or a new one with this title
+    conversation_id: Optional[str] = None
+    title: Optional[str] = Field(None, min_length=1)
+    messages: List[MessageVersionCreate] = Field(..., min_items=1)
+    language: str
+    context: str
+
+    @root_validator(skip_on_failure=True)
+    def check_target(cls, values):
+        if (values.get("conversation_id") is None) == (values.get("title") is None):
+            raise ValueError("exactly one of conversation_id and title is required")
+        return values
+
+
+class BatchRequest(BaseModel):
+    items: List[BatchItem] = Field(..., min_items=1)
+    concurrency: int = Field(4, ge=1)
+
+
+class BatchItemResult(BaseModel):
+    conversation_id: Optional[PyObjectId] = None
+    status: int
+    messages: List[MessageOut] = []
+    error: Optional[str] = None
+
+    class Config:
+        json_encoders = {ObjectId: str}
+
+
+class BatchResponse(BaseModel):
+    items: List[BatchItemResult]
+
+    class Config:
+        json_encoders = {ObjectId: str}
+
+
 class ConversationUpdate(BaseModel):
-    title: Optional[str] = Field(None, min_length=1)
\ No newline at end of file
+    title: Optional[str] = Field(None, min_length=1)
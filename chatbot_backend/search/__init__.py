@@ -0,0 +1,3 @@
+from .embedding import HashingEmbedder
+from .index import VectorIndex
+from .indexer import MessageIndexer, message_indexer
@@ -0,0 +1,44 @@
+import re
+import zlib
+from typing import Dict, List
+
+try:
+    import numpy as np
+except ImportError:  # optional; semantic search is unavailable without it
+    np = None
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Local, deterministic text embeddings: word unigrams, word bigrams and character trigrams are
+# hashed into `dim` signed buckets and the vector is L2-normalised, so cosine similarity is a dot
+# product. Shared words, phrases and word pieces (typos, inflections) score high without a model
+# download or network call. Anything exposing the same `embed(texts)` can replace it.
+
+
+class HashingEmbedder:
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    def features(self, text: str) -> Dict[int, float]:
+        words = _TOKEN_RE.findall(text.lower())
+        weighted = [(w, 1.0) for w in words]
+        weighted += [(f"{a} {b}", 1.0) for a, b in zip(words, words[1:])]
+        for word in words:
+            padded = f"#{word}#"
+            weighted += [(padded[i : i + 3], 0.5) for i in range(len(padded) - 2)]
+        vector: Dict[int, float] = {}
+        for feature, weight in weighted:
+            h = zlib.crc32(feature.encode("utf-8"))
+            index = h % self.dim
+            vector[index] = vector.get(index, 0.0) + (weight if h & 0x80000000 else -weight)
+        return vector
+
+    def embed(self, texts: List[str]):
+        # (len(texts), dim) float32 matrix of unit vectors (all zeros for text without words)
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for index, value in self.features(text).items():
+                matrix[row, index] = value
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
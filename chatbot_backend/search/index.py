@@ -0,0 +1,150 @@
+import json
+import os
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from bson import ObjectId
+
+from .embedding import np
+
+# In-memory brute-force vector index over message versions, one row per (message, version).
+# Vectors live in one float32 matrix that grows by doubling; a search is a single matrix-vector
+# product plus argpartition, which stays well under 100 ms up to a few hundred thousand versions
+# on one core. Removed rows are masked out and dropped when the index is saved. Snapshots are a
+# single .npz file replaced atomically.
+
+# (conversation id, message id, version id, sender, created_at)
+Row = Tuple[ObjectId, ObjectId, str, str, datetime]
+
+
+def _timestamp(value: datetime) -> float:
+    # Stored datetimes are naive UTC
+    return (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).timestamp()
+
+
+class VectorIndex:
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.size = 0
+        self.vectors = np.zeros((1024, dim), dtype=np.float32)
+        self.created = np.zeros(1024, dtype=np.float64)  # version created_at as a UTC timestamp
+        self.alive = np.zeros(1024, dtype=bool)
+        self.rows: List[Tuple[ObjectId, ObjectId, str, str]] = []
+        # (message id, version id) -> row; message id -> rows; conversation id -> message ids
+        self.positions: Dict[Tuple[ObjectId, str], int] = {}
+        self.by_message: Dict[ObjectId, List[int]] = {}
+        self.by_conversation: Dict[ObjectId, Set[ObjectId]] = {}
+        # Versions created before this were all indexed by the last sync
+        self.watermark: Optional[datetime] = None
+        self.dirty = False
+
+    def __len__(self):
+        return int(self.alive[: self.size].sum())
+
+    def __contains__(self, key: Tuple[ObjectId, str]) -> bool:
+        position = self.positions.get(key)
+        return position is not None and bool(self.alive[position])
+
+    def _grow(self, needed: int):
+        capacity = len(self.created)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        self.vectors = np.resize(self.vectors, (capacity, self.dim))
+        self.created = np.resize(self.created, capacity)
+        self.alive = np.resize(self.alive, capacity)
+        self.alive[self.size :] = False
+
+    def add(self, rows: List[Row], vectors):
+        self._grow(self.size + len(rows))
+        for (conversation_id, message_id, version_id, sender, created_at), vector in zip(
+            rows, vectors
+        ):
+            position = self.positions.get((message_id, version_id))
+            if position is None:
+                position = self.size
+                self.size += 1
+                self.rows.append((conversation_id, message_id, version_id, sender))
+                self.positions[(message_id, version_id)] = position
+                self.by_message.setdefault(message_id, []).append(position)
+                self.by_conversation.setdefault(conversation_id, set()).add(message_id)
+            self.vectors[position] = vector
+            self.created[position] = _timestamp(created_at)
+            self.alive[position] = True
+        self.dirty = True
+
+    def remove_messages(self, message_ids: Iterable[ObjectId]):
+        for message_id in message_ids:
+            for position in self.by_message.get(message_id, ()):
+                self.alive[position] = False
+                self.dirty = True
+
+    def remove_conversation(self, conversation_id: ObjectId):
+        self.remove_messages(self.by_conversation.get(conversation_id, ()))
+
+    def search(
+        self, vector, limit: int, since: Optional[datetime] = None, until: Optional[datetime] = None
+    ) -> List[Tuple[int, float]]:
+        # (row, cosine similarity) for the best `limit` live rows, best first
+        if not self.size:
+            return []
+        mask = self.alive[: self.size].copy()
+        if since is not None:
+            mask &= self.created[: self.size] >= _timestamp(since)
+        if until is not None:
+            mask &= self.created[: self.size] <= _timestamp(until)
+        scores = self.vectors[: self.size] @ vector
+        scores[~mask] = -np.inf
+        limit = min(limit, int(mask.sum()))
+        if limit <= 0:
+            return []
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top]
+
+    def snapshot(self) -> dict:
+        # Copy of the live rows, taken on the event loop so write() can run in a thread
+        live = np.flatnonzero(self.alive[: self.size])
+        meta = {
+            "dim": self.dim,
+            "watermark": self.watermark.isoformat() if self.watermark else None,
+            "rows": [[str(c), str(m), v, s] for c, m, v, s in (self.rows[i] for i in live)],
+        }
+        self.dirty = False
+        return {
+            "vectors": self.vectors[live],
+            "created": self.created[live],
+            "meta": np.array(json.dumps(meta)),
+        }
+
+    @staticmethod
+    def write(path: str, snapshot: dict):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, **snapshot)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str, dim: int) -> "VectorIndex":
+        index = cls(dim)
+        if not os.path.exists(path):
+            return index
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta["dim"] != dim:
+                # Embedding size changed: start over (the next sync re-indexes everything)
+                return index
+            rows = [(ObjectId(c), ObjectId(m), v, s) for c, m, v, s in meta["rows"]]
+            index._grow(len(rows))
+            index.vectors[: len(rows)] = data["vectors"]
+            index.created[: len(rows)] = data["created"]
+        index.alive[: len(rows)] = True
+        index.size = len(rows)
+        index.rows = rows
+        for position, (conversation_id, message_id, version_id, _) in enumerate(rows):
+            index.positions[(message_id, version_id)] = position
+            index.by_message.setdefault(message_id, []).append(position)
+            index.by_conversation.setdefault(conversation_id, set()).add(message_id)
+        index.watermark = datetime.fromisoformat(meta["watermark"]) if meta["watermark"] else None
+        return index
@@ -0,0 +1,141 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from chatbot_backend.config import settings
+from chatbot_backend.metrics import registry
+from chatbot_backend.models import Message
+from .embedding import HashingEmbedder, np
+from .index import VectorIndex
+
+# Keeps the vector index in step with the stored messages. Writes that go through
+# SearchIndexedCRUD (crud/search.py) are embedded as they happen; sync() catches up on every
+# conversation updated since the last sync, which covers other workers, imports and anything
+# written while this process was down. The index is loaded from SEARCH_INDEX_PATH at startup
+# and saved after each sync that changed it. Deletions made elsewhere are dropped when a search
+# finds the message gone.
+
+# Conversations updated shortly before the last sync are checked again, to absorb clock skew
+# between workers
+SYNC_OVERLAP = timedelta(seconds=30)
+
+
+class MessageIndexer:
+    def __init__(self, embedder: HashingEmbedder, path: str, sync_seconds: float):
+        self.embedder = embedder
+        self.path = path
+        self.sync_seconds = sync_seconds
+        self.index: Optional[VectorIndex] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def available(self) -> bool:
+        return self.index is not None
+
+    def load(self) -> bool:
+        if np is None:
+            return False
+        self.index = VectorIndex.load(self.path, self.embedder.dim)
+        return True
+
+    def start(self, db: AsyncIOMotorDatabase, crud):
+        if not self.load():
+            print("Semantic search is disabled: numpy is not installed")
+            return
+        # The first sync of an empty index reads every conversation, so it runs in the background
+        self._task = asyncio.create_task(self._run(db, crud))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.save()
+
+    async def _run(self, db: AsyncIOMotorDatabase, crud):
+        while True:
+            try:
+                await self.sync(db, crud)
+                await self.save()
+            except Exception as exc:
+                print(f"Search index sync failed: {exc}")
+            await asyncio.sleep(self.sync_seconds)
+
+    async def sync(self, db: AsyncIOMotorDatabase, crud) -> int:
+        # Number of versions added
+        started = datetime.utcnow()
+        since = self.index.watermark - SYNC_OVERLAP if self.index.watermark else None
+        added = 0
+        async for conversation in crud.iter_conversations(db, updated_since=since):
+            added += self.add_messages(conversation.id, conversation.messages)
+        self.index.watermark = started
+        return added
+
+    async def save(self):
+        if self.index is None or not self.index.dirty:
+            return
+        snapshot = self.index.snapshot()
+        await asyncio.get_running_loop().run_in_executor(
+            None, VectorIndex.write, self.path, snapshot
+        )
+
+    def add_messages(self, conversation_id: ObjectId, messages: Iterable[Message]) -> int:
+        # Versions never change once written, so only versions not yet indexed are embedded
+        if self.index is None:
+            return 0
+        rows, texts = [], []
+        for message in messages:
+            for version in message.versions:
+                if (message.id, version.id) not in self.index:
+                    rows.append(
+                        (
+                            conversation_id,
+                            message.id,
+                            version.id,
+                            message.sender,
+                            version.created_at,
+                        )
+                    )
+                    texts.append(version.content)
+        if rows:
+            self.index.add(rows, self.embedder.embed(texts))
+        return len(rows)
+
+    def remove_messages(self, message_ids: Iterable[ObjectId]):
+        if self.index is not None:
+            self.index.remove_messages(message_ids)
+
+    def remove_conversation(self, conversation_id: ObjectId):
+        if self.index is not None:
+            self.index.remove_conversation(conversation_id)
+
+    def search(
+        self,
+        text: str,
+        limit: int,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> List[Tuple[ObjectId, ObjectId, str, str, float]]:
+        # (conversation id, message id, version id, sender, score), best first
+        vector = self.embedder.embed([text])[0]
+        return [
+            (*self.index.rows[row], score)
+            for row, score in self.index.search(vector, limit, since, until)
+        ]
+
+    def snapshot(self) -> Dict[str, int]:
+        if self.index is None:
+            return {"versions": 0, "rows": 0}
+        return {"versions": len(self.index), "rows": self.index.size}
+
+
+message_indexer = MessageIndexer(
+    HashingEmbedder(settings.SEARCH_EMBEDDING_DIM),
+    settings.SEARCH_INDEX_PATH,
+    settings.SEARCH_SYNC_SECONDS,
+)
+if settings.SEARCH_ENABLED:
+    registry.register_gauges("chatbot_search_index", message_indexer.snapshot)
@@ -0,0 +1,159 @@
+import argparse
+import asyncio
+import os
+import re
+from datetime import datetime
+from typing import List, Optional
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from chatbot_backend.crud import crud_conversation
+from chatbot_backend.db.mongodb import close_mongo_connection, get_database
+from chatbot_backend.models import Message, MessageVersion
+from .indexer import message_indexer
+
+# Search over every version of every message, behind GET /api/v1/search.
+#
+#   text      MongoDB text index (stemming, stop words, "phrases", -negation); declared in
+#             db/indexes.py when SEARCH_ENABLED is set
+#   semantic  the local vector index (search/indexer.py): similar wording ranks high even
+#             without an exact word match
+#
+# Both return version-level hits with a score; only the order within one mode is meaningful.
+# To rebuild the vector index from scratch (e.g. after changing SEARCH_EMBEDDING_DIM), run:
+#
+#   python -m chatbot_backend.search.service --rebuild
+
+
+def _terms(text: str) -> List[str]:
+    # Query words, cut to a rough stem, to tell which versions of a matched message matched
+    words = [w for w in re.findall(r"-?\w+", text.lower()) if not w.startswith("-")]
+    return [w[: max(3, len(w) - 2)] for w in words]
+
+
+def _in_range(
+    version: MessageVersion, since: Optional[datetime], until: Optional[datetime]
+) -> bool:
+    return (since is None or version.created_at >= since) and (
+        until is None or version.created_at <= until
+    )
+
+
+def _hit(
+    conversation_id: ObjectId, title: str, message: Message, version: MessageVersion, score: float
+) -> dict:
+    return {
+        "conversation_id": conversation_id,
+        "title": title,
+        "message_id": message.id,
+        "version_id": version.id,
+        "current": version.id == message.current_version,
+        "sender": message.sender,
+        "content": version.content,
+        "created_at": version.created_at,
+        "score": score,
+    }
+
+
+async def text_search(
+    db: AsyncIOMotorDatabase,
+    text: str,
+    limit: int,
+    context: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> List[dict]:
+    terms = _terms(text)
+    hits = []
+    for conversation, message, score in await crud_conversation.search_messages(
+        db, text, limit, context, since, until
+    ):
+        for version in message.versions:
+            content = version.content.lower()
+            matched = sum(term in content for term in terms)
+            if matched and _in_range(version, since, until):
+                hits.append(
+                    _hit(
+                        conversation.id,
+                        conversation.title,
+                        message,
+                        version,
+                        score * matched / len(terms),
+                    )
+                )
+    hits.sort(key=lambda hit: hit["score"], reverse=True)
+    return hits[:limit]
+
+
+async def semantic_search(
+    db: AsyncIOMotorDatabase,
+    text: str,
+    limit: int,
+    context: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> List[dict]:
+    # The context lives on the conversation: rank more rows than needed and widen until enough
+    # of them belong to conversations that match
+    fetch = limit * 4
+    while True:
+        ranked = message_indexer.search(text, fetch, since, until)
+        query = {"_id": {"$in": list({row[0] for row in ranked})}}
+        if context:
+            query["contexts"] = context
+        titles = {c["_id"]: c["title"] async for c in db.conversations.find(query, {"title": 1})}
+        if not context:
+            for conversation_id in query["_id"]["$in"]:
+                if conversation_id not in titles:
+                    # Deleted by another worker
+                    message_indexer.remove_conversation(conversation_id)
+        candidates = [row for row in ranked if row[0] in titles]
+        if len(candidates) >= limit or len(ranked) < fetch:
+            break
+        fetch *= 4
+    candidates = candidates[:limit]
+    messages = await crud_conversation.get_messages_by_ids(
+        db, list({row[0] for row in candidates}), list({row[1] for row in candidates})
+    )
+    hits, gone = [], set()
+    for conversation_id, message_id, version_id, _, score in candidates:
+        message = messages.get(message_id)
+        version = (
+            next((v for v in message.versions if v.id == version_id), None) if message else None
+        )
+        if version is None:
+            if message is None:
+                gone.add(message_id)  # deleted by another worker since it was indexed
+            continue
+        hits.append(_hit(conversation_id, titles[conversation_id], message, version, score))
+    message_indexer.remove_messages(gone)
+    return hits
+
+
+async def main(args):
+    try:
+        db = await get_database()
+        if args.rebuild and os.path.exists(message_indexer.path):
+            os.remove(message_indexer.path)
+        if not message_indexer.load():
+            print("numpy is required for the vector index")
+            return
+        added = await message_indexer.sync(db, crud_conversation)
+        await message_indexer.save()
+        print(
+            f"Indexed {added} new message versions"
+            f" ({message_indexer.snapshot()['versions']} in {message_indexer.path})"
+        )
+    finally:
+        await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bring the message vector index up to date")
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="discard the saved index and index every message again",
+    )
+    asyncio.run(main(parser.parse_args()))
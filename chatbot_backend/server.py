@@ -0,0 +1,47 @@
+import argparse
+import os
+
+import uvicorn
+
+from chatbot_backend.config import settings
+
+# Production launch: several worker processes behind one socket, each with its own event loop,
+# Mongo pool and caches (set up by the lifespan in main.py). Workers coordinate through MongoDB
+# (job queue, shared.py). Mongo connections add up across workers: up to
+# workers x MONGO_MAX_POOL_SIZE per host.
+#
+#   python -m chatbot_backend.server [--workers N]
+#
+# On SIGTERM each worker stops accepting connections, lets in-flight requests (including streamed
+# generations) finish for up to SHUTDOWN_DRAIN_SECONDS, then drains its generation jobs.
+
+
+def available_cpus() -> int:
+    # Respects CPU affinity (containers, taskset), unlike os.cpu_count()
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def main(args):
+    uvicorn.run(
+        "chatbot_backend.main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers or settings.WORKERS or available_cpus(),
+        timeout_graceful_shutdown=settings.SHUTDOWN_DRAIN_SECONDS,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the API with one worker process per CPU")
+    parser.add_argument("--host", default=settings.HOST)
+    parser.add_argument("--port", type=int, default=settings.PORT)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="worker processes (default: WORKERS, else one per CPU)",
+    )
+    main(parser.parse_args())
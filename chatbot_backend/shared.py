@@ -0,0 +1,137 @@
+import asyncio
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Set
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from chatbot_backend.config import settings
+from chatbot_backend.metrics import registry
+
+# State shared by the worker processes (and hosts) of one deployment, kept in MongoDB:
+#
+#   events    notify(topic, key) queues a key locally; every SHARED_STATE_POLL_SECONDS each worker
+#             writes its queued keys as one `shared_events` document and hands the keys other
+#             workers wrote to the handlers subscribed to that topic. Used for conversation cache
+#             invalidation, so a stale snapshot lives at most about two poll intervals.
+#   counters  incr() counts in fixed windows across workers (`shared_counters`), e.g. for rate
+#             limits.
+#
+# Both collections expire their documents through TTL indexes (db/indexes.py).
+
+# Events written this long before the last poll are read again, to absorb clock skew between hosts
+POLL_OVERLAP = timedelta(seconds=5)
+
+
+class SharedState:
+    def __init__(self, poll_seconds: float):
+        self.poll_seconds = poll_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._handlers: Dict[str, List[Callable[[List], None]]] = {}
+        self._pending: Dict[str, Set] = {}
+        # Events already handled within the overlap, by id -> time written
+        self._seen: Dict[ObjectId, datetime] = {}
+        self._since: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+        self.stats: Dict[str, int] = {"published": 0, "received": 0, "errors": 0}
+
+    @property
+    def subscribed(self) -> bool:
+        return bool(self._handlers)
+
+    def subscribe(self, topic: str, handler: Callable[[List], None]):
+        self._handlers.setdefault(topic, []).append(handler)
+
+    def notify(self, topic: str, key):
+        self._pending.setdefault(topic, set()).add(key)
+
+    def start(self, db: AsyncIOMotorDatabase):
+        self._since = datetime.utcnow()
+        self._task = asyncio.create_task(self._run(db))
+
+    async def stop(self, db: AsyncIOMotorDatabase):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            # Other workers still need to hear about this worker's last writes
+            await self.flush(db)
+
+    async def _run(self, db: AsyncIOMotorDatabase):
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            try:
+                await self.flush(db)
+                await self.poll(db)
+            except Exception as exc:
+                self.stats["errors"] += 1
+                print(f"Shared state sync failed: {exc}")
+
+    async def flush(self, db: AsyncIOMotorDatabase):
+        pending, self._pending = self._pending, {}
+        documents = [
+            {"topic": topic, "keys": list(keys), "origin": self.worker_id, "at": datetime.utcnow()}
+            for topic, keys in pending.items()
+            if keys
+        ]
+        if not documents:
+            return
+        try:
+            await db.shared_events.insert_many(documents)
+        except Exception:
+            # Sent with the next flush instead
+            for topic, keys in pending.items():
+                self._pending.setdefault(topic, set()).update(keys)
+            raise
+        self.stats["published"] += sum(len(d["keys"]) for d in documents)
+
+    async def poll(self, db: AsyncIOMotorDatabase):
+        started = datetime.utcnow()
+        query = {"at": {"$gte": self._since - POLL_OVERLAP}, "origin": {"$ne": self.worker_id}}
+        async for event in db.shared_events.find(query):
+            if event["_id"] in self._seen:
+                continue
+            self._seen[event["_id"]] = event["at"]
+            self.stats["received"] += len(event["keys"])
+            for handler in self._handlers.get(event["topic"], ()):
+                handler(event["keys"])
+        self._since = started
+        self._seen = {
+            event_id: at for event_id, at in self._seen.items() if at >= started - POLL_OVERLAP
+        }
+
+    async def incr(
+        self, db: AsyncIOMotorDatabase, key: str, window_seconds: float, amount: int = 1
+    ) -> int:
+        # The deployment-wide count for `key` in the current window, after adding `amount`
+        window = int(time.time() // window_seconds)
+        query = {"_id": f"{key}|{window}"}
+        update = {
+            "$inc": {"count": amount},
+            "$setOnInsert": {
+                "expires_at": datetime.utcfromtimestamp((window + 1) * window_seconds)
+            },
+        }
+        try:
+            counter = await db.shared_counters.find_one_and_update(
+                query, update, upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Another worker created the window's counter at the same moment
+            counter = await db.shared_counters.find_one_and_update(
+                query, update, return_document=ReturnDocument.AFTER
+            )
+        return counter["count"]
+
+    def snapshot(self) -> Dict[str, int]:
+        return {**self.stats, "pending": sum(len(keys) for keys in self._pending.values())}
+
+
+shared_state = SharedState(settings.SHARED_STATE_POLL_SECONDS)
+registry.register_gauges("chatbot_shared_state", shared_state.snapshot)
@@ -0,0 +1,83 @@
+import asyncio
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+from chatbot_backend.config import settings
+from chatbot_backend.metrics import registry
+
+# Per-key usage (generations, prompt and completion tokens), counted in memory and written to
+# `api_key_usage` every USAGE_FLUSH_SECONDS as one bulk write of $inc upserts, one document per
+# key and UTC day: {"_id": "<key id>|2024-05-01", "key_id", "name", "day", "requests", ...}.
+# A worker that dies loses at most one interval of counts.
+
+
+class UsageRecorder:
+    def __init__(self, flush_seconds: float):
+        self.flush_seconds = flush_seconds
+        # (key id, key name, day) -> counters
+        self._pending: Dict[Tuple[str, str, str], Dict[str, int]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.stats: Dict[str, int] = {"flushes": 0, "errors": 0}
+
+    def record(self, key_id: str, name: str, prompt_tokens: int, completion_tokens: int):
+        day = datetime.utcnow().strftime("%Y-%m-%d")
+        counters = self._pending.setdefault(
+            (key_id, name, day), {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        )
+        counters["requests"] += 1
+        counters["prompt_tokens"] += prompt_tokens
+        counters["completion_tokens"] += completion_tokens
+
+    def start(self, db: AsyncIOMotorDatabase):
+        self._task = asyncio.create_task(self._run(db))
+
+    async def stop(self, db: AsyncIOMotorDatabase):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush(db)
+
+    async def _run(self, db: AsyncIOMotorDatabase):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            try:
+                await self.flush(db)
+            except Exception as exc:
+                self.stats["errors"] += 1
+                print(f"Usage flush failed: {exc}")
+
+    async def flush(self, db: AsyncIOMotorDatabase):
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        operations = [
+            UpdateOne(
+                {"_id": f"{key_id}|{day}"},
+                {"$inc": counters, "$setOnInsert": {"key_id": key_id, "name": name, "day": day}},
+                upsert=True,
+            )
+            for (key_id, name, day), counters in pending.items()
+        ]
+        try:
+            await db.api_key_usage.bulk_write(operations, ordered=False)
+        except Exception:
+            # Counted again with the next flush
+            for key, counters in pending.items():
+                merged = self._pending.setdefault(
+                    key, {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0}
+                )
+                for field, value in counters.items():
+                    merged[field] += value
+            raise
+        self.stats["flushes"] += 1
+
+    def snapshot(self) -> Dict[str, int]:
+        return {**self.stats, "pending_keys": len(self._pending)}
+
+
+usage_recorder = UsageRecorder(settings.USAGE_FLUSH_SECONDS)
+registry.register_gauges("chatbot_usage", usage_recorder.snapshot)
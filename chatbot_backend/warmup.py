@@ -0,0 +1,50 @@
+import asyncio
+from typing import Dict
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from chatbot_backend.config import settings
+from chatbot_backend.crud import crud_conversation
+from chatbot_backend.llm import get_llm
+from chatbot_backend.metrics import span
+
+# Work done at startup, before the app accepts requests, so the first requests after a deploy or
+# a scale-out don't pay for it: opening MongoDB connections, pulling the hot conversation-list
+# index into the server's cache and setting up the LLM client and its connection. Indexes are
+# created and prompt templates compiled just before (main.py). Each step gets
+# WARMUP_TIMEOUT_SECONDS; a step that fails only leaves that part cold, and is reported by
+# /health/ready. Step durations show up as warmup.* stages in /metrics.
+
+warmup_status: Dict[str, str] = {}
+
+
+async def warm_mongo(db: AsyncIOMotorDatabase):
+    # Concurrent pings each check out a connection, so the pool opens that many
+    await asyncio.gather(
+        *(db.command("ping") for _ in range(max(settings.WARMUP_MONGO_CONNECTIONS, 1)))
+    )
+    await crud_conversation.list_conversations(db, 1, None)
+
+
+async def warm_llm():
+    await get_llm().warm_up()
+
+
+async def _step(name: str, coro) -> str:
+    with span(f"warmup.{name}"):
+        try:
+            await asyncio.wait_for(coro, settings.WARMUP_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            print(f"Warm-up step {name} timed out")
+            return "timeout"
+        except Exception as exc:
+            print(f"Warm-up step {name} failed: {exc}")
+            return "failed"
+    return "ok"
+
+
+async def warm_up(db: AsyncIOMotorDatabase) -> Dict[str, str]:
+    steps = {"mongo": warm_mongo(db), "llm": warm_llm()}
+    results = await asyncio.gather(*(_step(name, coro) for name, coro in steps.items()))
+    warmup_status.update(zip(steps, results))
+    return warmup_status
@@ -0,0 +1,29 @@
+import os
+
+import pytest
+
+# Tests never call a real model
+os.environ.setdefault("LLM_PROVIDER", "stub")
+
+
+@pytest.fixture
+def db():
+    from mongomock_motor import AsyncMongoMockClient
+
+    return AsyncMongoMockClient()["chatbot_test"]
+
+
+@pytest.fixture
+def client(db):
+    # The app in-process against mongomock; the lifespan (Mongo pool, workers) does not run
+    from fastapi.testclient import TestClient
+
+    from chatbot_backend.api.deps import get_db
+    from chatbot_backend.main import app
+
+    async def test_db():
+        yield db
+
+    app.dependency_overrides[get_db] = test_db
+    yield TestClient(app)
+    app.dependency_overrides.clear()
@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from pymongo.errors import DuplicateKeyError
+
+from chatbot_backend.models import Conversation, Message, MessageVersion
+
+BASE_TIME = datetime(2024, 1, 1)
+
+
+def message(
+    parent: Optional[Message] = None,
+    versions: int = 1,
+    current: Optional[str] = None,
+    sender: str = "user",
+    content: str = "hello",
+) -> Message:
+    # A message with `versions` versions, attached to the parent's current version
+    return Message(
+        parent_id=parent.id if parent else None,
+        parent_version=parent.current_version if parent else None,
+        sender=sender,
+        current_version=current or f"v{versions}",
+        versions=[
+            MessageVersion(
+                id=f"v{i}", content=f"{content} {i}", created_at=BASE_TIME + timedelta(minutes=i)
+            )
+            for i in range(1, versions + 1)
+        ],
+    )
+
+
+def conversation(messages: List[Message], revision: int = 0) -> Conversation:
+    return Conversation(
+        title="test",
+        created_at=BASE_TIME,
+        updated_at=BASE_TIME,
+        messages=messages,
+        revision=revision,
+    )
+
+
+class FakeCollection:
+    # The few collection methods the code under test uses, kept in a dict
+    def __init__(self):
+        self.documents: Dict[object, dict] = {}
+
+    async def insert_one(self, document: dict):
+        if document["_id"] in self.documents:
+            raise DuplicateKeyError("duplicate key")
+        self.documents[document["_id"]] = dict(document)
+
+    async def find_one(self, query: dict, projection: Optional[dict] = None):
+        document = self.documents.get(query["_id"])
+        return dict(document) if document is not None else None
+
+    async def update_one(self, query: dict, update: dict):
+        document = self.documents.get(query["_id"])
+        if document is not None:
+            document.update(update.get("$set", {}))
+
+    async def delete_one(self, query: dict):
+        document = self.documents.get(query["_id"])
+        if document is not None and all(document.get(k) == v for k, v in query.items()):
+            del self.documents[query["_id"]]
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.collections: Dict[str, FakeCollection] = {}
+
+    def __getattr__(self, name: str) -> FakeCollection:
+        return self[name]
+
+    def __getitem__(self, name: str) -> FakeCollection:
+        return self.collections.setdefault(name, FakeCollection())
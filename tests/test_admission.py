@@ -0,0 +1,120 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from chatbot_backend.api import admission as admission_module
+from chatbot_backend.api.admission import Admission
+from chatbot_backend.api.keys import ApiKey, KeyStore, hash_key
+from chatbot_backend.config import settings
+from chatbot_backend.llm import limiter
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    # Only the limiter's clock; the event loop keeps the real one
+    monkeypatch.setattr(limiter, "time", SimpleNamespace(monotonic=clock))
+    return clock
+
+
+def key(**limits) -> ApiKey:
+    return ApiKey(id="k", name="k", **limits)
+
+
+def test_rate_limited_key_gets_429_with_retry_after(clock):
+    admission = Admission()
+    limited = key(rate_per_second=0.5, burst=1)
+    asyncio.run(admission.admit(None, limited))
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(admission.admit(None, limited))
+    assert raised.value.status_code == 429
+    assert raised.value.headers["Retry-After"] == "2"
+    assert admission.stats["rate_limited"] == 1
+    clock.now += 2
+    asyncio.run(admission.admit(None, limited))
+
+
+def test_missing_key_is_anonymous_unless_auth_is_required(monkeypatch):
+    admission = Admission()
+    monkeypatch.setattr(settings, "AUTH_ENABLED", False)
+    assert asyncio.run(admission.authenticate(None, None)).id == "anonymous"
+    monkeypatch.setattr(settings, "AUTH_ENABLED", True)
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(admission.authenticate(None, None))
+    assert raised.value.status_code == 401
+
+
+def test_stored_keys_carry_their_limits_and_unknown_keys_are_401(db, monkeypatch):
+    monkeypatch.setattr(settings, "AUTH_ENABLED", False)
+    monkeypatch.setattr(admission_module, "key_store", KeyStore(60))
+    admission = Admission()
+
+    async def scenario():
+        await db.api_keys.insert_one(
+            {"_id": hash_key("secret"), "name": "team", "active": True, "burst": 7}
+        )
+        found = await admission.authenticate(db, "secret")
+        with pytest.raises(HTTPException) as raised:
+            await admission.authenticate(db, "guess")
+        return found, raised.value
+
+    found, error = asyncio.run(scenario())
+    assert (found.name, found.burst) == ("team", 7)
+    assert found.rate_per_second == settings.API_KEY_RATE_PER_SECOND
+    # A wrong key is refused even when keyless callers are let in
+    assert error.status_code == 401 and admission.stats["unauthorized"] == 1
+
+
+def test_generation_slots_queue_then_reject(monkeypatch):
+    monkeypatch.setattr(settings, "API_KEY_QUEUE_SECONDS", 0.05)
+    admission = Admission()
+    limited = key(max_concurrency=1, max_queued=1)
+
+    async def scenario():
+        async with admission.slot(limited):
+            waiter = asyncio.create_task(_enter(admission, limited))
+            await asyncio.sleep(0)
+            # One generation running and one waiting: the next is turned away at once
+            with pytest.raises(HTTPException) as full:
+                await _enter(admission, limited)
+            assert full.value.status_code == 429
+            with pytest.raises(HTTPException):
+                await waiter
+        assert admission.stats["queue_full"] == 1
+        assert admission.stats["queue_timeout"] == 1
+        await _enter(admission, limited)
+        assert admission.snapshot()["in_flight"] == 0
+
+    asyncio.run(scenario())
+
+
+async def _enter(admission: Admission, api_key: ApiKey):
+    async with admission.slot(api_key):
+        pass
+
+
+def test_async_jobs_count_against_the_key(monkeypatch):
+    admission = Admission()
+    unfinished = {"k": 2}
+
+    async def unfinished_for_key(db, key_id):
+        return unfinished[key_id]
+
+    monkeypatch.setattr(admission_module.generation_queue, "unfinished_for_key", unfinished_for_key)
+    asyncio.run(admission.check_jobs(None, key(max_concurrency=1, max_queued=2)))
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(admission.check_jobs(None, key(max_concurrency=1, max_queued=1)))
+    assert raised.value.status_code == 429
+    assert admission.stats["jobs_exceeded"] == 1
+    # No concurrency limit, no job limit
+    asyncio.run(admission.check_jobs(None, key(max_concurrency=0)))
@@ -0,0 +1,70 @@
+from chatbot_backend.crud.archive import (
+    apply_archive,
+    branch_ids,
+    decode_version,
+    encode_version,
+    plan_archive,
+)
+from tests.helpers import message
+
+
+def edited_thread():
+    # A user message edited four times, with a reply under each version and one nested reply
+    root = message(versions=4, current="v4")
+    replies = {}
+    for version in ("v1", "v2", "v3", "v4"):
+        root.current_version = version
+        replies[version] = message(root, sender="ai")
+    nested = message(replies["v1"])
+    root.current_version = "v4"
+    return root, replies, nested
+
+
+def test_plan_keeps_current_and_newest_versions():
+    root, replies, nested = edited_thread()
+    messages = [root, *replies.values(), nested]
+    plan = plan_archive(messages, keep=2)
+    assert len(plan) == 1
+    planned, versions, branches = plan[0]
+    assert planned is root
+    assert [v.id for v in versions] == ["v1", "v2"]
+    assert [m.id for m in branches["v1"]] == [replies["v1"].id, nested.id]
+    assert [m.id for m in branches["v2"]] == [replies["v2"].id]
+    assert branch_ids(plan) == {replies["v1"].id, nested.id, replies["v2"].id}
+
+
+def test_old_current_version_is_kept():
+    root, replies, nested = edited_thread()
+    root.current_version = "v1"
+    _, versions, _ = plan_archive([root, *replies.values(), nested], keep=2)[0]
+    assert [v.id for v in versions] == ["v2", "v3"]
+
+
+def test_messages_inside_archived_branches_are_not_planned_again():
+    root, replies, _ = edited_thread()
+    inner = message(replies["v1"], versions=5)
+    plan = plan_archive([root, *replies.values(), inner], keep=2)
+    assert [entry[0].id for entry in plan] == [root.id]
+    assert (
+        plan_archive([root, *replies.values(), inner], keep=2, message_ids={inner.id})[0][0]
+        is inner
+    )
+    assert plan_archive([root], keep=4) == []
+
+
+def test_apply_archive_trims_snapshot():
+    root, replies, nested = edited_thread()
+    messages = [root, *replies.values(), nested]
+    remaining = apply_archive(messages, plan_archive(messages, keep=2))
+    assert [m.id for m in remaining] == [root.id, replies["v3"].id, replies["v4"].id]
+    assert [v.id for v in root.versions] == ["v3", "v4"]
+    assert root.archived_versions == 2
+
+
+def test_long_content_is_compressed():
+    version = message(content="long " * 100).versions[0]
+    short = encode_version(version, compress_bytes=10_000)
+    compressed = encode_version(version, compress_bytes=100)
+    assert "content" in short and "content_z" not in short
+    assert "content_z" in compressed and "content" not in compressed
+    assert decode_version(compressed) == decode_version(short) == version.dict()
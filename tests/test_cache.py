@@ -0,0 +1,101 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from chatbot_backend.crud import cache as cache_module
+from chatbot_backend.crud.cache import CachedConversationCRUD, ConversationCache, estimate_size
+from chatbot_backend.schema import MessageCreate
+from tests.helpers import FakeDatabase, conversation, message
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(cache_module, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+class Backend:
+    # Stands in for the storage CRUD: conversations come from the fake `conversations` collection
+    def __init__(self):
+        self.reads = 0
+
+    async def get_conversation(self, db, conversation_id):
+        self.reads += 1
+        document = await db.conversations.find_one({"_id": conversation_id})
+        return conversation([], revision=document["revision"]) if document else None
+
+    async def add_message(self, db, conversation_id, new_message, snapshot=None):
+        await db.conversations.update_one(
+            {"_id": conversation_id}, {"$set": {"revision": snapshot.revision + 1}}
+        )
+        snapshot.revision += 1
+        return message()
+
+
+def test_entries_expire_and_evict_oldest(clock):
+    cache = ConversationCache(max_entries=2, max_bytes=10_000_000, ttl_seconds=10)
+    a, b, c = conversation([message()]), conversation([message()]), conversation([message()])
+    cache.put(a)
+    cache.put(b)
+    assert cache.get(a.id) is a
+    cache.put(c)
+    # b was the least recently used
+    assert cache.get(b.id) is None and cache.get(a.id) is a and len(cache) == 2
+    clock.now += 11
+    assert cache.get(a.id) is None
+    assert cache.bytes == estimate_size(c)
+
+
+def test_size_limit(clock):
+    small = conversation([message()])
+    cache = ConversationCache(max_entries=10, max_bytes=estimate_size(small) + 10, ttl_seconds=10)
+    cache.put(conversation([message(content="x" * 1000)]))
+    assert len(cache) == 0
+    cache.put(small)
+    cache.put(conversation([message()]))
+    assert len(cache) == 1 and cache.stats["evictions"] == 1
+
+
+def test_write_through_never_replaces_a_newer_snapshot(clock):
+    cache = ConversationCache(max_entries=10, max_bytes=10_000_000, ttl_seconds=10)
+    loaded = conversation([message()])
+    cache.put(loaded)
+    cache.put(loaded, write_through=True)
+    assert cache.get(loaded.id) is loaded
+    older = conversation([message()])
+    older.id = loaded.id
+    cache.put(older, write_through=True)
+    # A different snapshot may be missing writes: the entry is dropped instead
+    assert cache.get(loaded.id) is None
+
+
+def test_hits_are_checked_against_stored_revision(clock):
+    db, backend = FakeDatabase(), Backend()
+    crud = CachedConversationCRUD(backend, ConversationCache(10, 10_000_000, 60), validate=True)
+    first = conversation([message()], revision=3)
+    asyncio.run(db.conversations.insert_one({"_id": first.id, "revision": 3}))
+    crud.cache.put(first)
+    assert asyncio.run(crud.get_conversation(db, first.id)) is first
+    # Another worker wrote meanwhile
+    asyncio.run(db.conversations.update_one({"_id": first.id}, {"$set": {"revision": 4}}))
+    reloaded = asyncio.run(crud.get_conversation(db, first.id))
+    assert reloaded is not first and reloaded.revision == 4 and backend.reads == 1
+    assert crud.cache.stats == {"hits": 1, "misses": 0, "stale": 1, "evictions": 0}
+
+
+def test_writes_store_the_updated_snapshot(clock):
+    db, backend = FakeDatabase(), Backend()
+    changed = []
+    crud = CachedConversationCRUD(
+        backend, ConversationCache(10, 10_000_000, 60), validate=True, on_change=changed.append
+    )
+    snapshot = conversation([message()])
+    asyncio.run(db.conversations.insert_one({"_id": snapshot.id, "revision": 0}))
+    crud.cache.put(snapshot)
+    asyncio.run(
+        crud.add_message(db, snapshot.id, MessageCreate(sender="user", content="hi"), snapshot)
+    )
+    assert changed == [snapshot.id]
+    assert asyncio.run(crud.get_conversation(db, snapshot.id)) is snapshot and backend.reads == 0
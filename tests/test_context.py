@@ -0,0 +1,67 @@
+from chatbot_backend.context import SUMMARY_HEADER, build_context, count_tokens
+from tests.helpers import message
+
+
+def thread(turns: int, words: int = 20):
+    messages = [message(content="Question 0. " + "word " * words)]
+    for i in range(1, turns):
+        messages.append(
+            message(
+                messages[-1],
+                sender="ai" if i % 2 else "user",
+                content=f"Turn {i}. " + "word " * words,
+            )
+        )
+    return messages
+
+
+def test_count_tokens_splits_words_and_punctuation():
+    assert count_tokens("") == 0
+    assert count_tokens("hi, there!") == 5
+    assert count_tokens("internationalization") == 5
+
+
+def test_whole_history_when_it_fits():
+    messages = thread(4, words=2)
+    window = build_context(messages, 10_000, "system", "next")
+    assert window.history == [
+        f"{'User' if i % 2 == 0 else 'AI'}: {m.versions[-1].content}"
+        for i, m in enumerate(messages)
+    ]
+    assert window.summary is None
+    assert window.prompt_tokens == count_tokens("system") + count_tokens("next") + sum(
+        count_tokens(line) for line in window.history
+    )
+
+
+def test_older_turns_are_summarized_within_budget():
+    messages = thread(40)
+    window = build_context(messages, 400, "system", "next")
+    assert window.history[0].startswith(SUMMARY_HEADER)
+    assert window.history[-1].startswith("AI: Turn 39.")
+    assert window.prompt_tokens <= 400
+    assert window.summary is not None
+    assert window.summary.covered_count == 40 - (len(window.history) - 1)
+
+
+def test_stored_summary_is_extended_not_rebuilt():
+    messages = thread(40)
+    first = build_context(messages[:30], 400, "system", "next")
+    # Same branch: unchanged, so nothing to store
+    assert build_context(messages[:30], 400, "system", "next", first.summary).summary is None
+    grown = build_context(messages, 400, "system", "next", first.summary)
+    assert grown.summary.covered_count > first.summary.covered_count
+    assert grown.summary.covered_digest != first.summary.covered_digest
+
+
+def test_summary_is_rebuilt_when_an_older_turn_changes():
+    messages = thread(40)
+    first = build_context(messages, 400, "system", "next")
+    # Switching the first message to another version changes the branch the summary covered
+    edited = message(versions=2, content="Edited question.")
+    edited.id = messages[0].id
+    messages[0] = edited
+    rebuilt = build_context(messages, 400, "system", "next", first.summary)
+    assert rebuilt.summary is not None
+    assert rebuilt.summary.covered_count == first.summary.covered_count
+    assert rebuilt.summary.covered_digest != first.summary.covered_digest
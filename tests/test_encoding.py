@@ -0,0 +1,59 @@
+import json
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+
+from chatbot_backend import encoding
+from chatbot_backend.api.responses import conversation_out
+from chatbot_backend.models import Conversation, Message
+from chatbot_backend.schema import ConversationOut
+from tests.helpers import conversation, message
+
+CONTENT = {
+    "_id": ObjectId("65a000000000000000000001"),
+    "at": datetime(2024, 5, 1, 12, 30, 15, 123456),
+    "on_the_second": datetime(2024, 5, 1),
+    "text": "naïve “quotes” ✓",
+    "nested": [{"n": 1, "ok": True, "none": None, "ratio": 0.5}],
+}
+
+
+def test_stdlib_fallback_matches_orjson(monkeypatch):
+    pytest.importorskip("orjson")
+    fast = encoding.dumps(CONTENT)
+    monkeypatch.setattr(encoding, "orjson", None)
+    assert encoding.dumps(CONTENT) == fast
+    assert json.loads(fast)["_id"] == "65a000000000000000000001"
+    assert json.loads(fast)["at"] == "2024-05-01T12:30:15.123456"
+
+
+@pytest.mark.parametrize("fast", [True, False])
+def test_unknown_types_are_rejected(monkeypatch, fast):
+    if fast:
+        pytest.importorskip("orjson")
+    else:
+        monkeypatch.setattr(encoding, "orjson", None)
+    with pytest.raises(TypeError):
+        encoding.dumps({"value": object()})
+
+
+def test_trusted_encoding_matches_the_response_model():
+    root = message(versions=2, content="question")
+    reply = message(root, sender="ai", content="answer")
+    root.versions[1].child_messages = {str(reply.id): "v1"}
+    document = conversation([root, reply]).dict(by_alias=True)
+    validated = jsonable_encoder(ConversationOut.from_orm(Conversation(**document)), by_alias=True)
+    trusted = json.loads(encoding.dumps(conversation_out(Conversation.from_db(document))))
+    assert trusted == validated
+
+
+def test_stored_documents_are_read_without_validation():
+    stored = message().dict(by_alias=True)
+    stored["conversation_id"] = ObjectId()
+    del stored["archived_versions"]
+    loaded = Message.from_db(stored)
+    # Storage-only keys are dropped and missing optional fields get their defaults
+    assert not hasattr(loaded, "conversation_id") and loaded.archived_versions == 0
+    assert loaded.versions[0].content == stored["versions"][0]["content"]
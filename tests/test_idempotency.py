@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException, Response
+from fastapi.responses import StreamingResponse
+
+from chatbot_backend.api.idempotency import REPLAYED_HEADER, _fingerprint, idempotent
+from chatbot_backend.schema import CreateResponse, MessageCreate
+from tests.helpers import FakeDatabase
+
+
+def payload(content: str = "hi", language: str = "English") -> CreateResponse:
+    return CreateResponse(
+        message=MessageCreate(sender="user", content=content), language=language, context="Support"
+    )
+
+
+class Producer:
+    def __init__(self, fail: bool = False):
+        self.calls = 0
+        self.fail = fail
+
+    async def __call__(self) -> Response:
+        self.calls += 1
+        if self.fail:
+            raise HTTPException(status_code=502, detail="AI generation failed")
+        return Response(
+            content=f"reply {self.calls}", media_type="application/json", status_code=201
+        )
+
+
+def test_fingerprint_depends_on_payload_only():
+    assert _fingerprint(payload()) == _fingerprint(payload())
+    assert _fingerprint(payload()) != _fingerprint(payload(content="hello"))
+    assert _fingerprint(payload()) != _fingerprint(payload(language="French"))
+
+
+def test_retry_replays_stored_response():
+    db, produce = FakeDatabase(), Producer()
+    first = asyncio.run(idempotent(db, "key", "send", payload(), produce))
+    again = asyncio.run(idempotent(db, "key", "send", payload(), produce))
+    assert produce.calls == 1
+    assert (again.body, again.status_code, again.media_type) == (
+        first.body,
+        201,
+        "application/json",
+    )
+    assert again.headers[REPLAYED_HEADER] == "true"
+    # Keys are scoped, and requests without a key are never recorded
+    asyncio.run(idempotent(db, "key", "edit", payload(), produce))
+    asyncio.run(idempotent(db, "", "send", payload(), produce))
+    assert produce.calls == 3
+
+
+def test_reused_key_with_other_payload_is_422():
+    db, produce = FakeDatabase(), Producer()
+    asyncio.run(idempotent(db, "key", "send", payload(), produce))
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(idempotent(db, "key", "send", payload(content="other"), produce))
+    assert raised.value.status_code == 422
+
+
+def test_retry_during_original_is_409():
+    db = FakeDatabase()
+
+    async def scenario():
+        started, release = asyncio.Event(), asyncio.Event()
+
+        async def slow() -> Response:
+            started.set()
+            await release.wait()
+            return Response(content="done")
+
+        original = asyncio.create_task(idempotent(db, "key", "send", payload(), slow))
+        await started.wait()
+        with pytest.raises(HTTPException) as raised:
+            await idempotent(db, "key", "send", payload(), Producer())
+        release.set()
+        await original
+        return raised.value
+
+    assert asyncio.run(scenario()).status_code == 409
+
+
+def test_failure_releases_key():
+    db = FakeDatabase()
+    with pytest.raises(HTTPException):
+        asyncio.run(idempotent(db, "key", "send", payload(), Producer(fail=True)))
+    produce = Producer()
+    asyncio.run(idempotent(db, "key", "send", payload(), produce))
+    assert produce.calls == 1
+
+
+def test_stream_is_stored_unless_it_ends_with_an_error():
+    db = FakeDatabase()
+
+    def streaming(events):
+        async def produce():
+            async def body():
+                for event in events:
+                    yield event
+
+            return StreamingResponse(body(), media_type="text/event-stream")
+
+        return produce
+
+    async def consume(key, events):
+        response = await idempotent(db, key, "stream", payload(), streaming(events))
+        return "".join([chunk async for chunk in response.body_iterator])
+
+    failed = ["event: message\ndata: {}\n\n", "event: error\ndata: {}\n\n"]
+    assert asyncio.run(consume("a", failed)) == "".join(failed)
+    assert "stream|a" not in db.idempotency_keys.documents
+    ok = ["event: message\ndata: {}\n\n", "event: done\ndata: {}\n\n"]
+    asyncio.run(consume("b", ok))
+    replay = asyncio.run(idempotent(db, "b", "stream", payload(), streaming([])))
+    assert replay.body == "".join(ok).encode("utf-8")
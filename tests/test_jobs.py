@@ -0,0 +1,174 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from chatbot_backend.jobs import (
+    CANCELLED,
+    DONE,
+    FAILED,
+    QUEUED,
+    RUNNING,
+    SAVING,
+    GenerationQueue,
+    QueueUnavailableError,
+)
+
+
+def queue(**options) -> GenerationQueue:
+    settings = {"workers": 1, "max_depth": 10, "lease_seconds": 30, "poll_seconds": 0.01}
+    return GenerationQueue(**{**settings, **options})
+
+
+async def stored(db, job: dict) -> dict:
+    return await db.generation_jobs.find_one({"_id": job["_id"]})
+
+
+def test_claims_highest_priority_then_oldest(db):
+    jobs = queue()
+    jobs._wakeup = asyncio.Event()
+
+    async def scenario():
+        low = await jobs.enqueue(db, {"priority": 0})
+        first = await jobs.enqueue(db, {"priority": 1})
+        second = await jobs.enqueue(db, {"priority": 1})
+        claimed = [await jobs._claim(db) for _ in range(4)]
+        return [low, first, second], claimed
+
+    (low, first, second), claimed = asyncio.run(scenario())
+    assert [job["_id"] for job in claimed[:3]] == [first["_id"], second["_id"], low["_id"]]
+    assert claimed[3] is None
+    assert claimed[0]["status"] == RUNNING and claimed[0]["attempts"] == 1
+    assert claimed[0]["lease_until"] > datetime.utcnow() + timedelta(seconds=25)
+
+
+def test_expired_lease_is_claimed_again_and_only_the_new_holder_saves(db):
+    jobs = queue()
+    jobs._wakeup = asyncio.Event()
+
+    async def scenario():
+        await jobs.enqueue(db, {"priority": 0})
+        old = await jobs._claim(db)
+        await db.generation_jobs.update_one(
+            {"_id": old["_id"]}, {"$set": {"lease_until": datetime.utcnow() - timedelta(seconds=1)}}
+        )
+        new = await jobs._claim(db)
+        return old, new, await jobs.begin_save(db, old), await jobs.begin_save(db, new)
+
+    old, new, old_saved, new_saved = asyncio.run(scenario())
+    assert new["_id"] == old["_id"] and new["attempts"] == 2
+    assert (old_saved, new_saved) == (False, True)
+
+
+def test_abandoned_saving_job_fails_instead_of_running_again(db):
+    jobs = queue()
+    job = {"_id": ObjectId(), "status": SAVING, "attempts": 1, "created_at": datetime.utcnow()}
+    job["lease_until"] = datetime.utcnow() - timedelta(seconds=1)
+
+    async def scenario():
+        await db.generation_jobs.insert_one(job)
+        return await jobs._claim(db), await stored(db, job)
+
+    claimed, failed = asyncio.run(scenario())
+    assert claimed is None
+    assert failed["status"] == FAILED and "finished_at" in failed
+    assert jobs.stats["failed"] == 1
+
+
+def test_heartbeat_renews_the_lease_of_its_own_attempt(db):
+    jobs = queue(lease_seconds=0.03)
+    # MongoDB keeps milliseconds
+    now = datetime.utcnow().replace(microsecond=0)
+    mine = {"_id": ObjectId(), "status": RUNNING, "attempts": 1, "lease_until": now}
+    # Claimed again by someone else: the stale holder must not extend it
+    theirs = {"_id": ObjectId(), "status": RUNNING, "attempts": 2, "lease_until": now}
+
+    async def scenario():
+        await db.generation_jobs.insert_many([dict(mine), dict(theirs)])
+        heartbeats = [
+            asyncio.create_task(jobs._heartbeat(db, mine)),
+            asyncio.create_task(jobs._heartbeat(db, {**theirs, "attempts": 1})),
+        ]
+        await asyncio.sleep(0.05)
+        for task in heartbeats:
+            task.cancel()
+        return await stored(db, mine), await stored(db, theirs)
+
+    renewed, untouched = asyncio.run(scenario())
+    assert renewed["lease_until"] > now
+    assert untouched["lease_until"] == now
+
+
+def test_workers_run_jobs_to_completion(db):
+    jobs = queue()
+
+    async def handler(db, job):
+        if not await jobs.begin_save(db, job):
+            return None
+        return {"reply": job["prompt"].upper()}
+
+    async def scenario():
+        jobs.start(db, handler)
+        job = await jobs.enqueue(db, {"priority": 0, "prompt": "hi", "api_key": {"id": "k"}})
+        finished = await jobs.get(db, job["_id"], wait=1)
+        unfinished = await jobs.unfinished_for_key(db, "k")
+        await jobs.stop()
+        return finished, unfinished
+
+    finished, unfinished = asyncio.run(scenario())
+    assert finished["status"] == DONE and finished["result"] == {"reply": "HI"}
+    assert unfinished == 0 and jobs.stats["completed"] == 1
+
+
+def test_cancelled_job_never_saves(db):
+    jobs = queue()
+    jobs._wakeup = asyncio.Event()
+
+    async def scenario():
+        await jobs.enqueue(db, {"priority": 0})
+        job = await jobs._claim(db)
+        cancelled = await jobs.cancel(db, job["_id"])
+        return cancelled, await jobs.begin_save(db, job), await jobs.cancel(db, job["_id"])
+
+    cancelled, saved, again = asyncio.run(scenario())
+    assert cancelled["status"] == CANCELLED and saved is False
+    assert again["status"] == CANCELLED and jobs.stats["cancelled"] == 1
+
+
+def test_stopping_hands_running_jobs_back(db):
+    jobs = queue()
+
+    async def scenario():
+        running = asyncio.Event()
+
+        async def handler(db, job):
+            running.set()
+            await asyncio.sleep(10)
+
+        jobs.start(db, handler)
+        job = await jobs.enqueue(db, {"priority": 0})
+        await asyncio.wait_for(running.wait(), 1)
+        await jobs.stop()
+        return await stored(db, job)
+
+    job = asyncio.run(scenario())
+    assert job["status"] == QUEUED and "lease_until" not in job
+
+
+def test_full_or_disabled_queue_rejects_before_anything_is_written(db):
+    jobs = queue(max_depth=1)
+
+    async def scenario():
+        with pytest.raises(QueueUnavailableError):
+            await jobs.check_capacity(db)
+        jobs._tasks = [asyncio.create_task(asyncio.sleep(0))]
+        jobs._wakeup = asyncio.Event()
+        await jobs.check_capacity(db)
+        await jobs.enqueue(db, {"priority": 0})
+        with pytest.raises(QueueUnavailableError):
+            await jobs.check_capacity(db)
+        await jobs.stop()
+
+    asyncio.run(scenario())
+    assert jobs.stats["rejected"] == 1
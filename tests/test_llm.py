@@ -0,0 +1,121 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from chatbot_backend.llm import LLMClient, LLMTimeoutError, limiter
+from chatbot_backend.llm.base import LLMProvider
+from chatbot_backend.llm.limiter import ConcurrencyLimiter
+from chatbot_backend.llm.stub import StubProvider
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class Unavailable(Exception):
+    pass
+
+
+class ScriptedProvider(LLMProvider):
+    # Streams `chunks`, `delay` seconds apart, after failing the first `failures` attempts
+    retryable_exceptions = (Unavailable,)
+
+    def __init__(self, chunks, delay: float = 0, failures: int = 0):
+        self.chunks = chunks
+        self.delay = delay
+        self.failures = failures
+        self.attempts = 0
+
+    async def generate(self, prompt: str) -> str:
+        return "".join(self.chunks)
+
+    async def stream(self, prompt: str):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise Unavailable()
+        for chunk in self.chunks:
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            yield chunk
+
+
+def client(provider, **options) -> LLMClient:
+    return LLMClient(provider, ConcurrencyLimiter(1), retry_base_delay=0, **options)
+
+
+def test_bucket_allows_burst_then_refills(monkeypatch):
+    clock = Clock()
+    # Only the limiter's clock; the event loop keeps the real one
+    monkeypatch.setattr(limiter, "time", SimpleNamespace(monotonic=clock))
+    bucket = limiter.TokenBucket(rate=2, capacity=3)
+    assert [bucket.try_acquire() for _ in range(3)] == [0, 0, 0]
+    assert bucket.try_acquire() == pytest.approx(0.5)
+    clock.now += 0.25
+    assert bucket.try_acquire() == pytest.approx(0.25)
+    clock.now += 0.25
+    assert bucket.try_acquire() == 0
+    clock.now += 60
+    assert bucket.tokens == 0
+    bucket.try_acquire()
+    assert bucket.tokens == 2
+
+
+def test_slow_reader_does_not_hold_the_limiter():
+    llm = client(ScriptedProvider(["a", "b", "c"]), timeout=1)
+
+    async def scenario():
+        stream = llm.stream("prompt")
+        first = await stream.__anext__()
+        # The rest of the reply is buffered; another call gets the only slot meanwhile
+        other = await asyncio.wait_for(llm.generate("other"), 1)
+        rest = [chunk async for chunk in stream]
+        return [first, *rest], other
+
+    assert asyncio.run(scenario()) == (["a", "b", "c"], "abc")
+    assert llm.limiter.in_flight == 0
+
+
+def test_stream_has_an_overall_deadline():
+    # Every chunk is well within the per-chunk timeout, but the reply never ends
+    provider = ScriptedProvider(["x"] * 1000, delay=0.01)
+    llm = client(provider, timeout=1, stream_timeout=0.1, max_retries=0)
+
+    async def consume():
+        received = []
+        with pytest.raises(LLMTimeoutError):
+            async for chunk in llm.stream("prompt"):
+                received.append(chunk)
+        return received
+
+    received = asyncio.run(consume())
+    assert 0 < len(received) < 1000
+    assert llm.limiter.in_flight == 0
+
+
+def test_retries_until_the_first_chunk():
+    provider = ScriptedProvider(["a", "b"], failures=2)
+    llm = client(provider, timeout=1, max_retries=2)
+
+    async def consume():
+        return [chunk async for chunk in llm.stream("prompt")]
+
+    assert asyncio.run(consume()) == ["a", "b"]
+    assert provider.attempts == 3
+
+
+def test_closing_the_stream_gives_the_slot_back():
+    llm = client(StubProvider(chunk_latency_ms=5), timeout=1)
+
+    async def scenario():
+        stream = llm.stream("prompt")
+        await stream.__anext__()
+        await stream.aclose()
+        await asyncio.sleep(0.01)
+        return llm.limiter.in_flight
+
+    assert asyncio.run(scenario()) == 0
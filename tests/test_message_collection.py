@@ -0,0 +1,177 @@
+import asyncio
+
+from chatbot_backend.crud.conversation import ConversationCRUD
+from chatbot_backend.crud.message_collection import MessageCollectionCRUD as crud
+from chatbot_backend.db.migrate_messages import migrate
+from chatbot_backend.schema import ConversationCreate, MessageCreate, MessageUpdate
+from tests.helpers import conversation, message
+
+# mongomock has no arrayFilters, so threads with replies are imported rather than sent
+
+
+def thread():
+    root = message(content="question")
+    reply = message(root, sender="ai", content="answer")
+    follow_up = message(reply, content="thanks")
+    return conversation([root, reply, follow_up])
+
+
+def ids(messages):
+    return [m.id for m in messages]
+
+
+def test_messages_live_in_their_own_collection(db):
+    async def scenario():
+        created = await crud.create_conversation(db, ConversationCreate(title="t"))
+        snapshot = await crud.get_conversation(db, created.id)
+        first = await crud.add_message(
+            db, created.id, MessageCreate(sender="user", content="hi"), snapshot
+        )
+        stored = await db.conversations.find_one({"_id": created.id})
+        loaded = await crud.get_conversation(db, created.id)
+        return snapshot, first, stored, loaded, await db.messages.count_documents({})
+
+    snapshot, first, stored, loaded, count = asyncio.run(scenario())
+    assert "messages" not in stored and count == 1
+    assert stored["revision"] > 0 and stored["active_path"] == [first.id]
+    # The snapshot passed in is kept in sync with what was written
+    assert ids(snapshot.messages) == ids(loaded.messages) == [first.id]
+    assert (snapshot.revision, snapshot.active_path) == (stored["revision"], [first.id])
+
+
+def test_message_in_missing_conversation_is_not_kept(db):
+    async def scenario():
+        created = await crud.create_conversation(db, ConversationCreate(title="t"))
+        await crud.delete_conversation(db, created.id)
+        added = await crud.add_message(db, created.id, MessageCreate(sender="user", content="hi"))
+        return added, await db.messages.count_documents({})
+
+    assert asyncio.run(scenario()) == (None, 0)
+
+
+def test_edit_appends_a_version_and_moves_the_revision(db):
+    imported = thread()
+
+    async def scenario():
+        await crud.insert_conversations(db, [imported])
+        first = await crud.update_message(
+            db, imported.id, imported.messages[0].id, MessageUpdate(content="again")
+        )
+        # A stale snapshot still gets the next free number
+        second = await crud.update_message(
+            db, imported.id, imported.messages[0].id, MessageUpdate(content="once more"), imported
+        )
+        return first, second, await crud.get_conversation(db, imported.id)
+
+    first, second, loaded = asyncio.run(scenario())
+    assert (first.current_version, second.current_version) == ("v2", "v3")
+    assert [v.content for v in loaded.messages[0].versions] == ["question 1", "again", "once more"]
+    assert loaded.revision >= 2
+
+
+def test_deleting_a_message_removes_its_subtree(db):
+    imported = thread()
+    other_root = message(content="unrelated")
+    imported.messages.append(other_root)
+
+    async def scenario():
+        await crud.insert_conversations(db, [imported])
+        deleted = await crud.delete_message(db, imported.id, imported.messages[0].id)
+        loaded = await crud.get_conversation(db, imported.id)
+        return deleted, loaded, await crud.get_active_thread(db, imported.id)
+
+    deleted, loaded, active = asyncio.run(scenario())
+    assert deleted and ids(loaded.messages) == ids(active) == [other_root.id]
+
+
+def test_deleting_every_message_deletes_the_conversation(db):
+    imported = thread()
+
+    async def scenario():
+        await crud.insert_conversations(db, [imported])
+        await crud.delete_message(db, imported.id, imported.messages[0].id)
+        return await crud.get_conversation(db, imported.id), await db.messages.count_documents({})
+
+    assert asyncio.run(scenario()) == (None, 0)
+
+
+def test_export_joins_each_conversation_with_its_messages(db):
+    first, second, empty = thread(), thread(), conversation([])
+
+    async def scenario():
+        await crud.insert_conversations(db, [first, second, empty])
+        # Messages whose conversation is gone are skipped
+        await db.conversations.delete_one({"_id": second.id})
+        return [c async for c in crud.iter_conversations(db, batch_size=2)]
+
+    exported = asyncio.run(scenario())
+    assert [c.id for c in exported] == [first.id, empty.id]
+    assert ids(exported[0].messages) == ids(first.messages) and exported[1].messages == []
+
+
+def test_import_skips_existing_conversations_unless_replacing(db):
+    imported = thread()
+
+    async def scenario():
+        await crud.insert_conversations(db, [imported])
+        changed = thread()
+        changed.id = imported.id
+        changed.messages = changed.messages[:1]
+        skipped = await crud.insert_conversations(db, [changed])
+        kept = await crud.get_conversation(db, imported.id)
+        await crud.insert_conversations(db, [changed], replace=True)
+        return skipped, kept, await crud.get_conversation(db, imported.id), changed
+
+    skipped, kept, replaced, changed = asyncio.run(scenario())
+    assert skipped == 0 and ids(kept.messages) == ids(imported.messages)
+    assert ids(replaced.messages) == ids(changed.messages)
+
+
+def test_migration_moves_embedded_messages(db):
+    embedded = thread()
+
+    async def scenario():
+        await ConversationCRUD.insert_conversations(db, [embedded])
+        stats = await migrate(db)
+        again = await migrate(db)
+        return stats, again, await crud.get_conversation(db, embedded.id)
+
+    stats, again, migrated = asyncio.run(scenario())
+    assert stats == {"conversations": 1, "messages": 3}
+    assert again == {"conversations": 0, "messages": 0}
+    assert ids(migrated.messages) == ids(embedded.messages)
+    assert [m.current_version for m in migrated.messages] == ["v1", "v1", "v1"]
+
+
+def test_stale_snapshot_clears_the_stored_path(db):
+    async def scenario():
+        created = await crud.create_conversation(db, ConversationCreate(title="t"))
+        await crud.add_message(db, created.id, MessageCreate(sender="user", content="a"), created)
+        first = await crud.get_conversation(db, created.id)
+        stale = await crud.get_conversation(db, created.id)
+        b = await crud.add_message(db, created.id, MessageCreate(sender="user", content="b"), first)
+        stored = await db.conversations.find_one({"_id": created.id})
+        # Written from a snapshot that doesn't know about b: its path must not be stored
+        c = await crud.add_message(db, created.id, MessageCreate(sender="user", content="c"), stale)
+        cleared = await db.conversations.find_one({"_id": created.id})
+        thread = await crud.get_active_thread(db, created.id)
+        restored = await db.conversations.find_one({"_id": created.id})
+        return b, c, stored, cleared, thread, restored
+
+    b, c, stored, cleared, thread, restored = asyncio.run(scenario())
+    assert stored["active_path"] == [b.id]
+    assert "active_path" not in cleared
+    assert ids(thread) == [c.id] and restored["active_path"] == [c.id]
+
+
+def test_stored_path_to_a_deleted_message_is_recomputed(db):
+    imported = thread()
+
+    async def scenario():
+        await crud.insert_conversations(db, [imported])
+        await db.conversations.update_one(
+            {"_id": imported.id}, {"$set": {"active_path": [imported.messages[0].id, message().id]}}
+        )
+        return await crud.get_active_thread(db, imported.id)
+
+    assert ids(asyncio.run(scenario())) == ids(imported.messages)
@@ -0,0 +1,59 @@
+from chatbot_backend.api.timing import server_timing
+from chatbot_backend.config import settings
+from chatbot_backend.metrics import Histogram, MetricsRegistry, request_duration
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("latency", "help text", ("route",), buckets=(0.1, 1))
+    for value in (0.05, 0.5, 0.5, 3):
+        histogram.observe(value, "/a")
+    assert histogram.render() == [
+        "# HELP latency help text",
+        "# TYPE latency histogram",
+        'latency_bucket{route="/a",le="0.1"} 1',
+        'latency_bucket{route="/a",le="1"} 3',
+        'latency_bucket{route="/a",le="+Inf"} 4',
+        'latency_sum{route="/a"} 4.05',
+        'latency_count{route="/a"} 4',
+    ]
+
+
+def test_registry_renders_numeric_gauges_only():
+    registry = MetricsRegistry()
+    registry.register_gauges("queue", lambda: {"depth": 3, "state": "ok", "ratio": 0.5})
+    assert registry.render() == (
+        "# TYPE queue_depth gauge\nqueue_depth 3.0\n# TYPE queue_ratio gauge\nqueue_ratio 0.5\n"
+    )
+
+
+def test_server_timing_sums_repeated_spans():
+    spans = [("mongo.get", 0.001), ("llm.total", 0.25), ("mongo.get", 0.002)]
+    assert server_timing(spans) == "mongo.get;dur=3.00, llm.total;dur=250.00"
+
+
+def request_count(method: str, route: str, status: str) -> int:
+    series = request_duration._series.get((method, route, status))
+    return series[2] if series else 0
+
+
+def test_requests_are_timed_per_route_template(client, monkeypatch):
+    monkeypatch.setattr(settings, "DEBUG_MODE", True)
+    route = "/api/v1/conversations/{conversation_id}"
+    before = request_count("GET", route, "200"), request_count("GET", "unmatched", "404")
+    conversation_id = client.post("/api/v1/conversations/", json={"title": "t"}).json()["_id"]
+    response = client.get(f"/api/v1/conversations/{conversation_id}")
+    stages = [part.split(";")[0] for part in response.headers["Server-Timing"].split(", ")]
+    assert "mongo.get_conversation" in stages and stages[-1] == "total"
+    assert "request.validation" in stages and "response.serialization" in stages
+    # Unknown paths share one label, whatever their URL
+    client.get("/no/such/path/1")
+    client.get("/no/such/path/2")
+    assert request_count("GET", route, "200") == before[0] + 1
+    assert request_count("GET", "unmatched", "404") == before[1] + 2
+    metrics = client.get("/metrics").text
+    assert f'chatbot_request_duration_seconds_count{{method="GET",route="{route}"' in metrics
+
+
+def test_server_timing_only_in_debug_mode(client, monkeypatch):
+    monkeypatch.setattr(settings, "DEBUG_MODE", False)
+    assert "Server-Timing" not in client.get("/health").headers
@@ -0,0 +1,92 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from chatbot_backend.api.pagination import (
+    decode_conversation_cursor,
+    decode_message_cursor,
+    encode_conversation_cursor,
+)
+from chatbot_backend.crud.message_collection import MessageCollectionCRUD as crud
+from tests.helpers import BASE_TIME, conversation, message
+
+
+def imported(count: int):
+    # Ids in creation order, times in the opposite order, every other pair on the same minute
+    messages = [message(content=f"m{i}") for i in range(count)]
+    for i, m in enumerate(messages):
+        m.versions[0].created_at = BASE_TIME + timedelta(minutes=(count - i) // 2)
+    return conversation(messages)
+
+
+async def all_pages(db, conversation_id, limit: int):
+    pages, after = [], None
+    while True:
+        page = await crud.get_messages_page(db, conversation_id, limit, after)
+        if not page:
+            return pages
+        pages.append([m.id for m in page])
+        after = page[-1].id
+
+
+def test_pages_follow_the_full_message_order(db):
+    thread = imported(7)
+
+    async def scenario():
+        await crud.insert_conversations(db, [thread])
+        loaded = await crud.get_conversation(db, thread.id)
+        return [m.id for m in loaded.messages], await all_pages(db, thread.id, 3)
+
+    full, pages = asyncio.run(scenario())
+    assert full != [m.id for m in thread.messages]
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert sum(pages, []) == full
+
+
+def test_deleted_cursor_message_continues_by_id(db):
+    thread = imported(4)
+
+    async def scenario():
+        await crud.insert_conversations(db, [thread])
+        first = await crud.get_messages_page(db, thread.id, 2)
+        await db.messages.delete_one({"_id": first[-1].id})
+        return await crud.get_messages_page(db, thread.id, 10, first[-1].id)
+
+    rest = asyncio.run(scenario())
+    assert all(m.id > thread.messages[1].id for m in rest)
+
+
+def test_missing_conversation_is_none(db):
+    assert asyncio.run(crud.get_messages_page(db, conversation([]).id, 10)) is None
+
+
+def test_conversation_listing_pages_newest_first(db):
+    conversations = [conversation([]) for _ in range(5)]
+    for i, c in enumerate(conversations):
+        # Two share an updated_at, so the id decides between them
+        c.updated_at = BASE_TIME + timedelta(minutes=min(i, 3))
+
+    async def scenario():
+        await crud.insert_conversations(db, conversations)
+        seen, before = [], None
+        while True:
+            page = await crud.list_conversations(db, 2, before)
+            if not page:
+                return seen
+            seen += [c.id for c in page]
+            before = decode_conversation_cursor(
+                encode_conversation_cursor(page[-1].updated_at, page[-1].id)
+            )
+
+    assert asyncio.run(scenario()) == [c.id for c in reversed(conversations)]
+
+
+@pytest.mark.parametrize("cursor", ["not-base64!", "bm90LWEtY3Vyc29y"])
+def test_malformed_cursors_are_400(cursor):
+    with pytest.raises(HTTPException) as raised:
+        decode_conversation_cursor(cursor)
+    assert raised.value.status_code == 400
+    with pytest.raises(HTTPException):
+        decode_message_cursor(cursor)
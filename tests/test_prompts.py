@@ -0,0 +1,60 @@
+import json
+import os
+
+import pytest
+
+from chatbot_backend.api.endpoints.prompts import (
+    LANGUAGE_SENTENCE,
+    PromptRegistry,
+    TemplateError,
+    UnknownContextError,
+    compile_templates,
+)
+
+DEFAULTS = {"Support": "You are a {helpful} support agent."}
+
+
+def test_language_sentence_is_appended_without_placeholder():
+    compiled = compile_templates({"A": "Be brief.", "B": "Answer in {language}.", "C": None})
+    assert compiled == {"A": "Be brief." + LANGUAGE_SENTENCE, "B": "Answer in {language}."}
+
+
+@pytest.mark.parametrize("template", ["", "   ", 42, "Use {tone}.", "Broken {language", "{0}"])
+def test_invalid_templates_are_rejected(template):
+    with pytest.raises(TemplateError):
+        compile_templates({"A": template})
+
+
+def test_builtin_braces_are_literal():
+    registry = PromptRegistry(DEFAULTS, "", 0, ["English"])
+    assert registry.system_prompt("Support", "French") == (
+        "You are a {helpful} support agent. Generate the response in French language."
+    )
+    with pytest.raises(UnknownContextError):
+        registry.system_prompt("Billing", "English")
+
+
+def test_file_overrides_and_removes_contexts(tmp_path):
+    path = tmp_path / "prompts.json"
+    path.write_text(json.dumps({"Billing": "Billing help in {language}.", "Support": None}))
+    registry = PromptRegistry(DEFAULTS, str(path), 0, ["English"])
+    registry.load()
+    assert registry.contexts == ["Billing"]
+    assert registry.system_prompt("Billing", "English") == "Billing help in English."
+
+
+def test_broken_reload_keeps_current_templates(tmp_path):
+    path = tmp_path / "prompts.json"
+    path.write_text(json.dumps({"Billing": "Billing help in {language}."}))
+    registry = PromptRegistry(DEFAULTS, str(path), 0, ["English"])
+    registry.load()
+    path.write_text(json.dumps({"Billing": "Billing help in {currency}."}))
+    os.utime(path, ns=(0, 1))
+    assert not registry.reload_if_changed()
+    assert registry.system_prompt("Billing", "English") == "Billing help in English."
+    path.write_text(json.dumps({"Billing": "Billing only."}))
+    os.utime(path, ns=(0, 2))
+    assert registry.reload_if_changed()
+    assert registry.system_prompt(
+        "Billing", "English"
+    ) == "Billing only." + LANGUAGE_SENTENCE.format(language="English")
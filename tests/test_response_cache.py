@@ -0,0 +1,102 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from chatbot_backend.api.endpoints import chat
+from chatbot_backend.config import settings
+from chatbot_backend.context import ContextWindow
+from chatbot_backend.db import mongodb
+from chatbot_backend.llm import cache as cache_module
+from chatbot_backend.llm.cache import LRUCache, ResponseCache, cache_key
+from chatbot_backend.schema import CreateResponse, MessageCreate
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(cache_module, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+@pytest.fixture
+def shared_db(db, monkeypatch):
+    # The shared tier reaches MongoDB through the process-wide database
+    async def get_database():
+        return db
+
+    monkeypatch.setattr(mongodb, "get_database", get_database)
+    return db
+
+
+def test_key_ignores_case_spacing_and_trailing_punctuation():
+    key = cache_key("Support", "English", ["User: Hi there"], "How do I reset my password?")
+    assert key == cache_key(
+        "Support", "english", ["user:  hi there."], " how do i reset my password"
+    )
+    assert key != cache_key(
+        "Onboarding", "English", ["User: Hi there"], "How do I reset my password"
+    )
+    assert key != cache_key("Support", "French", ["User: Hi there"], "How do I reset my password")
+    assert key != cache_key("Support", "English", [], "How do I reset my password")
+
+
+def test_lru_evicts_least_recently_used_and_expires(clock):
+    lru = LRUCache(max_entries=2, ttl_seconds=10)
+    lru.set("a", "1")
+    lru.set("b", "2")
+    assert lru.get("a") == "1"
+    lru.set("c", "3")
+    assert lru.get("b") is None and lru.get("a") == "1" and len(lru) == 2
+    clock.now += 11
+    assert lru.get("a") is None and len(lru) == 1
+
+
+def test_shared_tier_serves_other_workers(shared_db):
+    writer, reader = ResponseCache(10, 60, shared=True), ResponseCache(10, 60, shared=True)
+
+    async def scenario():
+        await writer.set("key", "reply")
+        first = await reader.get("key")
+        again = await reader.get("key")
+        # The TTL monitor may not have run yet: expired entries are skipped all the same
+        await shared_db.llm_response_cache.update_one(
+            {"_id": "key"}, {"$set": {"expires_at": datetime.utcnow() - timedelta(seconds=1)}}
+        )
+        expired = await ResponseCache(10, 60, shared=True).get("key")
+        return first, again, expired
+
+    assert asyncio.run(scenario()) == ("reply", "reply", None)
+    assert reader.stats == {"local_hits": 1, "shared_hits": 1, "misses": 0, "stores": 0}
+
+
+def test_repeated_opener_is_generated_once(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_CACHE_ENABLED", True)
+    monkeypatch.setattr(settings, "LLM_CACHE_SHARED", False)
+    monkeypatch.setattr(cache_module, "_cache", None)
+    calls = []
+
+    async def generate_ai_response(history, prompt):
+        calls.append(prompt)
+        return f"reply {len(calls)}"
+
+    monkeypatch.setattr(chat, "generate_ai_response", generate_ai_response)
+    window = ContextWindow(history=[], prompt_tokens=0)
+
+    def turn(content: str, context: str = "Customer Support") -> CreateResponse:
+        return CreateResponse(
+            message=MessageCreate(sender="user", content=content),
+            language="English",
+            context=context,
+        )
+
+    async def scenario():
+        return [
+            await chat.generate_reply(turn("Hello!"), window),
+            await chat.generate_reply(turn("hello"), window),
+            await chat.generate_reply(turn("hello", "Onboarding"), window),
+        ]
+
+    assert asyncio.run(scenario()) == ["reply 1", "reply 1", "reply 2"]
+    assert len(calls) == 2
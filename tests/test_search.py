@@ -0,0 +1,138 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+from bson import ObjectId
+
+from chatbot_backend.crud import storage_crud
+from chatbot_backend.crud.search import SearchIndexedCRUD
+from chatbot_backend.schema import MessageCreate
+from chatbot_backend.search import HashingEmbedder, MessageIndexer, VectorIndex
+from chatbot_backend.search import service
+from tests.helpers import BASE_TIME, conversation, message
+
+np = pytest.importorskip("numpy")  # semantic search is optional
+
+
+@pytest.fixture
+def indexer(tmp_path, monkeypatch):
+    indexer = MessageIndexer(HashingEmbedder(64), str(tmp_path / "vectors.npz"), 60)
+    indexer.load()
+    monkeypatch.setattr(service, "message_indexer", indexer)
+    return indexer
+
+
+def topics():
+    password = message(content="How do I reset my password")
+    billing = message(versions=2, content="Where can I download my invoice")
+    return conversation([password]), conversation([billing])
+
+
+def test_embeddings_are_unit_vectors_that_favour_shared_words():
+    embedder = HashingEmbedder(128)
+    query, close, far, empty = embedder.embed(
+        ["reset password", "resetting my passwords", "invoice download", "?!"]
+    )
+    assert np.isclose(np.linalg.norm(query), 1) and not empty.any()
+    assert query @ close > query @ far
+
+
+def test_index_ranks_filters_and_drops_removed_messages(tmp_path):
+    embedder, index = HashingEmbedder(64), VectorIndex(64)
+    conversation_id, ids = ObjectId(), [ObjectId() for _ in range(3)]
+    texts = ["reset password", "password reset link", "invoice"]
+    rows = [
+        (conversation_id, message_id, "v1", "user", BASE_TIME + timedelta(days=i))
+        for i, message_id in enumerate(ids)
+    ]
+    index.add(rows, embedder.embed(texts))
+    query = embedder.embed(["reset my password"])[0]
+    assert [index.rows[row][1] for row, _ in index.search(query, 2)] == ids[:2]
+    later = index.search(query, 5, since=rows[1][4])
+    assert [index.rows[row][1] for row, _ in later] == ids[1:]
+    index.remove_messages([ids[0]])
+    assert len(index) == 2 and (ids[0], "v1") not in index
+    # Saved without the removed row; a different embedding size starts over
+    VectorIndex.write(str(tmp_path / "index.npz"), index.snapshot())
+    loaded = VectorIndex.load(str(tmp_path / "index.npz"), 64)
+    assert loaded.rows == [(conversation_id, i, "v1", "user") for i in ids[1:]]
+    assert np.array_equal(loaded.vectors[:2], index.vectors[1:3])
+    assert len(VectorIndex.load(str(tmp_path / "index.npz"), 32)) == 0
+
+
+def test_index_grows_past_its_initial_capacity():
+    index, vectors = VectorIndex(4), np.eye(4, dtype=np.float32)
+    rows = [(ObjectId(), ObjectId(), "v1", "user", BASE_TIME) for _ in range(1500)]
+    index.add(rows, [vectors[i % 4] for i in range(1500)])
+    assert len(index) == 1500 and index.search(vectors[1], 3)[0][1] == pytest.approx(1)
+
+
+def test_sync_indexes_each_version_once(db, indexer):
+    password, billing = topics()
+
+    async def scenario():
+        await storage_crud.insert_conversations(db, [password, billing])
+        first = await indexer.sync(db, storage_crud)
+        again = await indexer.sync(db, storage_crud)
+        await indexer.save()
+        return first, again
+
+    assert asyncio.run(scenario()) == (3, 0)
+    reloaded = MessageIndexer(indexer.embedder, indexer.path, 60)
+    assert reloaded.load() and len(reloaded.index) == 3
+
+
+def test_semantic_search_returns_versions_of_live_conversations(db, indexer):
+    password, billing = topics()
+
+    async def scenario():
+        await storage_crud.insert_conversations(db, [password, billing])
+        await indexer.sync(db, storage_crud)
+        hits = await service.semantic_search(db, "download the invoice", 2)
+        # Deleted behind the indexer's back: dropped when a search finds it gone
+        await storage_crud.delete_conversation(db, billing.id)
+        after = await service.semantic_search(db, "download the invoice", 2)
+        return hits, after
+
+    hits, after = asyncio.run(scenario())
+    billing_id = billing.messages[0].id
+    assert {(hit["message_id"], hit["version_id"]) for hit in hits} == {
+        (billing_id, "v1"),
+        (billing_id, "v2"),
+    }
+    assert all(hit["title"] == "test" for hit in hits)
+    assert [hit["current"] for hit in hits] == [hit["version_id"] == "v2" for hit in hits]
+    assert [hit["conversation_id"] for hit in after] == [password.id]
+    assert (billing_id, "v1") not in indexer.index
+
+
+def test_writes_through_the_wrapper_are_indexed(db, indexer):
+    crud = SearchIndexedCRUD(storage_crud, indexer)
+    created, _ = topics()
+
+    async def scenario():
+        await crud.insert_conversations(db, [created])
+        added = await crud.add_message(
+            db, created.id, MessageCreate(sender="user", content="thanks")
+        )
+        indexed = (added.id, "v1") in indexer.index
+        await crud.delete_conversation(db, created.id)
+        return indexed
+
+    assert asyncio.run(scenario())
+    assert len(indexer.index) == 0
+
+
+def test_text_search_keeps_the_versions_that_matched(db, monkeypatch):
+    password, billing = topics()
+    edited = billing.messages[0]
+
+    async def search_messages(db, text, limit, context=None, since=None, until=None):
+        # mongomock has no $text: stand in for the text index with its best match
+        return [(billing, edited, 1.5)]
+
+    monkeypatch.setattr(service.crud_conversation, "search_messages", search_messages)
+    hits = asyncio.run(service.text_search(db, "invoices", 10))
+    assert [hit["version_id"] for hit in hits] == ["v1", "v2"]
+    assert hits[0]["score"] == 1.5 and hits[1]["current"]
+    assert asyncio.run(service.text_search(db, "invoices", 10, until=BASE_TIME)) == []
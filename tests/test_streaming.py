@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+from chatbot_backend.api.endpoints import chat
+from chatbot_backend.llm import LLMError, LLMTimeoutError
+
+TURN = {
+    "message": {"sender": "user", "content": "hi"},
+    "language": "English",
+    "context": "Customer Support",
+}
+
+
+def events(body: str):
+    # (event, data) pairs of a Server-Sent Events body
+    pairs = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.split("\n"))
+        pairs.append((fields["event"], json.loads(fields["data"])))
+    return pairs
+
+
+def failing_stream(exc: Exception, chunks=()):
+    def stream(history, prompt):
+        async def body():
+            for chunk in chunks:
+                yield chunk
+            raise exc
+
+        return body()
+
+    return stream
+
+
+@pytest.mark.parametrize(
+    "exc, detail",
+    [
+        (LLMError("quota exceeded for key sk-secret"), "AI generation failed"),
+        (RuntimeError("connection to 10.0.0.7 refused"), "AI generation failed"),
+        (LLMTimeoutError("AI provider timed out"), "AI provider timed out"),
+    ],
+)
+def test_provider_error_ends_the_stream_with_a_generic_event(client, monkeypatch, exc, detail):
+    monkeypatch.setattr(chat, "stream_ai_response", failing_stream(exc, ["Sure", " thing"]))
+    conversation_id = client.post("/api/v1/conversations/", json={"title": "t"}).json()["_id"]
+    response = client.post(f"/api/v1/conversations/{conversation_id}/messages/stream", json=TURN)
+    assert response.status_code == 200
+    received = events(response.text)
+    assert [event for event, _ in received] == ["message", "delta", "delta", "error"]
+    assert received[0][1]["versions"][0]["content"] == "hi"
+    assert received[-1][1] == {"detail": detail}
+    assert "secret" not in response.text and "10.0.0.7" not in response.text
+    # The user message is kept, and no partial reply is saved
+    stored = client.get(f"/api/v1/conversations/{conversation_id}").json()["messages"]
+    assert [m["sender"] for m in stored] == ["user"]
+
+
+def test_error_before_the_first_chunk(client, monkeypatch):
+    monkeypatch.setattr(chat, "stream_ai_response", failing_stream(LLMError("down")))
+    conversation_id = client.post("/api/v1/conversations/", json={"title": "t"}).json()["_id"]
+    response = client.post(f"/api/v1/conversations/{conversation_id}/messages/stream", json=TURN)
+    assert [event for event, _ in events(response.text)] == ["message", "error"]
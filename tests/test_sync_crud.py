@@ -0,0 +1,62 @@
+import asyncio
+import threading
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from chatbot_backend.crud import storage_crud
+from chatbot_backend.crud.sync import SyncConversationCRUD
+from chatbot_backend.schema import ConversationCreate, MessageCreate
+
+
+@pytest.fixture
+def sync_crud():
+    # The database is opened on the facade's own loop, as the Motor client would be
+    with SyncConversationCRUD(storage_crud, lambda: AsyncMongoMockClient()["chatbot_test"]) as crud:
+        yield crud
+
+
+def in_thread(work):
+    # Runs work() in a plain thread, as a script or batch worker would
+    results = []
+    thread = threading.Thread(target=lambda: results.append(work()))
+    thread.start()
+    thread.join()
+    return results[0]
+
+
+def test_blocking_calls_from_a_plain_thread(sync_crud):
+    def work():
+        created = sync_crud.create_conversation(ConversationCreate(title="t"))
+        first = sync_crud.add_message(created.id, MessageCreate(sender="user", content="a"))
+        futures = [
+            sync_crud.submit("add_message", created.id, MessageCreate(sender="user", content=c))
+            for c in "bc"
+        ]
+        added = [first] + [future.result() for future in futures]
+        loaded = sync_crud.get_conversation(created.id)
+        listed = [c.id for c in sync_crud.iter_conversations(batch_size=1)]
+        return created, added, loaded, listed
+
+    created, added, loaded, listed = in_thread(work)
+    assert sorted(m.id for m in loaded.messages) == sorted(m.id for m in added)
+    assert listed == [created.id]
+
+
+def test_stopping_iteration_early_closes_the_cursor(sync_crud):
+    def work():
+        for title in "ab":
+            sync_crud.create_conversation(ConversationCreate(title=title))
+        for conversation in sync_crud.iter_conversations(batch_size=1):
+            break
+        return sync_crud.get_conversation(conversation.id).title
+
+    assert in_thread(work) == "a"
+
+
+def test_blocking_call_inside_a_coroutine_is_refused(sync_crud):
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            sync_crud.get_conversation(None)
+
+    asyncio.run(scenario())
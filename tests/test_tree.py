@@ -0,0 +1,73 @@
+from chatbot_backend.crud.tree import (
+    ancestor_path,
+    build_children_index,
+    collect_descendants,
+    current_content,
+    resolve_active_path,
+)
+from tests.helpers import message
+
+
+def test_active_path_follows_newest_child_of_current_version():
+    root = message()
+    old_reply = message(root, sender="ai")
+    new_reply = message(root, sender="ai")
+    follow_up = message(new_reply)
+    path = resolve_active_path([root, old_reply, new_reply, follow_up])
+    assert [m.id for m in path] == [root.id, new_reply.id, follow_up.id]
+
+
+def test_active_path_ignores_replies_to_other_versions():
+    root = message(versions=2, current="v1")
+    reply_to_v1 = message(root, sender="ai")
+    root.current_version = "v2"
+    reply_to_v2 = message(root, sender="ai")
+    root.current_version = "v1"
+    assert [m.id for m in resolve_active_path([root, reply_to_v1, reply_to_v2])] == [
+        root.id,
+        reply_to_v1.id,
+    ]
+    root.current_version = "v2"
+    assert [m.id for m in resolve_active_path([root, reply_to_v1, reply_to_v2])] == [
+        root.id,
+        reply_to_v2.id,
+    ]
+
+
+def test_active_path_starts_at_newest_root():
+    first, second = message(), message()
+    assert [m.id for m in resolve_active_path([first, second])] == [second.id]
+    assert resolve_active_path([]) == []
+
+
+def test_long_thread_does_not_recurse():
+    messages = [message()]
+    for _ in range(5000):
+        messages.append(message(messages[-1]))
+    assert len(resolve_active_path(messages)) == 5001
+    assert len(collect_descendants(build_children_index(messages), messages[0].id)) == 5000
+    assert ancestor_path(messages, messages[-1].id) == messages[:-1]
+
+
+def test_collect_descendants_covers_every_branch():
+    root = message()
+    a, b = message(root), message(root)
+    a_child = message(a)
+    unrelated = message()
+    children = build_children_index([root, a, b, a_child, unrelated])
+    assert collect_descendants(children, root.id) == {a.id, b.id, a_child.id}
+    assert collect_descendants(children, b.id) == set()
+
+
+def test_ancestor_path_stops_at_cycles():
+    a = message()
+    b = message(a)
+    a.parent_id = b.id
+    assert [m.id for m in ancestor_path([a, b], b.id)] == [a.id]
+
+
+def test_current_content_falls_back_to_latest_version():
+    m = message(versions=3, current="v2")
+    assert current_content(m) == "hello 2"
+    m.current_version = "v9"
+    assert current_content(m) == "hello 3"
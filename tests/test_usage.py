@@ -0,0 +1,65 @@
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from chatbot_backend.usage import UsageRecorder
+
+
+class FailingCollection:
+    async def bulk_write(self, operations, ordered=True):
+        raise ConnectionError("primary stepped down")
+
+
+def today(key_id: str) -> str:
+    return f"{key_id}|{datetime.utcnow():%Y-%m-%d}"
+
+
+def test_counts_are_batched_into_one_document_per_key_and_day(db):
+    recorder = UsageRecorder(60)
+
+    async def scenario():
+        recorder.record("a", "team a", 10, 5)
+        recorder.record("a", "team a", 20, 7)
+        recorder.record("b", "team b", 1, 1)
+        await recorder.flush(db)
+        recorder.record("a", "team a", 3, 3)
+        await recorder.flush(db)
+        # Nothing pending: no write at all
+        await recorder.flush(db)
+        return await db.api_key_usage.find_one({"_id": today("a")})
+
+    stored = asyncio.run(scenario())
+    assert stored["name"] == "team a" and stored["key_id"] == "a"
+    assert (stored["requests"], stored["prompt_tokens"], stored["completion_tokens"]) == (3, 33, 15)
+    assert recorder.snapshot() == {"flushes": 2, "errors": 0, "pending_keys": 0}
+
+
+def test_failed_flush_keeps_the_counts_for_the_next_one(db):
+    recorder = UsageRecorder(60)
+    down = SimpleNamespace(api_key_usage=FailingCollection())
+
+    async def scenario():
+        recorder.record("a", "team a", 10, 5)
+        with pytest.raises(ConnectionError):
+            await recorder.flush(down)
+        # Added to the counts that were put back
+        recorder.record("a", "team a", 1, 1)
+        await recorder.flush(db)
+        return await db.api_key_usage.find_one({"_id": today("a")})
+
+    stored = asyncio.run(scenario())
+    assert (stored["requests"], stored["prompt_tokens"], stored["completion_tokens"]) == (2, 11, 6)
+
+
+def test_stopping_flushes_what_is_pending(db):
+    recorder = UsageRecorder(60)
+
+    async def scenario():
+        recorder.start(db)
+        recorder.record("a", "team a", 4, 2)
+        await recorder.stop(db)
+        return await db.api_key_usage.count_documents({})
+
+    assert asyncio.run(scenario()) == 1